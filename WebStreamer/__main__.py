@@ -16,8 +16,13 @@ from pyrogram import idle
 from WebStreamer import StreamBot
 from WebStreamer.server import web_server
 from WebStreamer.bot.clients import initialize_clients
+from WebStreamer.utils import startup
 from WebStreamer.utils.keepalive import ping_server
-from WebStreamer.utils.cloudreve import login_and_cache_cloudreve_token
+from WebStreamer.utils.health import health_monitor
+from WebStreamer.utils.bin_index import bin_index
+from WebStreamer.utils.media_index import media_index
+from WebStreamer.utils.cluster import close_session as close_cluster_session
+from WebStreamer.utils.cloudreve import login_and_cache_cloudreve_token, close_cloudreve_client
 
 
 logging.basicConfig(
@@ -38,35 +43,50 @@ loop = asyncio.get_event_loop()
 
 
 async def start_services():
+    # Bind the port first so links answer with 503 Retry-After instead of failing while bots log in
+    await server.setup()
+    await web.TCPSite(server, Var.BIND_ADDRESS, Var.PORT).start()
+    startup.mark("HTTP server listening")
+    logging.info("URL =>> {}".format(Var.URL))
+
     logging.info("Initializing Telegram Bot")
     await StreamBot.start()
     bot_info = await StreamBot.get_me()
     logging.debug(bot_info)
 
     StreamBot.username = bot_info.username
+    startup.mark("Main bot logged in")
     logging.info("Initialized Telegram Bot")
+    if bin_index.needs_rebuild():
+        asyncio.create_task(bin_index.rebuild(StreamBot, Var.BIN_CHANNEL))
+    logging.info("bot =>> {}".format(bot_info.first_name))
+    if bot_info.dc_id:
+        logging.info("DC ID =>> {}".format(str(bot_info.dc_id)))
 
     await initialize_clients()
+    startup.mark("All clients initialized")
     if Var.KEEP_ALIVE:
         asyncio.create_task(ping_server())
+    if Var.HEALTH_CHECK_INTERVAL > 0:
+        asyncio.create_task(health_monitor())
 
-    await server.setup()
-    await web.TCPSite(server, Var.BIND_ADDRESS, Var.PORT).start()
     logging.info("Service Started")
-    logging.info("bot =>> {}".format(bot_info.first_name))
-
-    if bot_info.dc_id:
-        logging.info("DC ID =>> {}".format(str(bot_info.dc_id)))
-    logging.info("URL =>> {}".format(Var.URL))
+    logging.info("Startup timeline: {}".format(startup.summary()))
 
-    await login_and_cache_cloudreve_token()
-    logging.info("Cloudreve token cached")
+    if Var.USE_CLOUDEREVE:
+        # the client refreshes the token in the background from now on
+        await login_and_cache_cloudreve_token()
+        logging.info("Cloudreve token cached")
 
     await idle()
     
         
 async def cleanup():
     await server.cleanup()
+    await close_cluster_session()
+    await close_cloudreve_client()
+    if media_index.enabled:
+        media_index.flush_last_used()
     await StreamBot.stop()
 
 if __name__ == "__main__":
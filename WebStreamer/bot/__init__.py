@@ -31,3 +31,5 @@ StreamBot = Client(
 
 multi_clients = {}
 work_loads = {}
+# clients that take no new streams and are stopped once their work load drops to zero
+draining = set()
@@ -6,10 +6,48 @@ import logging
 from os import environ
 from ..vars import Var
 from pyrogram import Client
-from . import multi_clients, work_loads, sessions_dir, StreamBot
+from ..utils import startup, health
+from . import multi_clients, work_loads, draining, sessions_dir, StreamBot
 
 logger = logging.getLogger("multi_client")
 
+# bot tokens of the running additional clients, used to refuse adding the same bot twice
+client_tokens = {}
+# highest client id handed out so far; ids of removed clients are never reused
+last_client_id = 0
+# removals running in the background; asyncio only keeps weak references to tasks
+drain_tasks = set()
+
+
+async def start_client(client_id, token, session_name=None):
+    global last_client_id
+    last_client_id = max(last_client_id, client_id)
+    try:
+        logger.info(f"Starting - Client {client_id}")
+        client_tokens[client_id] = token
+        client = await Client(
+            name=session_name or str(client_id),
+            api_id=Var.API_ID,
+            api_hash=Var.API_HASH,
+            bot_token=token,
+            sleep_threshold=Var.SLEEP_THRESHOLD,
+            workdir=sessions_dir if Var.USE_SESSION_FILE else Client.PARENT_DIR,
+            no_updates=True,
+            in_memory=not Var.USE_SESSION_FILE,
+        ).start()
+        # Register right away so the client takes traffic without waiting for the others
+        work_loads[client_id] = 0
+        multi_clients[client_id] = client
+        if not Var.MULTI_CLIENT:
+            Var.MULTI_CLIENT = True
+            logger.info("Multi-client mode enabled")
+        startup.mark(f"Client {client_id} ready")
+        return client
+    except Exception:
+        client_tokens.pop(client_id, None)
+        logger.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
+
+
 async def initialize_clients():
     multi_clients[0] = StreamBot
     work_loads[0] = 0
@@ -25,31 +63,81 @@ async def initialize_clients():
         logger.info("No additional clients found, using default client")
         return
     
-    async def start_client(client_id, token):
-        try:
-            logger.info(f"Starting - Client {client_id}")
-            if client_id == len(all_tokens):
-                await asyncio.sleep(2)
-                print("This will take some time, please wait...")
-            client = await Client(
-                name=str(client_id),
-                api_id=Var.API_ID,
-                api_hash=Var.API_HASH,
-                bot_token=token,
-                sleep_threshold=Var.SLEEP_THRESHOLD,
-                workdir=sessions_dir if Var.USE_SESSION_FILE else Client.PARENT_DIR,
-                no_updates=True,
-                in_memory=not Var.USE_SESSION_FILE,
-            ).start()
-            work_loads[client_id] = 0
-            return client_id, client
-        except Exception:
-            logger.error(f"Failed starting Client - {client_id} Error:", exc_info=True)
-    
-    clients = await asyncio.gather(*[start_client(i, token) for i, token in all_tokens.items()])
-    multi_clients.update(dict(clients))
-    if len(multi_clients) != 1:
-        Var.MULTI_CLIENT = True
-        logger.info("Multi-client mode enabled")
-    else:
-        logger.info("No additional clients were initialized, using default client")
\ No newline at end of file
+    await asyncio.gather(*[start_client(i, token) for i, token in all_tokens.items()])
+    if len(multi_clients) == 1:
+        logger.info("No additional clients were initialized, using default client")
+
+
+async def add_client(token: str) -> int:
+    """
+    Starts a new client for the given bot token at runtime and adds it to the pool.
+    Returns the new client id, raises ValueError if the bot is already running
+    and RuntimeError if it couldn't be started.
+    """
+    token = token.strip()
+    if token == Var.BOT_TOKEN or token in client_tokens.values():
+        raise ValueError("This bot is already running")
+    client_id = last_client_id + 1
+    # the session file is named after the bot itself, so an authorized session of
+    # another bot that once had this id can't be picked up instead of the token
+    client = await start_client(client_id, token, session_name=f"bot_{token.split(':', 1)[0]}")
+    if client is None:
+        raise RuntimeError(f"Failed starting client {client_id}, see logs for details")
+    logger.info(f"Added Client {client_id} at runtime")
+    return client_id
+
+
+def _start_draining(client_id: int) -> Client:
+    if client_id == 0:
+        raise ValueError("The main bot can't be removed")
+    client = multi_clients.get(client_id)
+    if client is None:
+        raise KeyError(f"Client {client_id} not found")
+    if client_id in draining:
+        raise RuntimeError(f"Client {client_id} is already being removed")
+    draining.add(client_id)
+    return client
+
+
+async def remove_client(client_id: int, timeout: int = 600) -> None:
+    """
+    Drains a client (no new streams, existing ones keep going) and stops it
+    once its work load reaches zero or the timeout runs out.
+    """
+    await _drain(client_id, _start_draining(client_id), timeout)
+
+
+def schedule_removal(client_id: int, timeout: int = 600) -> asyncio.Task:
+    """
+    Runs remove_client in the background. The client is checked and marked as draining
+    before this returns, so a second removal of the same client is refused right away.
+    """
+    task = asyncio.create_task(_drain(client_id, _start_draining(client_id), timeout))
+    drain_tasks.add(task)
+    task.add_done_callback(drain_tasks.discard)
+    return task
+
+
+async def _drain(client_id: int, client: Client, timeout: int) -> None:
+    from ..utils.custom_dl import forget_streamer
+    logger.info(f"Draining Client {client_id} ({work_loads.get(client_id, 0)} active streams)")
+    waited = 0
+    while work_loads.get(client_id, 0) > 0 and waited < timeout:
+        await asyncio.sleep(1)
+        waited += 1
+    if work_loads.get(client_id, 0) > 0:
+        logger.warning(f"Client {client_id} still has {work_loads[client_id]} streams after {timeout}s, stopping anyway")
+    multi_clients.pop(client_id, None)
+    work_loads.pop(client_id, None)
+    client_tokens.pop(client_id, None)
+    forget_streamer(client)
+    health.forget_client(client_id)
+    try:
+        await client.stop()
+    except Exception:
+        logger.error(f"Error while stopping Client {client_id}", exc_info=True)
+    finally:
+        draining.discard(client_id)
+    if len(multi_clients) == 1:
+        Var.MULTI_CLIENT = False
+    logger.info(f"Removed Client {client_id}")
@@ -0,0 +1,84 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+from pyrogram import filters
+from pyrogram.types import Message
+
+from WebStreamer.vars import Var
+from WebStreamer.bot import StreamBot, multi_clients, work_loads, draining, logger
+from WebStreamer.bot.clients import add_client, schedule_removal
+from WebStreamer.utils.outbox import outbox, REPLY
+
+
+def is_owner(m: Message) -> bool:
+    user = m.from_user
+    return bool(Var.OWNER_ID) and user is not None and (
+        (str(user.id) in Var.OWNER_ID) or (user.username in Var.OWNER_ID)
+    )
+
+
+@StreamBot.on_message(filters.command("bots") & filters.private)
+async def list_bots_handler(_, m: Message):
+    if not is_owner(m):
+        return
+    lines = []
+    for index, client in sorted(multi_clients.items()):
+        name = getattr(getattr(client, "me", None), "username", None) or "-"
+        state = "排空中" if index in draining else "运行中"
+        lines.append(f"<code>{index}</code> @{name} 负载:{work_loads.get(index, 0)} {state}")
+    outbox.reply(m, "\n".join(lines) or "没有运行中的客户端。", quote=True)
+
+
+@StreamBot.on_message(filters.command("addbot") & filters.private)
+async def add_bot_handler(_, m: Message):
+    if not is_owner(m):
+        return
+    if len(m.command) < 2:
+        return outbox.reply(m, "用法：/addbot <机器人令牌>", quote=True)
+    token = m.command[1]
+    # 令牌不应留在聊天记录中
+    try:
+        await m.delete()
+    except Exception:
+        pass
+    status = await outbox.call(m.chat.id, StreamBot.send_message, m.chat.id, "正在启动新的客户端...")
+    try:
+        client_id = await add_client(token)
+    except (ValueError, RuntimeError) as e:
+        return outbox.edit_text(status, f"添加失败：{e}", priority=REPLY)
+    logger.info(f"Client {client_id} added by {m.from_user.id}")
+    outbox.edit_text(status, f"已添加客户端 <code>{client_id}</code>，当前共 {len(multi_clients)} 个客户端。", priority=REPLY)
+
+
+@StreamBot.on_message(filters.command("delbot") & filters.private)
+async def remove_bot_handler(_, m: Message):
+    if not is_owner(m):
+        return
+    if len(m.command) < 2 or not m.command[1].isdigit():
+        return outbox.reply(m, "用法：/delbot <客户端编号> [超时秒数]", quote=True)
+    client_id = int(m.command[1])
+    timeout = int(m.command[2]) if len(m.command) > 2 and m.command[2].isdigit() else 600
+    if client_id == 0:
+        return outbox.reply(m, "不能移除主机器人。", quote=True)
+    if client_id not in multi_clients:
+        return outbox.reply(m, "没有找到这个客户端。", quote=True)
+    if client_id in draining:
+        return outbox.reply(m, "这个客户端正在移除中。", quote=True)
+    load = work_loads.get(client_id, 0)
+    # 排空可能持续较久，不占用处理消息的 worker；先标记为排空中，重复的 /delbot 会被拒绝
+    task = schedule_removal(client_id, timeout)
+    status = await outbox.reply(
+        m,
+        f"客户端 <code>{client_id}</code> 已停止接收新的请求，等待 {load} 个进行中的传输结束...",
+        quote=True,
+    )
+
+    def drained(task):
+        if task.cancelled():
+            return
+        if task.exception() is not None:
+            outbox.edit_text(status, f"移除失败：{task.exception()}", priority=REPLY)
+        else:
+            outbox.edit_text(status, f"客户端 <code>{client_id}</code> 已移除。", priority=REPLY)
+
+    task.add_done_callback(drained)
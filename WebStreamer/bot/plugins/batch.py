@@ -0,0 +1,177 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import io
+import re
+import json
+import time
+import asyncio
+from typing import Dict, List, Tuple, Union
+from pyrogram import filters, errors
+from pyrogram.types import Message
+
+from WebStreamer.vars import Var
+from WebStreamer.bot import StreamBot, logger
+from WebStreamer.utils.bin_index import bin_index
+from WebStreamer.utils.file_properties import get_hash, get_name, get_media_from_message, build_links
+from WebStreamer.bot.plugins.stream import lookup_bin_message, send_to_bin_parsing_message
+from WebStreamer.utils.outbox import outbox, REPLY
+
+# 单次 get_messages 拉取的消息数
+FETCH_CHUNK_SIZE = 100
+# 进度消息的最小编辑间隔（秒）
+PROGRESS_INTERVAL = 3
+OUTPUT_FORMATS = ("txt", "json", "m3u")
+
+LINK_PATTERN = re.compile(r"https?://t\.me/(c/)?([^/\s]+)/(\d+)(?:-(\d+))?")
+
+
+def parse_batch_args(text: str) -> Tuple[List[Tuple[Union[int, str], int, int]], str]:
+    """
+    解析 /batch 参数，返回 [(chat, 起始id, 结束id)] 与输出格式。
+    支持多个链接，以及 `https://t.me/xxx/10-60` 形式的消息区间。
+    """
+    fmt = "txt"
+    words = text.split()
+    if words and words[-1].lower() in OUTPUT_FORMATS:
+        fmt = words[-1].lower()
+    specs = []
+    for private, chat, first, last in LINK_PATTERN.findall(text):
+        chat_id = int(f"-100{chat}") if private and chat.isdigit() else chat
+        first, last = int(first), int(last or first)
+        if last < first:
+            first, last = last, first
+        specs.append((chat_id, first, last))
+    return specs, fmt
+
+
+async def call_with_flood_wait(func, *args, **kwargs):
+    """对超过 SLEEP_THRESHOLD 的 FloodWait 等待后重试"""
+    while True:
+        try:
+            return await func(*args, **kwargs)
+        except errors.FloodWait as e:
+            logger.warning(f"Batch hit a flood wait of {e.value}s")
+            await asyncio.sleep(e.value)
+
+
+async def collect_messages(specs) -> List[Message]:
+    messages: List[Message] = []
+    for chat_id, first, last in specs:
+        if first == last:
+            msg = await call_with_flood_wait(StreamBot.get_messages, chat_id, first)
+            # 单条链接指向相册时展开整个媒体组
+            if msg and not msg.empty and msg.media_group_id:
+                messages.extend(await call_with_flood_wait(StreamBot.get_media_group, chat_id, first))
+            elif msg and not msg.empty:
+                messages.append(msg)
+            continue
+        ids = list(range(first, last + 1))
+        for i in range(0, len(ids), FETCH_CHUNK_SIZE):
+            chunk = await call_with_flood_wait(StreamBot.get_messages, chat_id, ids[i:i + FETCH_CHUNK_SIZE])
+            messages.extend(msg for msg in chunk if msg and not msg.empty)
+    # 去掉重复与非媒体消息，保持原有顺序
+    seen = set()
+    result = []
+    for msg in messages:
+        key = (msg.chat.id if msg.chat else None, msg.id)
+        if msg.media and key not in seen:
+            seen.add(key)
+            result.append(msg)
+    return result
+
+
+def render_links(entries: List[Dict], fmt: str) -> Tuple[bytes, str]:
+    if fmt == "json":
+        return json.dumps(entries, ensure_ascii=False, indent=2).encode("UTF-8"), "links.json"
+    if fmt == "m3u":
+        lines = ["#EXTM3U"]
+        for entry in entries:
+            lines.append(f"#EXTINF:-1,{entry['name']}")
+            lines.append(entry["stream_link"])
+        return ("\n".join(lines) + "\n").encode("UTF-8"), "links.m3u"
+    return ("\n".join(entry["stream_link"] for entry in entries) + "\n").encode("UTF-8"), "links.txt"
+
+
+@StreamBot.on_message(filters.command("batch") & filters.private)
+async def batch_command_handler(_, m: Message):
+    if Var.ALLOWED_USERS and not ((str(m.from_user.id) in Var.ALLOWED_USERS) or (m.from_user.username in Var.ALLOWED_USERS)):
+        return outbox.reply(m, "你<b>没有权限</b>使用这个机器人。", quote=True)
+
+    text = m.text or ""
+    if m.reply_to_message:
+        text += " " + (m.reply_to_message.text or m.reply_to_message.caption or "")
+    specs, fmt = parse_batch_args(text)
+    if not specs:
+        return outbox.reply(
+            m,
+            "用法：/batch <链接> [<链接> ...] [txt|json|m3u]\n"
+            "支持 <code>https://t.me/频道/10-60</code> 形式的消息区间，指向相册的单条链接会展开整个相册。",
+            quote=True,
+        )
+    total_ids = sum(last - first + 1 for _, first, last in specs)
+    if total_ids > Var.BATCH_MAX:
+        return outbox.reply(m, f"一次最多处理 {Var.BATCH_MAX} 条消息。", quote=True)
+
+    status = await outbox.reply(m, "正在获取消息...", quote=True)
+    try:
+        messages = await collect_messages(specs)
+    except (errors.ChannelPrivate, errors.ChannelInvalid, errors.UsernameInvalid, errors.UsernameNotOccupied):
+        return outbox.edit_text(status, "无法访问该频道，请确认机器人已加入。", priority=REPLY)
+    if not messages:
+        return outbox.edit_text(status, "没有找到任何文件。", priority=REPLY)
+
+    total = len(messages)
+    results: List[Union[Dict, None]] = [None] * total
+    done = 0
+    failed = 0
+    last_report = time.monotonic()
+    semaphore = asyncio.Semaphore(Var.BATCH_CONCURRENCY)
+
+    async def process(i: int, msg: Message):
+        nonlocal done, failed, last_report
+        async with semaphore:
+            try:
+                log_msg_id = lookup_bin_message(msg)
+                if not log_msg_id:
+                    log_msg = await call_with_flood_wait(send_to_bin_parsing_message, msg)
+                    log_msg_id = log_msg.id
+                    bin_index.add_message(log_msg)
+                media = get_media_from_message(msg)
+                name = get_name(msg)
+                short_link, stream_link = build_links(get_hash(msg, Var.HASH_LENGTH), log_msg_id, name)
+                results[i] = {
+                    "name": name,
+                    "size": getattr(media, "file_size", 0),
+                    "message_id": log_msg_id,
+                    "short_link": short_link,
+                    "stream_link": stream_link,
+                }
+            except Exception as e:
+                failed += 1
+                logger.error(f"Batch item {msg.id} failed: {e}")
+            done += 1
+            if time.monotonic() - last_report >= PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                outbox.edit_text(status, f"正在生成直链：{done}/{total}")
+
+    await asyncio.gather(*[process(i, msg) for i, msg in enumerate(messages)])
+
+    entries = [entry for entry in results if entry]
+    if not entries:
+        return outbox.edit_text(status, "所有文件都处理失败了。", priority=REPLY)
+    data, file_name = render_links(entries, fmt)
+    document = io.BytesIO(data)
+    document.name = file_name
+    await outbox.call(
+        m.chat.id,
+        m.reply_document,
+        document,
+        file_name=file_name,
+        caption=f"共 {len(entries)} 个直链" + (f"，{failed} 个失败" if failed else ""),
+        quote=True,
+    )
+    try:
+        await status.delete()
+    except errors.RPCError:
+        pass
@@ -0,0 +1,46 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import html
+from pyrogram.types import InlineQuery, InlineQueryResultArticle, InputTextMessageContent
+
+from WebStreamer.vars import Var
+from WebStreamer.bot import StreamBot
+from WebStreamer.utils.bin_index import bin_index
+from WebStreamer.utils.file_properties import get_hash, build_links, readable_size
+
+# Telegram 单次最多返回 50 条内联结果
+INLINE_PAGE_SIZE = 20
+
+
+def can_search(user) -> bool:
+    # 搜索会列出 BIN_CHANNEL 中所有人的文件，只对明确列出的用户开放
+    allowed = Var.ALLOWED_USERS + Var.OWNER_ID
+    return user is not None and ((str(user.id) in allowed) or (user.username in allowed))
+
+
+@StreamBot.on_inline_query()
+async def inline_search_handler(_, q: InlineQuery):
+    query = q.query.strip()
+    # 以 / 开头的是按钮预填的命令（如 /rdl），留给用户直接发送
+    if not query or query.startswith("/") or not can_search(q.from_user):
+        return await q.answer([], cache_time=5, is_personal=True)
+    offset = int(q.offset or 0)
+    total, rows = bin_index.search(query, INLINE_PAGE_SIZE, offset)
+    results = []
+    for row in rows:
+        name = row["file_name"] or row["unique_id"]
+        short_link, stream_link = build_links(get_hash(row["unique_id"], Var.HASH_LENGTH), row["message_id"], name)
+        results.append(
+            InlineQueryResultArticle(
+                title=name,
+                description=f"{readable_size(row['file_size'])} · {row['mime_type'] or '未知类型'}",
+                input_message_content=InputTextMessageContent(
+                    f"<b>{html.escape(name)}</b>\n\n直链：{stream_link}\n短链：{short_link}",
+                    disable_web_page_preview=True,
+                ),
+                id=str(row["message_id"]),
+            )
+        )
+    next_offset = str(offset + len(rows)) if offset + len(rows) < total else ""
+    await q.answer(results, cache_time=30, is_personal=True, next_offset=next_offset)
@@ -8,13 +8,25 @@ Description:
 # Coding : Jyothis Jayanth [@EverythingSuckz]
 
 import re
+import html
+import time
 import asyncio
+import itertools
+from collections import OrderedDict
+from urllib.parse import unquote
 from pyrogram import filters, errors
 from WebStreamer.vars import Var
-from urllib.parse import quote_plus
 from WebStreamer.bot import StreamBot, logger
-from WebStreamer.utils.file_properties import get_hash, get_name
-from WebStreamer.utils.cloudreve import file_list, remote_download, remote_list, refresh_cloudreve_token, search_download_by_url
+from WebStreamer.utils.bin_index import bin_index
+from WebStreamer.utils.uploader import stream_reupload
+from WebStreamer.utils.custom_dl import schedule_warm_up
+from WebStreamer.utils.cloudreve_tier import cloudreve_tier, parse_stream_link
+from WebStreamer.utils.cloudreve_upload import push_file
+from WebStreamer.utils.file_properties import get_hash, get_name, get_media_from_message, build_links, readable_size
+from WebStreamer.utils.cloudreve import refresh_cloudreve_token
+from WebStreamer.utils.cloudreve_tasks import task_poller, submit_queue
+from WebStreamer.utils.cloudreve_files import file_browser
+from WebStreamer.utils.outbox import outbox, REPLY, BIN, PROGRESS
 from pyrogram.enums.parse_mode import ParseMode
 from pyrogram.types import Message, InlineKeyboardMarkup, InlineKeyboardButton, CallbackQuery
 from pyrogram.enums import MessageEntityType
@@ -25,13 +37,6 @@ pyrogram.utils.MIN_CHANNEL_ID = -1009999999999999
 # 缓存消息对应的直链，键为机器人回复消息的 id
 STREAM_LINK_CACHE = {}
 
-# 公共函数：生成短链与直链
-
-
-def build_links(file_hash: str, msg_id: int, display_name: str):
-    short_link = f"{Var.URL}{file_hash}{msg_id}"
-    stream_link = f"{Var.URL}{msg_id}/{quote_plus(display_name)}?hash={file_hash}"
-    return short_link, stream_link
 # 提取URL的公共函数
 
 
@@ -54,13 +59,45 @@ def extract_url_from_message(msg: Message):
     # 正则兜底
     m = re.search(r"https?://\S+", text)
     return m.group(0).strip() if m else None
+
+
+# 提取消息中的全部URL（去重并保持顺序），用于批量提交
+
+
+def extract_urls_from_message(msg: Message):
+    if not msg:
+        return []
+    text = (getattr(msg, "text", None) or getattr(
+        msg, "caption", None) or "").strip()
+    urls = []
+    entities = (getattr(msg, "entities", None) or []) + \
+        (getattr(msg, "caption_entities", None) or [])
+    for ent in entities:
+        if ent.type == MessageEntityType.TEXT_LINK and getattr(ent, "url", None):
+            urls.append(ent.url.strip())
+        elif ent.type == MessageEntityType.URL:
+            urls.append(text[ent.offset: ent.offset + ent.length].strip())
+    if not urls:
+        urls = re.findall(r"https?://\S+", text)
+    return list(dict.fromkeys(u for u in urls if u))
+# 公共函数：按 file_unique_id 查找 BIN_CHANNEL 中已有的消息
+
+
+def lookup_bin_message(msg: Message):
+    if not Var.DEDUP_UPLOADS or not msg or not msg.media:
+        return None
+    media = get_media_from_message(msg)
+    unique_id = getattr(media, "file_unique_id", None)
+    return bin_index.lookup(unique_id) if unique_id else None
 # 公共函数：统一回复消息并缓存直链
 
 
 async def reply_with_stream_links(target_msg: Message, stream_link: str, short_link: str, show_code_link: str = "stream"):
     try:
         text_link = stream_link if show_code_link == "stream" else short_link
-        sent = await target_msg.reply_text(
+        sent = await outbox.call(
+            target_msg.chat.id,
+            target_msg.reply_text,
             text="单击下面的链接可直接复制：\n<code>{}</code>".format(text_link),
             quote=True,
             parse_mode=ParseMode.HTML,
@@ -77,7 +114,9 @@ async def reply_with_stream_links(target_msg: Message, stream_link: str, short_l
         STREAM_LINK_CACHE[sent.id] = stream_link
         return sent
     except errors.ButtonUrlInvalid:
-        sent = await target_msg.reply_text(
+        sent = await outbox.call(
+            target_msg.chat.id,
+            target_msg.reply_text,
             text="<code>{}</code>\n\n短链: {}".format(stream_link, short_link),
             quote=True,
             parse_mode=ParseMode.HTML,
@@ -88,21 +127,30 @@ async def reply_with_stream_links(target_msg: Message, stream_link: str, short_l
 # 新增：解析消息并将其复制/重发到 BIN_CHANNEL（绕过频道转发限制）
 
 
+def to_bin(func, *args, **kwargs):
+    # 发往 BIN_CHANNEL 的消息经发送队列排队，优先级低于给用户的回复
+    return outbox.call(Var.BIN_CHANNEL, func, *args, priority=BIN, **kwargs)
+
+
 async def send_to_bin_parsing_message(msg: Message) -> Message:
     # 1) 先尝试复制消息（copyMessage 会保留内容但不带“转发自”）
     try:
-        return await StreamBot.copy_message(
+        return await to_bin(
+            StreamBot.copy_message,
             chat_id=Var.BIN_CHANNEL,
             from_chat_id=msg.chat.id,
             message_id=msg.id,
         )
+    except errors.FloodWait:
+        raise
     except Exception:
         pass
 
     # 2) 根据具体类型使用 file_id 重新发送（保留 caption 与按钮）
     try:
         if msg.document:
-            return await StreamBot.send_document(
+            return await to_bin(
+                StreamBot.send_document,
                 Var.BIN_CHANNEL,
                 msg.document.file_id,
                 caption=(msg.caption or ""),
@@ -110,7 +158,8 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.video:
-            return await StreamBot.send_video(
+            return await to_bin(
+                StreamBot.send_video,
                 Var.BIN_CHANNEL,
                 msg.video.file_id,
                 caption=(msg.caption or ""),
@@ -118,7 +167,8 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.audio:
-            return await StreamBot.send_audio(
+            return await to_bin(
+                StreamBot.send_audio,
                 Var.BIN_CHANNEL,
                 msg.audio.file_id,
                 caption=(msg.caption or ""),
@@ -126,7 +176,8 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.animation:
-            return await StreamBot.send_animation(
+            return await to_bin(
+                StreamBot.send_animation,
                 Var.BIN_CHANNEL,
                 msg.animation.file_id,
                 caption=(msg.caption or ""),
@@ -134,7 +185,8 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.voice:
-            return await StreamBot.send_voice(
+            return await to_bin(
+                StreamBot.send_voice,
                 Var.BIN_CHANNEL,
                 msg.voice.file_id,
                 caption=(msg.caption or ""),
@@ -142,12 +194,14 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.video_note:
-            return await StreamBot.send_video_note(
+            return await to_bin(
+                StreamBot.send_video_note,
                 Var.BIN_CHANNEL,
                 msg.video_note.file_id,
             )
         if msg.photo:
-            return await StreamBot.send_photo(
+            return await to_bin(
+                StreamBot.send_photo,
                 Var.BIN_CHANNEL,
                 msg.photo.file_id,
                 caption=(msg.caption or ""),
@@ -155,86 +209,37 @@ async def send_to_bin_parsing_message(msg: Message) -> Message:
                 reply_markup=msg.reply_markup,
             )
         if msg.sticker:
-            return await StreamBot.send_sticker(
+            return await to_bin(
+                StreamBot.send_sticker,
                 Var.BIN_CHANNEL,
                 msg.sticker.file_id,
             )
         # 纯文本兜底
-        return await StreamBot.send_message(
+        return await to_bin(
+            StreamBot.send_message,
             Var.BIN_CHANNEL,
             (msg.text or msg.caption or ""),
             entities=msg.entities,
             reply_markup=msg.reply_markup,
         )
+    except errors.FloodWait:
+        raise
     except errors.RPCError:
-        # 3) 如果以上都失败，最后尝试下载并重新上传（可能较慢）
-        try:
-            path = await msg.download()
-            if msg.document:
-                return await StreamBot.send_document(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.video:
-                return await StreamBot.send_video(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.audio:
-                return await StreamBot.send_audio(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.animation:
-                return await StreamBot.send_animation(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.voice:
-                return await StreamBot.send_voice(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.photo:
-                return await StreamBot.send_photo(
-                    Var.BIN_CHANNEL,
-                    path,
-                    caption=(msg.caption or ""),
-                    caption_entities=msg.caption_entities,
-                    reply_markup=msg.reply_markup,
-                )
-            if msg.video_note:
-                return await StreamBot.send_video_note(Var.BIN_CHANNEL, path)
-            if msg.sticker:
-                return await StreamBot.send_sticker(Var.BIN_CHANNEL, path)
-            return await StreamBot.send_message(
-                Var.BIN_CHANNEL,
-                (msg.text or msg.caption or ""),
-                entities=msg.entities,
-                reply_markup=msg.reply_markup,
-            )
-        except Exception as e:
-            raise e
+        # 3) 如果以上都失败，最后边下载边上传（不落盘，内存占用有上限）
+        if msg.media:
+            return await stream_reupload(msg, Var.BIN_CHANNEL)
+        return await to_bin(
+            StreamBot.send_message,
+            Var.BIN_CHANNEL,
+            (msg.text or msg.caption or ""),
+            entities=msg.entities,
+            reply_markup=msg.reply_markup,
+        )
 
 # 处理消息链接，通过TG消息链接获取文件直链
 
 
-@StreamBot.on_message(filters.private & filters.text & filters.regex(r"https?://t\.me/"))
+@StreamBot.on_message(filters.private & filters.text & filters.regex(r"https?://t\.me/") & ~filters.regex(r"^/"))
 async def link_receive_handler(_, m: Message):
     link = m.text
     # 修复误改的正则表达式，保持原始逻辑
@@ -245,21 +250,28 @@ async def link_receive_handler(_, m: Message):
     channel_username, message_id = match.groups()
     try:
         message = await StreamBot.get_messages(channel_username, int(message_id))
-        # 替换：不再直接转发，改为解析并重发到 BIN_CHANNEL
-        log_msg = await send_to_bin_parsing_message(message)
+        # 已存在于 BIN_CHANNEL 的文件直接复用，不再重复发送
+        log_msg_id = lookup_bin_message(message)
+        if not log_msg_id:
+            # 替换：不再直接转发，改为解析并重发到 BIN_CHANNEL
+            log_msg = await send_to_bin_parsing_message(message)
+            log_msg_id = log_msg.id
+            bin_index.add_message(log_msg)
     except errors.ChannelPrivate:
-        return await m.reply("这个频道是私有的，我不能访问它。", quote=True)
+        return outbox.reply(m, "这个频道是私有的，我不能访问它。", quote=True)
     except errors.ChannelInvalid:
-        return await m.reply("这个频道不存在。", quote=True)
+        return outbox.reply(m, "这个频道不存在。", quote=True)
     except errors.MessageIdInvalid:
-        return await m.reply("这个消息不存在。", quote=True)
+        return outbox.reply(m, "这个消息不存在。", quote=True)
     if not message.media:
-        return await m.reply("这个消息不是文件。", quote=True)
+        return outbox.reply(m, "这个消息不是文件。", quote=True)
     file_hash = get_hash(message, Var.HASH_LENGTH)
     short_link, stream_link = build_links(
-        file_hash, log_msg.id, get_name(message))
+        file_hash, log_msg_id, get_name(message))
     logger.info(f"直链： {short_link} for {m.from_user.first_name}")
     await reply_with_stream_links(m, stream_link, short_link, show_code_link="short")
+    # 用户通常会马上点开链接，提前准备好文件信息和开头的分片
+    schedule_warm_up(log_msg_id, file_hash)
 
 # 处理消息中的文件（文档、视频、音频等）
 
@@ -280,72 +292,69 @@ async def link_receive_handler(_, m: Message):
 )
 async def media_receive_handler(_, m: Message):
     if Var.ALLOWED_USERS and not ((str(m.from_user.id) in Var.ALLOWED_USERS) or (m.from_user.username in Var.ALLOWED_USERS)):
-        return await m.reply("你<b>没有权限</b>使用这个机器人。", quote=True)
-    log_msg = await m.forward(chat_id=Var.BIN_CHANNEL)
-    file_hash = get_hash(log_msg, Var.HASH_LENGTH)
-    short_link, stream_link = build_links(file_hash, log_msg.id, get_name(m))
+        return outbox.reply(m, "你<b>没有权限</b>使用这个机器人。", quote=True)
+    log_msg_id = lookup_bin_message(m)
+    if not log_msg_id:
+        log_msg = await to_bin(m.forward, chat_id=Var.BIN_CHANNEL)
+        log_msg_id = log_msg.id
+        bin_index.add_message(log_msg)
+    file_hash = get_hash(m, Var.HASH_LENGTH)
+    short_link, stream_link = build_links(file_hash, log_msg_id, get_name(m))
     logger.info(f"直链： {stream_link} for {m.from_user.first_name}")
     await reply_with_stream_links(m, stream_link, short_link, show_code_link="short")
+    schedule_warm_up(log_msg_id, file_hash)
 
-# 发送一条新消息，开始轮询下载进度
+# 发送一条新消息，订阅下载进度
 
 
 async def reply_download_info(q: CallbackQuery, stream_link):
-    # 实现从remote_list中和search_download_by_url进行查找stream_link的方法，直到任务状态为完成
-    msg = await q.message.reply("已提交下载任务，等待下载中...", quote=True)
-    await asyncio.sleep(5)
-    try:
-        await msg.edit_text("正在查询下载任务进度...")
-    except Exception:
-        pass
-    while True:
-        try:
-            # 从remote_list中查找任务状态为downloading的任务
-            category = 'downloading'
-            remote_result = await remote_list(category=category)
-            task = await search_download_by_url(result=remote_result, url=stream_link)
-            logger.info(f"Cloudreve task: {task} category={category}")
-            if task:
-                if task.get('status') == "completed":
-                    try:
-                        await msg.edit_text(f"下载任务已完成！\n文件名称:{task.get('name', 'N/A')}")
-                    except Exception:
-                        pass
-                    break
-                if task.get('status') == "downloading":
-                    progress_val = task.get('progress', 0) or 0
-                    try:
-                        pct = float(progress_val) * 100
-                    except Exception:
-                        pct = 0.0
-                    try:
-                        await msg.edit_text(
-                            f"下载中...\n文件名称:{task.get('name', 'N/A')}\n进度:{pct:.2f}%",
-                        )
-                    except Exception:
-                        pass
-                    continue
-        except Exception as e:
-            logger.error(f"查询下载任务进度时出错: {e}")
-            break
-        # 如果在downloading中未找到，尝试downloaded分类
-        if not task:
+    # 进度由后台统一轮询（task_poller），这里只在任务状态变化时更新消息
+    msg = await outbox.reply(q.message, "已提交下载任务，等待下载中...", quote=True)
+    task = None
+    async for task in task_poller.watch(stream_link):
+        logger.info(f"Cloudreve task: {task}")
+        name = task.get('name', 'N/A')
+        if task['state'] == "completed":
+            cloudreve_tier.record_saved(stream_link, name, task.get('dst'))
+            text = f"下载任务已完成！\n文件名称:{name}"
+        elif task['state'] == "failed":
+            text = f"下载任务失败。\n文件名称:{name}"
+        else:
             try:
-                category = 'downloaded'
-                remote_result = await remote_list(category=category)
-                task = await search_download_by_url(result=remote_result, url=stream_link)
-                logger.info(f"Cloudreve task: {task} category={category}")
-                if task:
-                    try:
-                        await msg.edit_text(f"下载任务已完成！\n文件名称:{task.get('name', 'N/A')}")
-                        break
-                    except Exception:
-                        pass
-            except Exception as e:
-                logger.error(f"查询已完成下载任务时出错: {e}")
-                break
+                pct = float(task.get('progress') or 0) * 100
+            except (TypeError, ValueError):
+                pct = 0.0
+            text = f"下载中...\n文件名称:{name}\n进度:{pct:.2f}%"
+        # 进度编辑在发送队列中合并，只发出最新的一次；结果与用户回复同样优先
+        outbox.edit_text(msg, text, priority=REPLY if task['state'] != "downloading" else PROGRESS)
+    if task is None:
+        outbox.edit_text(msg, "长时间未查询到下载任务，请到云盘中查看。", priority=REPLY)
 
-        await asyncio.sleep(5)
+# 直传到云盘并更新上传进度
+
+# 两次进度更新之间至少间隔的秒数
+PUSH_PROGRESS_INTERVAL = 5
+
+
+async def reply_push_info(q: CallbackQuery, message_id: int, secure_hash: str):
+    msg = await outbox.reply(q.message, "正在上传到云盘...", quote=True)
+    last_edit = 0.0
+
+    async def progress(uploaded: int, total: int):
+        nonlocal last_edit
+        now = time.monotonic()
+        if uploaded < total and now - last_edit < PUSH_PROGRESS_INTERVAL:
+            return
+        last_edit = now
+        outbox.edit_text(msg, f"正在上传到云盘...\n进度:{uploaded * 100 / max(total, 1):.2f}%")
+
+    try:
+        uri = await push_file(message_id, secure_hash, progress)
+        text = f"上传完成！\n文件位置:{uri}"
+    except Exception as e:
+        logger.error(f"直传到云盘失败: {e}")
+        text = f"上传到云盘失败：{e}\n再次点击“保存到云盘”会从中断处继续。"
+    outbox.edit_text(msg, text, priority=REPLY)
 
 # 处理保存到Cloudreve的回调查询
 
@@ -403,16 +412,26 @@ async def save_to_cloudreve_handler(_, q: CallbackQuery):
     if not stream_link:
         return await q.answer("未能解析直链，请重试或重新生成。", show_alert=True)
 
+    # 直传模式：由机器人读取文件并上传到云盘，不依赖直链能否被云盘访问
+    parsed = parse_stream_link(stream_link) if Var.CLOUDREVE_PUSH else None
+    if parsed:
+        STREAM_LINK_CACHE.pop(q.message.id, None)
+        await q.answer("开始上传到云盘。")
+        asyncio.create_task(reply_push_info(q, *parsed))
+        return
+
     try:
-        await remote_download(stream_link)
+        # 短时间内的多个保存请求会合并为一次云盘请求
+        await submit_queue.submit(stream_link)
         # 使用一次后可删除缓存，避免堆积
         try:
             STREAM_LINK_CACHE.pop(q.message.id, None)
         except Exception:
             pass
 
-        # 发送一条新消息，开始轮询下载进度
-        await reply_download_info(q, stream_link)
+        # 发送一条新消息跟踪下载进度；放到后台，不占用处理更新的 worker
+        await q.answer("已提交到云盘。")
+        asyncio.create_task(reply_download_info(q, stream_link))
 
     except Exception as e:
         # 将错误返回给用户
@@ -421,26 +440,26 @@ async def save_to_cloudreve_handler(_, q: CallbackQuery):
 # 处理/menu指令
 
 
+def menu_markup() -> InlineKeyboardMarkup:
+    return InlineKeyboardMarkup(
+        [
+            [
+                InlineKeyboardButton(
+                    "远程下载", switch_inline_query_current_chat="/rdl "),
+                InlineKeyboardButton("查看文件", callback_data="menu_list"),
+                InlineKeyboardButton("删除文件", callback_data="menu_delete"),
+            ],
+        ]
+    )
+
+
 @StreamBot.on_message(filters.command("menu") & filters.private)
 async def menu_command_handler(_, m: Message):
     if Var.ALLOWED_USERS and not ((str(m.from_user.id) in Var.ALLOWED_USERS) or (m.from_user.username in Var.ALLOWED_USERS)):
-        return await m.reply("你<b>没有权限</b>使用这个机器人。", quote=True)
+        return outbox.reply(m, "你<b>没有权限</b>使用这个机器人。", quote=True)
 
     # 发送菜单消息
-    await m.reply(
-        "请选择一个操作：",
-        quote=True,
-        reply_markup=InlineKeyboardMarkup(
-            [
-                [
-                    InlineKeyboardButton(
-                        "远程下载", switch_inline_query_current_chat="/rdl "),
-                    InlineKeyboardButton("查看文件", callback_data="menu_list"),
-                    InlineKeyboardButton("删除文件", callback_data="menu_delete"),
-                ],
-            ]
-        ),
-    )
+    outbox.reply(m, "请选择一个操作：", quote=True, reply_markup=menu_markup())
 
 # 处理/rdl命令
 
@@ -448,51 +467,126 @@ async def menu_command_handler(_, m: Message):
 @StreamBot.on_message(filters.command("rdl") & filters.private)
 async def rdl_command_handler(_, m: Message):
     if Var.ALLOWED_USERS and not ((str(m.from_user.id) in Var.ALLOWED_USERS) or (m.from_user.username in Var.ALLOWED_USERS)):
-        return await m.reply("你<b>没有权限</b>使用这个机器人。", quote=True)
+        return outbox.reply(m, "你<b>没有权限</b>使用这个机器人。", quote=True)
 
-    # 优先从被回复消息中提取链接，其次从当前消息中提取
-    stream_link = extract_url_from_message(
-        getattr(m, "reply_to_message", None)) or extract_url_from_message(m)
-    if not stream_link:
-        return await m.reply("请在/rdl命令后提供一个有效的下载链接，或回复包含直链的消息使用 /rdl。", quote=True)
+    # 优先从被回复消息中提取链接，其次从当前消息中提取；可一次提交多个链接
+    urls = extract_urls_from_message(
+        getattr(m, "reply_to_message", None)) or extract_urls_from_message(m)
+    if not urls:
+        return outbox.reply(m, "请在/rdl命令后提供一个有效的下载链接，或回复包含直链的消息使用 /rdl。", quote=True)
 
-    try:
-        await remote_download(stream_link)
-        await m.reply("已提交到云盘。", quote=True)
-    except Exception as e:
-        await m.reply(f"云盘提交失败：{e}", quote=True)
+    if len(urls) == 1:
+        try:
+            await submit_queue.submit(urls[0])
+            outbox.reply(m, "已提交到云盘。", quote=True)
+        except Exception as e:
+            outbox.reply(m, f"云盘提交失败：{e}", quote=True)
+        return
+
+    results = await submit_queue.submit_many(urls)
+    failed = [(url, error) for url, _, error in results if error is not None]
+    text = f"已提交 {len(urls) - len(failed)}/{len(urls)} 个链接到云盘。"
+    if failed:
+        text += "\n\n提交失败：\n" + "\n".join(f"{url}：{error}" for url, error in failed[:20])
+    outbox.reply(m, text, quote=True, disable_web_page_preview=True, parse_mode=ParseMode.DISABLED)
 
 
 @StreamBot.on_message(filters.command("relogin") & filters.private)
 async def relogin_command_handler(_, m: Message):
     if Var.ALLOWED_USERS and not ((str(m.from_user.id) in Var.ALLOWED_USERS) or (m.from_user.username in Var.ALLOWED_USERS)):
-        return await m.reply("你<b>没有权限</b>使用这个机器人。", quote=True)
+        return outbox.reply(m, "你<b>没有权限</b>使用这个机器人。", quote=True)
 
     # 触发重新登录流程
     await refresh_cloudreve_token()
-    await m.reply("已重新登录云盘。", quote=True)
-
-
-# @StreamBot.on_callback_query(filters.regex("^menu_list$"))
-# async def menu_list_handler(_, q: CallbackQuery):
-#     # 权限校验（复用与消息处理一致的策略）
-#     user = q.from_user
-#     if Var.ALLOWED_USERS and not ((str(user.id) in Var.ALLOWED_USERS) or (user.username in Var.ALLOWED_USERS)):
-#         return await q.answer("你没有权限使用此功能。", show_alert=True)
-
-#     # 获取文件列表
-#     try:
-#         result = await file_list()
-#         data = result.get("data")
-#         files = data.get("files", [])
-#         if not files.length:
-#             return await q.answer("云盘上暂无文件。", show_alert=True)
-
-#         # 转换为内联键盘格式
-#         keyboard = []
-#         for item in files:
-#             keyboard.append([InlineKeyboardButton(item["name"], callback_data=f"file_{item['id']}")])
-#         keyboard.append([InlineKeyboardButton("返回", callback_data="menu_back")])
+    outbox.reply(m, "已重新登录云盘。", quote=True)
+
+
+# 浏览云盘文件
+
+# 每页显示的条目数
+BROWSE_PAGE_SIZE = 10
+# 按钮的 callback_data 最长 64 字节，放不下文件夹路径，改为放它的编号；只保留最近用到的文件夹
+BROWSE_FOLDERS_SIZE = 256
+BROWSE_FOLDERS = OrderedDict()  # 文件夹 uri -> 编号
+BROWSE_FOLDER_URIS = {}  # 编号 -> 文件夹 uri
+BROWSE_NEXT_KEY = itertools.count()
+
+
+def browse_key(uri: str) -> int:
+    key = BROWSE_FOLDERS.get(uri)
+    if key is None:
+        key = BROWSE_FOLDERS[uri] = next(BROWSE_NEXT_KEY)
+        BROWSE_FOLDER_URIS[key] = uri
+    BROWSE_FOLDERS.move_to_end(uri)
+    while len(BROWSE_FOLDERS) > BROWSE_FOLDERS_SIZE:
+        _, old_key = BROWSE_FOLDERS.popitem(last=False)
+        BROWSE_FOLDER_URIS.pop(old_key, None)
+    return key
+
+
+async def render_folder(uri: str, page: int):
+    entries, has_more = await file_browser.page(uri, page, BROWSE_PAGE_SIZE)
+    root = Var.CLOUDEREVE_DOWNLOAD_PATH.rstrip("/")
+    lines = [f"📂 <code>{html.escape(unquote(uri))}</code>", f"第 {page + 1} 页"]
+    keyboard = []
+    for i, item in enumerate(entries, start=page * BROWSE_PAGE_SIZE + 1):
+        name = html.escape(item.get("name") or "")
+        # type 为 1 的是文件夹
+        if item.get("type") == 1:
+            lines.append(f"{i}. 📁 {name}")
+            if item.get("path"):
+                keyboard.append([InlineKeyboardButton(f"📁 {item.get('name')}", callback_data=f"menu_list:{browse_key(item['path'])}:0")])
+        else:
+            lines.append(f"{i}. 📄 {name} · {readable_size(item.get('size'))}")
+    if not entries:
+        lines.append("（空文件夹）")
+    key = browse_key(uri)
+    nav = []
+    if page > 0:
+        nav.append(InlineKeyboardButton("« 上一页", callback_data=f"menu_list:{key}:{page - 1}"))
+    if has_more:
+        nav.append(InlineKeyboardButton("下一页 »", callback_data=f"menu_list:{key}:{page + 1}"))
+    if nav:
+        keyboard.append(nav)
+    bottom = []
+    # 只能回到下载目录为止
+    if uri.rstrip("/").startswith(root + "/"):
+        bottom.append(InlineKeyboardButton("⬆ 上一级", callback_data=f"menu_list:{browse_key(uri.rstrip('/').rsplit('/', 1)[0])}:0"))
+    bottom.append(InlineKeyboardButton("返回", callback_data="menu_back"))
+    keyboard.append(bottom)
+    return "\n".join(lines), InlineKeyboardMarkup(keyboard)
+
+
+@StreamBot.on_callback_query(filters.regex(r"^menu_list(:\d+:\d+)?$"))
+async def menu_list_handler(_, q: CallbackQuery):
+    # 权限校验（复用与消息处理一致的策略）
+    user = q.from_user
+    if Var.ALLOWED_USERS and not ((str(user.id) in Var.ALLOWED_USERS) or (user.username in Var.ALLOWED_USERS)):
+        return await q.answer("你没有权限使用此功能。", show_alert=True)
+
+    # menu_list 为下载目录第一页，menu_list:<文件夹序号>:<页码> 为翻页
+    uri, page = Var.CLOUDEREVE_DOWNLOAD_PATH, 0
+    if q.data != "menu_list":
+        _, key, page = q.data.split(":")
+        key, page = int(key), int(page)
+        uri = BROWSE_FOLDER_URIS.get(key)
+        if uri is None:
+            # 重启后或很久没用的旧按钮，编号已失效
+            return await q.answer("列表已过期，请重新发送 /menu。", show_alert=True)
+
+    try:
+        text, markup = await render_folder(uri, page)
+    except Exception as e:
+        logger.error(f"获取云盘文件列表失败: {e}")
+        return await q.answer(f"获取文件列表失败：{e}", show_alert=True)
+    await q.answer()
+    outbox.edit_text(q.message, text, priority=REPLY, reply_markup=markup, disable_web_page_preview=True)
+
+
+@StreamBot.on_callback_query(filters.regex("^menu_back$"))
+async def menu_back_handler(_, q: CallbackQuery):
+    await q.answer()
+    outbox.edit_text(q.message, "请选择一个操作：", priority=REPLY, reply_markup=menu_markup())
 
 
 # @StreamBot.on_callback_query(filters.regex("^menu_delete$"))
@@ -6,12 +6,32 @@
 import logging
 from aiohttp import web
 from .stream_routes import routes
+from .webdav import routes as webdav_routes
+from WebStreamer.bot import multi_clients
 
 logger = logging.getLogger("server")
 
+# Seconds a client is told to wait while no bot has finished logging in yet
+STARTUP_RETRY_AFTER = 3
+# answered from local state alone, so they work before any bot is logged in
+READY_EXEMPT_PATHS = ("/", "/api/search")
+
+@web.middleware
+async def readiness_middleware(request: web.Request, handler):
+    # The port is bound before any bot is logged in; only the status page and search work until then
+    if not multi_clients and request.path not in READY_EXEMPT_PATHS:
+        return web.Response(
+            status=503,
+            text="503: Service is starting, please retry shortly",
+            headers={"Retry-After": str(STARTUP_RETRY_AFTER)},
+        )
+    return await handler(request)
+
 def web_server():
     logger.info("Initializing..")
-    web_app = web.Application(client_max_size=30000000)
+    web_app = web.Application(client_max_size=30000000, middlewares=[readiness_middleware])
+    # WebDAV first, the stream routes end with a catch-all GET
+    web_app.add_routes(webdav_routes)
     web_app.add_routes(routes)
     logger.info("Added routes")
     return web_app
@@ -3,17 +3,34 @@
 
 import re
 import time
+import hashlib
+import asyncio
 import math
 import logging
 import secrets
 import mimetypes
-from aiohttp import web
+from typing import Optional, Tuple
+from urllib.parse import quote
+from aiohttp import web, ClientError
+from pyrogram import raw
 from aiohttp.http_exceptions import BadStatusLine
-from WebStreamer.bot import multi_clients, work_loads
+from WebStreamer.bot import multi_clients, work_loads, draining
+from WebStreamer.bot.clients import add_client, schedule_removal
 from WebStreamer.server.exceptions import FIleNotFound, InvalidHash
 from WebStreamer import Var, StartTime, __version__, StreamBot
-from WebStreamer.utils.custom_dl import ByteStreamer
-from WebStreamer.utils.file_properties import get_hash, get_name
+from WebStreamer.utils import cluster, health
+from WebStreamer.utils.custom_dl import get_streamer, schedule_index, STREAM_CHUNK_SIZE
+from WebStreamer.utils.chunk_cache import chunk_cache
+from WebStreamer.utils.popularity import popularity
+from WebStreamer.utils.media_index import RangeReader
+from WebStreamer.utils import thumbnails
+from WebStreamer.utils.zip_stream import (
+    ZipError, ZipBundle, BundleEntry, METHOD_STORED, METHOD_DEFLATED, read_directory, inflate, directory_cache,
+)
+from WebStreamer.utils.bin_index import bin_index
+from WebStreamer.utils.cloudreve_tier import cloudreve_tier
+from WebStreamer.utils.uploader import PartUploader, UPLOAD_PART_SIZE, send_uploaded_media
+from WebStreamer.utils.file_properties import get_hash, get_name, get_media_from_message, build_links
 from WebStreamer.utils.time_format import get_readable_time
 
 logger = logging.getLogger("routes")
@@ -25,9 +42,9 @@ routes = web.RouteTableDef()
 async def root_route_handler(_):
     return web.json_response(
         {
-            "server_status": "running",
+            "server_status": "running" if multi_clients else "starting",
             "uptime": get_readable_time(time.time() - StartTime),
-            "telegram_bot": "@" + StreamBot.username,
+            "telegram_bot": "@" + StreamBot.username if getattr(StreamBot, "username", None) else None,
             "connected_bots": len(multi_clients),
             "loads": dict(
                 ("bot" + str(c + 1), l)
@@ -36,10 +53,563 @@ async def root_route_handler(_):
                 )
             ),
             "version": f"v{__version__}",
+            "health": health.health_status(),
+            "chunk_cache": chunk_cache.stats(),
+            **({"cluster": cluster.cluster_status()} if cluster.is_enabled() else {}),
         }
     )
 
 
+def check_token(request: web.Request, expected: str) -> None:
+    """
+    Rejects the request unless it carries `Authorization: Bearer <expected>`.
+    The route doesn't exist at all while the expected token is unset.
+    """
+    if not expected:
+        raise web.HTTPNotFound()
+    auth = request.headers.get("Authorization", "")
+    token = auth[7:] if auth.startswith("Bearer ") else ""
+    if not secrets.compare_digest(token.encode("UTF-8"), expected.encode("UTF-8")):
+        raise web.HTTPUnauthorized(text="401: Invalid token")
+
+
+def check_admin(request: web.Request) -> None:
+    check_token(request, Var.ADMIN_TOKEN)
+
+
+@routes.get("/admin/clients")
+async def list_clients_handler(request: web.Request):
+    check_admin(request)
+    return web.json_response(
+        {
+            "clients": [
+                {
+                    "id": index,
+                    "name": getattr(getattr(client, "me", None), "username", None),
+                    "load": work_loads.get(index, 0),
+                    "draining": index in draining,
+                    "state": health.client_breaker(index).state,
+                }
+                for index, client in sorted(multi_clients.items())
+            ]
+        }
+    )
+
+
+@routes.post("/admin/clients")
+async def add_client_handler(request: web.Request):
+    check_admin(request)
+    try:
+        data = await request.json()
+        token = str(data["token"])
+    except (ValueError, KeyError, TypeError):
+        raise web.HTTPBadRequest(text="400: Expected a JSON body with a bot token")
+    try:
+        client_id = await add_client(token)
+    except ValueError as e:
+        raise web.HTTPConflict(text=str(e))
+    except RuntimeError as e:
+        raise web.HTTPBadGateway(text=str(e))
+    return web.json_response({"id": client_id}, status=201)
+
+
+@routes.delete(r"/admin/clients/{client_id:\d+}")
+async def remove_client_handler(request: web.Request):
+    check_admin(request)
+    client_id = int(request.match_info["client_id"])
+    if client_id == 0:
+        raise web.HTTPBadRequest(text="400: The main bot can't be removed")
+    if client_id not in multi_clients:
+        raise web.HTTPNotFound(text="404: Client not found")
+    if client_id in draining:
+        raise web.HTTPConflict(text="409: Client is already being removed")
+    try:
+        timeout = int(request.rel_url.query.get("timeout", 600))
+    except ValueError:
+        raise web.HTTPBadRequest(text="400: timeout must be an integer")
+    # Draining can take as long as the longest running stream, so don't hold the request open
+    schedule_removal(client_id, timeout)
+    return web.json_response(
+        {"id": client_id, "status": "draining", "load": work_loads.get(client_id, 0)},
+        status=202,
+    )
+
+
+# most files /admin/top lists at once
+TOP_FILES_MAX = 500
+
+
+@routes.get("/admin/top")
+async def top_files_handler(request: web.Request):
+    check_admin(request)
+    try:
+        limit = int(request.rel_url.query.get("limit", 20))
+    except ValueError:
+        raise web.HTTPBadRequest(text="400: limit must be an integer")
+    limit = min(max(limit, 1), TOP_FILES_MAX)
+    return web.json_response({"files": popularity.top_files(limit), "chunk_cache": chunk_cache.stats()})
+
+
+@routes.get("/admin/pins")
+async def list_pins_handler(request: web.Request):
+    check_admin(request)
+    return web.json_response({"pins": popularity.list_pins()})
+
+
+@routes.post(r"/admin/pins/{message_id:\d+}")
+async def pin_handler(request: web.Request):
+    check_admin(request)
+    message_id = int(request.match_info["message_id"])
+    try:
+        file_id = await get_streamer(health.pick_client()).get_file_properties(message_id)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    popularity.pin(file_id.media_id, message_id, get_name(file_id))
+    return web.json_response({"media_id": file_id.media_id, "message_id": message_id}, status=201)
+
+
+@routes.delete(r"/admin/pins/{message_id:\d+}")
+async def unpin_handler(request: web.Request):
+    check_admin(request)
+    media_id = popularity.find_pin(int(request.match_info["message_id"]))
+    if media_id is None or not popularity.unpin(media_id):
+        raise web.HTTPNotFound(text="404: Not pinned")
+    return web.json_response({"media_id": media_id})
+
+
+# results per page of /api/search
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 100
+
+
+@routes.get("/api/search")
+async def search_handler(request: web.Request):
+    """
+    Searches the BIN_CHANNEL catalog by file name; answered from the local index alone.
+    """
+    check_token(request, Var.SEARCH_TOKEN)
+    query = request.query.get("q", "").strip()
+    if not query:
+        raise web.HTTPBadRequest(text="400: q is required")
+    try:
+        page = max(1, int(request.query.get("page", "1")))
+        per_page = min(max(1, int(request.query.get("per_page", str(SEARCH_PAGE_SIZE)))), SEARCH_MAX_PAGE_SIZE)
+    except ValueError:
+        raise web.HTTPBadRequest(text="400: page and per_page must be integers")
+    total, rows = bin_index.search(query, per_page, (page - 1) * per_page)
+    results = []
+    for row in rows:
+        name = row["file_name"] or row["unique_id"]
+        short_link, stream_link = build_links(get_hash(row["unique_id"], Var.HASH_LENGTH), row["message_id"], name)
+        results.append(
+            {
+                "message_id": row["message_id"],
+                "name": name,
+                "size": row["file_size"],
+                "mime_type": row["mime_type"],
+                "date": row["date"],
+                "short_link": short_link,
+                "stream_link": stream_link,
+            }
+        )
+    return web.json_response(
+        {
+            "query": query,
+            "total": total,
+            "page": page,
+            "per_page": per_page,
+            "pages": math.ceil(total / per_page),
+            "results": results,
+        }
+    )
+
+
+@routes.put("/upload/{name}")
+async def upload_handler(request: web.Request):
+    """
+    Streams the request body into Telegram and posts it to BIN_CHANNEL.
+    The body is consumed from request.content part by part, so client_max_size doesn't
+    apply here and memory stays bounded by the uploader's queue whatever the file size.
+    """
+    check_token(request, Var.UPLOAD_TOKEN)
+    file_name = request.match_info["name"]
+    file_size = request.content_length
+    if not file_size:
+        raise web.HTTPLengthRequired(text="411: Content-Length is required")
+    if file_size > Var.UPLOAD_MAX_SIZE:
+        raise web.HTTPRequestEntityTooLarge(max_size=Var.UPLOAD_MAX_SIZE, actual_size=file_size)
+    mime_type = request.headers.get("Content-Type") or mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+
+    # An uploaded file belongs to the client that uploaded it, so the whole file goes through
+    # one client; concurrent uploads are spread over the pool like streams are
+    index = health.pick_client()
+    client = multi_clients[index]
+    logger.info(f"Client {index} is receiving upload {file_name} ({file_size} bytes) from {request.remote}")
+    # counted only once the uploader runs, so a failed start can't leave the load behind
+    try:
+        uploader = await PartUploader(client, file_size, file_name).start()
+    except asyncio.TimeoutError:
+        raise web.HTTPServiceUnavailable(text="503: Telegram is unreachable, try again later")
+    work_loads[index] += 1
+    try:
+        async for chunk in request.content.iter_chunked(UPLOAD_PART_SIZE):
+            await uploader.write(chunk)
+        input_file = await uploader.finish()
+    except ValueError as e:
+        await uploader.abort()
+        raise web.HTTPBadRequest(text=f"400: {e}")
+    except BaseException:
+        await uploader.abort()
+        raise
+    finally:
+        if index in work_loads:
+            work_loads[index] -= 1
+
+    log_msg = await send_uploaded_media(
+        client,
+        Var.BIN_CHANNEL,
+        raw.types.InputMediaUploadedDocument(
+            file=input_file,
+            mime_type=mime_type,
+            attributes=[raw.types.DocumentAttributeFilename(file_name=file_name)],
+            force_file=True,
+        ),
+    )
+    unique_id = get_media_from_message(log_msg).file_unique_id
+    message_id = bin_index.lookup(unique_id) if Var.DEDUP_UPLOADS else None
+    if message_id and message_id != log_msg.id:
+        # Same content is already in the channel; keep a single copy
+        await client.delete_messages(Var.BIN_CHANNEL, log_msg.id)
+    else:
+        message_id = log_msg.id
+        bin_index.add_message(log_msg)
+    short_link, stream_link = build_links(get_hash(unique_id, Var.HASH_LENGTH), message_id, file_name)
+    return web.json_response(
+        {
+            "message_id": message_id,
+            "name": file_name,
+            "size": file_size,
+            "short_link": short_link,
+            "stream_link": stream_link,
+        },
+        status=201,
+    )
+
+
+async def route_in_cluster(request: web.Request, secure_hash: Optional[str]) -> Optional[web.StreamResponse]:
+    """
+    Hands the request to the cluster node owning the file; returns None when it's served here.
+    """
+    if secure_hash and not cluster.is_forwarded(request):
+        owner = cluster.owner_of(secure_hash)
+        if owner:
+            try:
+                return await cluster.route_to_owner(request, owner)
+            except (ClientError, TimeoutError) as e:
+                logger.warning(f"Cluster node {owner} unreachable, serving locally: {e}")
+    return None
+
+
+async def resolve_file(request: web.Request, message_id: int, secure_hash: str):
+    """
+    Picks the client to serve a message's file with and checks the link's hash.
+    Returns the client index, its ByteStreamer and the file's FileId.
+    """
+    index = health.pick_client()
+    tg_connect = get_streamer(index)
+    logger.debug("before calling get_file_properties")
+    file_id = await tg_connect.get_file_properties(message_id)
+    logger.debug("after calling get_file_properties")
+
+    if not health.admit_dc(index, file_id.dc_id):
+        # This client's media session for the file's DC keeps failing; try another client
+        alternative = health.pick_client(file_id.dc_id)
+        if alternative != index:
+            index = alternative
+            tg_connect = get_streamer(index)
+            file_id = await tg_connect.get_file_properties(message_id)
+
+    if Var.MULTI_CLIENT:
+        logger.info(f"Client {index} is now serving {request.remote}")
+
+    if get_hash(file_id.unique_id, Var.HASH_LENGTH) != secure_hash:
+        logger.debug(f"Invalid hash for message with ID {message_id}")
+        raise InvalidHash
+    return index, tg_connect, file_id
+
+
+def chunk_parts(from_bytes: int, until_bytes: int, chunk_size: int = STREAM_CHUNK_SIZE) -> Tuple[int, int, int, int]:
+    """
+    Returns the yield_file arguments (offset, first_part_cut, last_part_cut, part_count)
+    that produce exactly the bytes from_bytes..until_bytes (inclusive) of a file.
+    """
+    offset = from_bytes - (from_bytes % chunk_size)
+    first_part_cut = from_bytes - offset
+    last_part_cut = until_bytes % chunk_size + 1
+    part_count = until_bytes // chunk_size - offset // chunk_size + 1
+    return offset, first_part_cut, last_part_cut, part_count
+
+
+def parse_range(request: web.Request, size: int) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Returns the inclusive byte range a request asks for within `size` bytes,
+    (None, None) if it didn't send a Range header, or raises 416.
+    """
+    if "Range" not in request.headers:
+        return None, None
+    try:
+        http_range = request.http_range
+    except ValueError:
+        http_range = None
+    start = http_range.start if http_range else None
+    stop = http_range.stop if http_range else None
+    if start is not None and start < 0:
+        start, stop = max(size + start, 0), None
+    from_bytes = start or 0
+    until_bytes = (stop if stop is not None else size) - 1
+    if http_range is None or from_bytes >= size or until_bytes < from_bytes:
+        raise web.HTTPRequestRangeNotSatisfiable(headers={"Content-Range": f"bytes */{size}"})
+    return from_bytes, min(until_bytes, size - 1)
+
+
+@routes.get(r"/{ref:[0-9a-f]+}/zip/{member:.*}", allow_head=True)
+async def zip_member_handler(request: web.Request):
+    try:
+        ref = request.match_info["ref"]
+        secure_hash, message_id = ref[:Var.HASH_LENGTH], ref[Var.HASH_LENGTH:]
+        if not message_id.isdigit():
+            raise web.HTTPNotFound()
+        routed = await route_in_cluster(request, secure_hash)
+        if routed is not None:
+            return routed
+        return await zip_streamer(request, int(message_id), secure_hash, request.match_info["member"])
+    except web.HTTPException:
+        raise
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logger.critical(str(e), exc_info=True)
+        raise web.HTTPInternalServerError(text=str(e))
+
+
+async def zip_streamer(request: web.Request, message_id: int, secure_hash: str, member_name: str):
+    """
+    Lists a ZIP stored in Telegram, or streams one member out of it, without reading the rest of the archive.
+    The central directory is read from the tail with range reads and cached by the archive's unique_id.
+    """
+    index, tg_connect, file_id = await resolve_file(request, message_id, secure_hash)
+    reader = RangeReader(
+        lambda offset: tg_connect.fetch_chunk(file_id, offset, STREAM_CHUNK_SIZE, record=False),
+        STREAM_CHUNK_SIZE,
+        file_id.file_size,
+    )
+    directory = directory_cache.get(file_id.unique_id)
+    if directory is None:
+        try:
+            directory = await read_directory(reader)
+        except ZipError as e:
+            raise web.HTTPUnsupportedMediaType(text=f"415: {e}")
+        directory_cache.put(file_id.unique_id, directory)
+
+    if not member_name:
+        base = f"{Var.URL}{secure_hash}{message_id}/zip/"
+        return web.json_response(
+            {
+                "name": get_name(file_id),
+                "size": file_id.file_size,
+                "members": [
+                    {**member.to_dict(), "link": None if member.is_dir else base + quote(member.name)}
+                    for member in directory.members
+                ],
+            }
+        )
+
+    member = directory.by_name.get(member_name)
+    if member is None or member.is_dir:
+        raise web.HTTPNotFound(text="404: No such file in the archive")
+    if member.is_encrypted or member.method not in (METHOD_STORED, METHOD_DEFLATED):
+        raise web.HTTPNotImplemented(text="501: Encrypted or unsupported compression method")
+
+    file_name = member.name.rsplit("/", 1)[-1]
+    mime_type = mimetypes.guess_type(file_name)[0] or "application/octet-stream"
+    disposition = "inline" if "video/" in mime_type or "audio/" in mime_type else "attachment"
+    headers = {
+        "Content-Type": mime_type,
+        "Content-Disposition": f'{disposition}; filename="{file_name}"',
+    }
+    if member.file_size == 0:
+        return web.Response(body=b"", headers=headers)
+
+    data_offset = await directory.data_offset(reader, member)
+    if member.method == METHOD_STORED:
+        # Stored members are a plain slice of the archive, so Range maps straight onto it
+        from_bytes, until_bytes = parse_range(request, member.file_size)
+        partial = from_bytes is not None
+        if not partial:
+            from_bytes, until_bytes = 0, member.file_size - 1
+        body = tg_connect.yield_file(
+            file_id, index, *chunk_parts(data_offset + from_bytes, data_offset + until_bytes), STREAM_CHUNK_SIZE
+        )
+        headers.update({
+            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{member.file_size}",
+            "Content-Length": str(until_bytes - from_bytes + 1),
+            "Accept-Ranges": "bytes",
+        })
+        return web.Response(status=206 if partial else 200, body=body, headers=headers)
+
+    # Deflated members can only be produced from their start, so Range isn't offered
+    compressed = tg_connect.yield_file(
+        file_id, index, *chunk_parts(data_offset, data_offset + member.compressed_size - 1), STREAM_CHUNK_SIZE
+    )
+    headers.update({"Content-Length": str(member.file_size), "Accept-Ranges": "none"})
+    return web.Response(body=inflate(compressed), headers=headers)
+
+
+@routes.get(r"/thumb/{ref:[0-9a-f]+}", allow_head=True)
+async def thumbnail_handler(request: web.Request):
+    try:
+        ref = request.match_info["ref"]
+        secure_hash, message_id = ref[:Var.HASH_LENGTH], ref[Var.HASH_LENGTH:]
+        if not message_id.isdigit():
+            raise web.HTTPNotFound()
+        routed = await route_in_cluster(request, secure_hash)
+        if routed is not None:
+            return routed
+        query = request.rel_url.query
+        try:
+            width = int(query["w"]) if "w" in query else None
+            quality = int(query.get("q", 80))
+        except ValueError:
+            raise web.HTTPBadRequest(text="400: w and q must be integers")
+        fmt = query.get("format")
+        if fmt is not None and fmt not in thumbnails.FORMATS:
+            raise web.HTTPBadRequest(text=f"400: format must be one of {', '.join(thumbnails.FORMATS)}")
+        if width is not None:
+            width = min(max(width, thumbnails.MIN_WIDTH), thumbnails.MAX_WIDTH)
+        quality = min(max(quality, 1), 95)
+
+        _, tg_connect, file_id = await resolve_file(request, int(message_id), secure_hash)
+        thumbnail = await thumbnails.get_thumbnail(tg_connect, file_id, width, fmt, quality)
+        if thumbnail is None:
+            raise web.HTTPNotFound(text="404: This file has no thumbnail")
+        data, content_type = thumbnail
+        return web.Response(
+            body=data,
+            headers={"Content-Type": content_type, "Cache-Control": "public, max-age=86400"},
+        )
+    except web.HTTPException:
+        raise
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logger.critical(str(e), exc_info=True)
+        raise web.HTTPInternalServerError(text=str(e))
+
+
+@routes.get("/bundle", allow_head=True)
+async def bundle_handler(request: web.Request):
+    try:
+        refs = [ref for ref in re.split(r"[,\s]+", request.rel_url.query.get("files", "")) if ref]
+        if not refs:
+            raise web.HTTPBadRequest(text="400: Pass the files as ?files=<hash><id>,<hash><id>,...")
+        if len(refs) > Var.BATCH_MAX:
+            raise web.HTTPBadRequest(text=f"400: At most {Var.BATCH_MAX} files per bundle")
+        files = []
+        for ref in refs:
+            match = re.fullmatch(r"([0-9a-f]{%s})(\d+)" % (Var.HASH_LENGTH), ref)
+            if not match:
+                raise web.HTTPBadRequest(text=f"400: Invalid file reference {ref}")
+            files.append((match.group(1), int(match.group(2))))
+        return await bundle_streamer(request, files)
+    except web.HTTPException:
+        raise
+    except InvalidHash as e:
+        raise web.HTTPForbidden(text=e.message)
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
+    except (AttributeError, BadStatusLine, ConnectionResetError):
+        pass
+    except Exception as e:
+        logger.critical(str(e), exc_info=True)
+        raise web.HTTPInternalServerError(text=str(e))
+
+
+def unique_member_name(name: str, taken: set) -> str:
+    candidate = name
+    stem, dot, extension = name.rpartition(".")
+    if not dot:
+        stem, extension = name, ""
+    counter = 1
+    while candidate in taken:
+        counter += 1
+        candidate = f"{stem} ({counter}){dot}{extension}"
+    taken.add(candidate)
+    return candidate
+
+
+async def bundle_streamer(request: web.Request, files):
+    """
+    Streams many files as one store-mode ZIP64 archive straight from Telegram.
+    Every file's size is known from its FileId, so the archive's exact length is sent up front
+    and Range requests let an interrupted download resume.
+    """
+    index = health.pick_client()
+    tg_connect = get_streamer(index)
+    file_ids = await tg_connect.get_file_properties_batch([message_id for _, message_id in files])
+
+    entries = []
+    taken = set()
+    for secure_hash, message_id in files:
+        file_id = file_ids.get(message_id)
+        if file_id is None:
+            raise FIleNotFound
+        if get_hash(file_id.unique_id, Var.HASH_LENGTH) != secure_hash:
+            raise InvalidHash
+
+        def open_range(first: int, last: int, file_id=file_id):
+            return tg_connect.yield_file(file_id, index, *chunk_parts(first, last), STREAM_CHUNK_SIZE)
+
+        entries.append(BundleEntry(
+            unique_member_name(get_name(file_id), taken), file_id.file_size or 0, file_id.unique_id, open_range,
+        ))
+    bundle = ZipBundle(entries)
+    logger.info(f"Client {index} is serving a bundle of {len(entries)} files ({bundle.size} bytes) to {request.remote}")
+
+    from_bytes, until_bytes = parse_range(request, bundle.size)
+    partial = from_bytes is not None
+    if partial and bundle.needs_skipped_crcs(from_bytes, until_bytes):
+        # a range starting past the beginning of a member with an unknown CRC would download
+        # that member again; the whole archive computes every CRC while it streams
+        logger.info("Bundle range needs uncached CRCs, answering with the full archive")
+        partial = False
+    if not partial:
+        from_bytes, until_bytes = 0, bundle.size - 1
+    bundle_name = request.rel_url.query.get("name", "bundle.zip").replace('"', "")
+    if not bundle_name.lower().endswith(".zip"):
+        bundle_name += ".zip"
+    etag = hashlib.md5(",".join(f"{h}{m}" for h, m in files).encode("UTF-8")).hexdigest()
+    return web.Response(
+        status=206 if partial else 200,
+        body=bundle.stream(from_bytes, until_bytes),
+        headers={
+            "Content-Type": "application/zip",
+            "Content-Range": f"bytes {from_bytes}-{until_bytes}/{bundle.size}",
+            "Content-Length": str(until_bytes - from_bytes + 1),
+            "Content-Disposition": f'attachment; filename="{bundle_name}"',
+            "Accept-Ranges": "bytes",
+            "ETag": f'"{etag}"',
+        },
+    )
+
+
 @routes.get(r"/{path:\S+}", allow_head=True)
 async def stream_handler(request: web.Request):
     try:
@@ -51,7 +621,15 @@ async def stream_handler(request: web.Request):
         else:
             message_id = int(re.search(r"(\d+)(?:\/\S+)?", path).group(1))
             secure_hash = request.rel_url.query.get("hash")
+        routed = await route_in_cluster(request, secure_hash)
+        if routed is not None:
+            return routed
+        redirect = await tier_redirect(request, message_id, secure_hash)
+        if redirect:
+            raise web.HTTPFound(redirect)
         return await media_streamer(request, message_id, secure_hash)
+    except web.HTTPException:
+        raise
     except InvalidHash as e:
         raise web.HTTPForbidden(text=e.message)
     except FIleNotFound as e:
@@ -62,34 +640,43 @@ async def stream_handler(request: web.Request):
         logger.critical(str(e), exc_info=True)
         raise web.HTTPInternalServerError(text=str(e))
 
-class_cache = {}
+
+async def tier_redirect(request: web.Request, message_id: int, secure_hash: Optional[str]) -> Optional[str]:
+    """
+    Returns the Cloudreve URL to send a request to when the file has a saved copy there
+    and is played often enough; None keeps it on Telegram.
+    """
+    if not Var.CLOUDREVE_TIERING or not cloudreve_tier.is_saved(message_id, secure_hash):
+        return None
+    try:
+        # file properties are cached per client, so this doesn't call Telegram for a file being watched
+        file_id = await get_streamer(health.pick_client()).get_file_properties(message_id)
+    except Exception as e:
+        # the Telegram path reports its own errors; tiering just stays out of the way
+        logger.debug(f"Tier check of message {message_id} failed, serving it from Telegram: {e}")
+        return None
+    if get_hash(file_id.unique_id, Var.HASH_LENGTH) != secure_hash:
+        cloudreve_tier.forget(message_id)
+        return None
+    # only playback requests count (see media_streamer); warming up a new link or scanning
+    # its container index doesn't make a file hot
+    if popularity.files.estimate(file_id.media_id) < Var.CLOUDREVE_TIER_MIN_REQUESTS:
+        return None
+    url = await cloudreve_tier.redirect_url(message_id)
+    if url and request.method == "GET" and not (request.http_range.start or 0):
+        # playbacks served elsewhere still count, or the file would cool down and come back
+        popularity.record_playback(file_id.media_id)
+    return url
+
 
 async def media_streamer(request: web.Request, message_id: int, secure_hash: str):
     range_header = request.headers.get("Range", 0)
-    
-    index = min(work_loads, key=work_loads.get)
-    faster_client = multi_clients[index]
-    
-    if Var.MULTI_CLIENT:
-        logger.info(f"Client {index} is now serving {request.remote}")
 
-    if faster_client in class_cache:
-        tg_connect = class_cache[faster_client]
-        logger.debug(f"Using cached ByteStreamer object for client {index}")
-    else:
-        logger.debug(f"Creating new ByteStreamer object for client {index}")
-        tg_connect = ByteStreamer(faster_client)
-        class_cache[faster_client] = tg_connect
-    logger.debug("before calling get_file_properties")
-    file_id = await tg_connect.get_file_properties(message_id)
-    logger.debug("after calling get_file_properties")
-    
-    
-    if get_hash(file_id.unique_id, Var.HASH_LENGTH) != secure_hash:
-        logger.debug(f"Invalid hash for message with ID {message_id}")
-        raise InvalidHash
+    index, tg_connect, file_id = await resolve_file(request, message_id, secure_hash)
     
     file_size = file_id.file_size
+    # MP4/MKV players fetch the container index before playing or seeking; keep it close
+    schedule_index(tg_connect, file_id)
 
     if range_header:
         from_bytes, until_bytes = range_header.replace("bytes=", "").split("-")
@@ -106,8 +693,11 @@ async def media_streamer(request: web.Request, message_id: int, secure_hash: str
             headers={"Content-Range": f"bytes */{file_size}"},
         )
 
-    chunk_size = 1024 * 1024
+    chunk_size = STREAM_CHUNK_SIZE
     until_bytes = min(until_bytes, file_size - 1)
+    if request.method == "GET" and from_bytes == 0:
+        # one count per request that starts the file; seeks and the chunks streamed don't add to it
+        popularity.record_playback(file_id.media_id)
 
     offset = from_bytes - (from_bytes % chunk_size)
     first_part_cut = from_bytes - offset
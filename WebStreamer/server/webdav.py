@@ -0,0 +1,198 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import re
+import logging
+import secrets
+from collections import OrderedDict
+from email.utils import formatdate
+from typing import List, Optional, Tuple
+from urllib.parse import quote
+from xml.sax.saxutils import escape
+from aiohttp import web, BasicAuth
+from WebStreamer.vars import Var
+from WebStreamer.utils.bin_index import bin_index, month_bounds
+from WebStreamer.utils.file_properties import get_hash
+from WebStreamer.server.exceptions import FIleNotFound, InvalidHash
+from .stream_routes import media_streamer
+
+logger = logging.getLogger("webdav")
+
+routes = web.RouteTableDef()
+
+DAV_PREFIX = "/dav"
+# rows read from the catalog per query while listing a folder
+PAGE_SIZE = 1000
+# rendered folder listings kept in memory until the catalog changes
+LISTING_CACHE_SIZE = 32
+ALLOWED_METHODS = "OPTIONS, PROPFIND, GET, HEAD"
+FILE_PATTERN = re.compile(r"^(\d+)_")
+
+
+def check_auth(request: web.Request) -> None:
+    """
+    Requires the WEBDAV_USERNAME / WEBDAV_PASSWORD credentials; WebDAV is off while they're unset.
+    """
+    if not (Var.WEBDAV_USERNAME and Var.WEBDAV_PASSWORD):
+        raise web.HTTPNotFound()
+    try:
+        auth = BasicAuth.decode(request.headers.get("Authorization", ""))
+    except ValueError:
+        auth = None
+    if auth is None or not (
+        secrets.compare_digest(auth.login.encode("UTF-8"), Var.WEBDAV_USERNAME.encode("UTF-8"))
+        and secrets.compare_digest(auth.password.encode("UTF-8"), Var.WEBDAV_PASSWORD.encode("UTF-8"))
+    ):
+        raise web.HTTPUnauthorized(headers={"WWW-Authenticate": 'Basic realm="TG-FileStreamBot"'})
+
+
+def file_entry_name(row) -> str:
+    return f"{row['message_id']}_{row['file_name'] or row['unique_id']}".replace("/", "_")
+
+
+def http_date(timestamp: Optional[int]) -> str:
+    return formatdate(timestamp or 0, usegmt=True)
+
+
+def collection_response(href: str, name: str, date: Optional[int]) -> str:
+    return (
+        f"<D:response><D:href>{escape(href)}</D:href><D:propstat><D:prop>"
+        f"<D:displayname>{escape(name)}</D:displayname>"
+        f"<D:resourcetype><D:collection/></D:resourcetype>"
+        f"<D:getlastmodified>{http_date(date)}</D:getlastmodified>"
+        f"</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>"
+    )
+
+
+def file_response(href: str, row) -> str:
+    return (
+        f"<D:response><D:href>{escape(href)}</D:href><D:propstat><D:prop>"
+        f"<D:displayname>{escape(file_entry_name(row))}</D:displayname>"
+        f"<D:resourcetype/>"
+        f"<D:getcontentlength>{row['file_size'] or 0}</D:getcontentlength>"
+        f"<D:getcontenttype>{escape(row['mime_type'] or 'application/octet-stream')}</D:getcontenttype>"
+        f"<D:getlastmodified>{http_date(row['date'])}</D:getlastmodified>"
+        f"<D:getetag>\"{escape(row['unique_id'])}\"</D:getetag>"
+        f"</D:prop><D:status>HTTP/1.1 200 OK</D:status></D:propstat></D:response>"
+    )
+
+
+def multistatus(responses: List[str]) -> bytes:
+    return (
+        '<?xml version="1.0" encoding="utf-8"?><D:multistatus xmlns:D="DAV:">'
+        + "".join(responses)
+        + "</D:multistatus>"
+    ).encode("UTF-8")
+
+
+class ListingCache:
+    def __init__(self, size: int):
+        """Rendered PROPFIND bodies, valid while the catalog's version doesn't change."""
+        self.size = size
+        self.listings: "OrderedDict[Tuple[str, str], Tuple[int, bytes]]" = OrderedDict()
+
+    def get(self, key: Tuple[str, str]) -> Optional[bytes]:
+        cached = self.listings.get(key)
+        if cached is None or cached[0] != bin_index.version:
+            return None
+        self.listings.move_to_end(key)
+        return cached[1]
+
+    def put(self, key: Tuple[str, str], body: bytes) -> None:
+        self.listings[key] = (bin_index.version, body)
+        self.listings.move_to_end(key)
+        while len(self.listings) > self.size:
+            self.listings.popitem(last=False)
+
+
+listing_cache = ListingCache(LISTING_CACHE_SIZE)
+
+
+def list_root(depth: str) -> bytes:
+    months = bin_index.months()
+    responses = [collection_response(f"{DAV_PREFIX}/", "dav", max((m["date"] for m in months), default=0))]
+    if depth != "0":
+        responses.extend(
+            collection_response(f"{DAV_PREFIX}/{m['month']}/", m["month"], m["date"]) for m in months
+        )
+    return multistatus(responses)
+
+
+def list_month(month: str, depth: str) -> bytes:
+    responses = [collection_response(f"{DAV_PREFIX}/{month}/", month, month_bounds(month)[0])]
+    if depth != "0":
+        offset = 0
+        while True:
+            rows = bin_index.files_in_month(month, PAGE_SIZE, offset)
+            responses.extend(
+                file_response(f"{DAV_PREFIX}/{month}/{quote(file_entry_name(row))}", row) for row in rows
+            )
+            if len(rows) < PAGE_SIZE:
+                break
+            offset += PAGE_SIZE
+    return multistatus(responses)
+
+
+def find_file(month: str, name: str):
+    match = FILE_PATTERN.match(name)
+    if not match:
+        return None
+    row = bin_index.get_file(int(match.group(1)))
+    if row is None or row["date"] is None:
+        return None
+    start, end = month_bounds(month)
+    return row if start <= row["date"] < end else None
+
+
+def split_path(path: str) -> List[str]:
+    return [part for part in path.split("/") if part]
+
+
+@routes.route("*", DAV_PREFIX + r"{path:(/.*)?}")
+async def webdav_handler(request: web.Request):
+    check_auth(request)
+    if request.method == "OPTIONS":
+        return web.Response(headers={"DAV": "1", "Allow": ALLOWED_METHODS, "MS-Author-Via": "DAV"})
+    if request.method not in ("PROPFIND", "GET", "HEAD"):
+        raise web.HTTPMethodNotAllowed(request.method, ALLOWED_METHODS.split(", "))
+    parts = split_path(request.match_info["path"])
+    if len(parts) > 2:
+        raise web.HTTPNotFound()
+    try:
+        if len(parts) >= 1:
+            month_bounds(parts[0])
+    except ValueError:
+        raise web.HTTPNotFound()
+
+    if request.method == "PROPFIND":
+        depth = request.headers.get("Depth", "1")
+        if depth not in ("0", "1"):
+            # listing the whole library in one response isn't offered (RFC 4918 9.1)
+            return web.Response(status=403, text="403: Depth infinity is not supported")
+        if len(parts) == 2:
+            row = find_file(*parts)
+            if row is None:
+                raise web.HTTPNotFound()
+            body = multistatus([file_response(f"{DAV_PREFIX}/{parts[0]}/{quote(file_entry_name(row))}", row)])
+        else:
+            key = ("/".join(parts), depth)
+            body = listing_cache.get(key)
+            if body is None:
+                body = list_month(parts[0], depth) if parts else list_root(depth)
+                listing_cache.put(key, body)
+        return web.Response(status=207, body=body, content_type="application/xml", charset="utf-8")
+
+    if len(parts) < 2:
+        return web.Response(text="WebDAV endpoint; mount it with a WebDAV client.", headers={"DAV": "1"})
+    row = find_file(*parts)
+    if row is None:
+        raise web.HTTPNotFound()
+    try:
+        # served like any stream link, Range and client selection included
+        return await media_streamer(request, row["message_id"], get_hash(row["unique_id"], Var.HASH_LENGTH))
+    except InvalidHash:
+        # the message now holds another file; the catalog entry is stale
+        bin_index.forget_message(row["message_id"])
+        raise web.HTTPNotFound()
+    except FIleNotFound as e:
+        raise web.HTTPNotFound(text=e.message)
@@ -0,0 +1,310 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import asyncio
+import logging
+import sqlite3
+from datetime import datetime, timezone
+from typing import List, Optional, Tuple
+from pyrogram import Client
+from pyrogram.errors import FloodWait, RPCError
+from pyrogram.types import Message
+from WebStreamer.vars import Var
+from .file_properties import get_media_from_message
+from .outbox import outbox, BIN
+
+logger = logging.getLogger("bin_index")
+
+# get_messages accepts at most 200 ids per call
+SCAN_BATCH_SIZE = 200
+# only when the channel's latest message id can't be found: consecutive empty batches after which
+# the scan stops for now, without marking the index complete
+SCAN_EMPTY_BATCHES = 5
+# text of the message posted to find the channel's latest message id
+PROBE_TEXT = "·"
+# the trigram tokenizer matches any substring of a file name, CJK included, but needs at least 3 characters
+FTS_MIN_TERM = 3
+
+
+class BinIndex:
+    def __init__(self, path: str):
+        """A local index of the files stored in BIN_CHANNEL, keyed by file_unique_id.
+        attributes:
+            path: the SQLite database file.
+
+        functions:
+            lookup: returns the BIN_CHANNEL message id already holding a file.
+            add_message: records a BIN_CHANNEL message.
+            forget_message: drops a message that no longer exists.
+            rebuild: scans the channel history to (re)create the index.
+            months / files_in_month / get_file: read the index as a catalog, without calling Telegram.
+            search: finds files by name through a full-text index of the catalog.
+
+        version goes up whenever the indexed files change, so listings built from the index
+        can be cached until then.
+        """
+        self.path = path
+        self.version = 0
+        self.fts = False
+        self._db: Optional[sqlite3.Connection] = None
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        return self._ensure_open()
+
+    def _ensure_open(self) -> sqlite3.Connection:
+        """
+        Connects on first use and creates the tables and, if SQLite supports it, the FTS index.
+        """
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.row_factory = sqlite3.Row
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    unique_id TEXT PRIMARY KEY,
+                    message_id INTEGER NOT NULL,
+                    file_name TEXT,
+                    file_size INTEGER,
+                    mime_type TEXT,
+                    date INTEGER
+                );
+                CREATE INDEX IF NOT EXISTS files_message_id ON files (message_id);
+                CREATE INDEX IF NOT EXISTS files_date ON files (date);
+                CREATE TABLE IF NOT EXISTS meta (
+                    key TEXT PRIMARY KEY,
+                    value TEXT
+                );
+                """
+            )
+            self._db.commit()
+            self.fts = self._create_fts()
+        return self._db
+
+    def _create_fts(self) -> bool:
+        """
+        Creates the FTS5 table over file names, kept in step with the files table by triggers.
+        Returns False when this SQLite has no FTS5 or no trigram tokenizer; search then falls back to LIKE.
+        """
+        exists = self._db.execute("SELECT 1 FROM sqlite_master WHERE name = 'files_fts'").fetchone()
+        try:
+            self._db.executescript(
+                """
+                CREATE VIRTUAL TABLE IF NOT EXISTS files_fts USING fts5(
+                    file_name, content='files', content_rowid='rowid', tokenize='trigram'
+                );
+                CREATE TRIGGER IF NOT EXISTS files_fts_insert AFTER INSERT ON files BEGIN
+                    INSERT INTO files_fts (rowid, file_name) VALUES (new.rowid, new.file_name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_fts_delete AFTER DELETE ON files BEGIN
+                    INSERT INTO files_fts (files_fts, rowid, file_name) VALUES ('delete', old.rowid, old.file_name);
+                END;
+                CREATE TRIGGER IF NOT EXISTS files_fts_update AFTER UPDATE ON files BEGIN
+                    INSERT INTO files_fts (files_fts, rowid, file_name) VALUES ('delete', old.rowid, old.file_name);
+                    INSERT INTO files_fts (rowid, file_name) VALUES (new.rowid, new.file_name);
+                END;
+                """
+            )
+        except sqlite3.OperationalError:
+            logger.warning("SQLite has no FTS5 trigram tokenizer, file search falls back to LIKE")
+            return False
+        if not exists:
+            # files indexed before the search table existed
+            self._db.execute("INSERT INTO files_fts (files_fts) VALUES ('rebuild')")
+        self._db.commit()
+        return True
+
+    def get_meta(self, key: str) -> Optional[str]:
+        row = self.db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return row["value"] if row else None
+
+    def set_meta(self, key: str, value: str) -> None:
+        self.db.execute("INSERT OR REPLACE INTO meta (key, value) VALUES (?, ?)", (key, value))
+        self.db.commit()
+
+    def lookup(self, unique_id: str) -> Optional[int]:
+        """
+        Returns the BIN_CHANNEL message id that already holds the file, if any.
+        """
+        row = self.db.execute("SELECT message_id FROM files WHERE unique_id = ?", (unique_id,)).fetchone()
+        return row["message_id"] if row else None
+
+    @staticmethod
+    def _row(message: Message) -> Optional[tuple]:
+        media = get_media_from_message(message)
+        if not media or not getattr(media, "file_unique_id", None):
+            return None
+        date = getattr(message, "date", None)
+        return (
+            media.file_unique_id,
+            message.id,
+            getattr(media, "file_name", None),
+            getattr(media, "file_size", 0),
+            getattr(media, "mime_type", None),
+            int(date.timestamp()) if date else None,
+        )
+
+    def add_message(self, message: Message) -> None:
+        """
+        Records a BIN_CHANNEL message; the first message seen for a file wins.
+        """
+        row = self._row(message)
+        self._note_top_id(message.id)
+        if row:
+            self.db.execute("INSERT OR IGNORE INTO files VALUES (?, ?, ?, ?, ?, ?)", row)
+            self.version += 1
+        self.db.commit()
+
+    def _note_top_id(self, message_id: int) -> None:
+        # the highest BIN_CHANNEL message id seen, which bounds a rebuild; meta.value is TEXT,
+        # and TEXT sorts above any INTEGER, so both sides are compared as integers
+        self.db.execute(
+            "INSERT INTO meta (key, value) VALUES ('top_message_id', ?) "
+            "ON CONFLICT(key) DO UPDATE SET value = MAX(CAST(value AS INTEGER), CAST(excluded.value AS INTEGER))",
+            (message_id,),
+        )
+
+    async def _probe_top_id(self, client: Client, chat_id: int) -> Optional[int]:
+        """
+        Returns the channel's latest message id by posting a message and deleting it right away;
+        everything before its id is what the scan has to cover. It's the last resort, used only
+        while no message id of the channel has been seen: bots can't call messages.getHistory or
+        messages.getDialogs, and channels.getFullChannel only carries read markers, so there is
+        no read-only way for a bot to learn the id.
+        """
+        try:
+            # through the outbox, which waits out flood waits a bounded number of times
+            probe = await outbox.call(
+                chat_id, client.send_message, chat_id, PROBE_TEXT, disable_notification=True, priority=BIN
+            )
+        except RPCError as e:
+            logger.warning(f"Couldn't probe the latest message of {chat_id}: {e}")
+            return None
+        try:
+            await outbox.call(chat_id, client.delete_messages, chat_id, probe.id, priority=BIN)
+        except RPCError:
+            logger.warning(f"Couldn't delete index probe message {probe.id} from {chat_id}")
+        return probe.id - 1
+
+    def forget_message(self, message_id: int) -> None:
+        cursor = self.db.execute("DELETE FROM files WHERE message_id = ?", (message_id,))
+        self.db.commit()
+        if cursor.rowcount:
+            self.version += 1
+            logger.debug(f"Dropped message {message_id} from the index")
+
+    def needs_rebuild(self) -> bool:
+        return self.get_meta("scan_complete") != "1"
+
+    async def rebuild(self, client: Client, chat_id: int) -> None:
+        """
+        Walks the channel history by message id and records every media message.
+        Bots can't read the history directly, so ids are fetched in batches through get_messages
+        up to the channel's latest message id, however large the deleted ranges on the way; that is
+        the highest id recorded so far, or found with a probe message when none is.
+        An interrupted scan resumes where it stopped.
+        """
+        start = int(self.get_meta("last_scanned_id") or 0) + 1
+        known_top = self.get_meta("top_message_id")
+        top = int(known_top) if known_top else await self._probe_top_id(client, chat_id)
+        if top is None:
+            logger.warning(f"Latest message of {chat_id} unknown, scanning until {SCAN_EMPTY_BATCHES} empty batches")
+        logger.info(f"Rebuilding index of {chat_id} from message {start} to {top or 'the end'}")
+        empty_batches = 0
+        indexed = 0
+        while (start <= top) if top is not None else (empty_batches < SCAN_EMPTY_BATCHES):
+            ids = list(range(start, start + SCAN_BATCH_SIZE))
+            try:
+                messages = await client.get_messages(chat_id, ids)
+            except FloodWait as e:
+                logger.warning(f"Index rebuild hit a flood wait of {e.value}s")
+                await asyncio.sleep(e.value)
+                continue
+            rows = [row for row in (self._row(m) for m in messages if not m.empty) if row]
+            if rows:
+                self.db.executemany("INSERT OR IGNORE INTO files VALUES (?, ?, ?, ?, ?, ?)", rows)
+                indexed += len(rows)
+                self.version += 1
+            if any(not m.empty for m in messages):
+                empty_batches = 0
+            else:
+                empty_batches += 1
+            if top is not None or not empty_batches:
+                # with a known end an empty batch is just a deleted range, and is done with
+                self.set_meta("last_scanned_id", str(min(ids[-1], top) if top is not None else ids[-1]))
+            self.db.commit()
+            start += SCAN_BATCH_SIZE
+            await asyncio.sleep(1)
+        if top is None:
+            # without a known end, messages past the gap may still exist; look again on the next start
+            logger.info(f"Index scan paused with {indexed} new files")
+            return
+        self.set_meta("scan_complete", "1")
+        logger.info(f"Index rebuilt with {indexed} new files")
+
+    def get_file(self, message_id: int) -> Optional[sqlite3.Row]:
+        return self.db.execute("SELECT * FROM files WHERE message_id = ?", (message_id,)).fetchone()
+
+    def months(self) -> List[sqlite3.Row]:
+        """
+        Returns the months (UTC, "YYYY-MM") files were posted in, with their file count, total size and latest date.
+        """
+        return self.db.execute(
+            """
+            SELECT strftime('%Y-%m', date, 'unixepoch') AS month, COUNT(*) AS files,
+                   SUM(file_size) AS size, MAX(date) AS date
+            FROM files WHERE date IS NOT NULL GROUP BY month ORDER BY month
+            """
+        ).fetchall()
+
+    def files_in_month(self, month: str, limit: int, offset: int = 0) -> List[sqlite3.Row]:
+        """
+        Returns one page of the files posted in a month ("YYYY-MM"), oldest first.
+        """
+        start, end = month_bounds(month)
+        return self.db.execute(
+            "SELECT * FROM files WHERE date >= ? AND date < ? ORDER BY date, message_id LIMIT ? OFFSET ?",
+            (start, end, limit, offset),
+        ).fetchall()
+
+    def search(self, query: str, limit: int, offset: int = 0) -> Tuple[int, List[sqlite3.Row]]:
+        """
+        Returns (total matches, one page of them, newest first) for the files whose name contains
+        every whitespace-separated term of the query, case-insensitively.
+        """
+        terms = query.split()
+        if not terms:
+            return 0, []
+        # opening the database is what sets self.fts
+        self._ensure_open()
+        conditions = []
+        params: list = []
+        fts_terms = [term for term in terms if self.fts and len(term) >= FTS_MIN_TERM]
+        if fts_terms:
+            conditions.append("rowid IN (SELECT rowid FROM files_fts WHERE files_fts MATCH ?)")
+            params.append(" ".join('"{}"'.format(term.replace('"', '""')) for term in fts_terms))
+        for term in terms:
+            if term not in fts_terms:
+                conditions.append("file_name LIKE ? ESCAPE '\\'")
+                params.append("%{}%".format(term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")))
+        where = " AND ".join(conditions)
+        total = self.db.execute(f"SELECT COUNT(*) FROM files WHERE {where}", params).fetchone()[0]
+        rows = self.db.execute(
+            f"SELECT * FROM files WHERE {where} ORDER BY date DESC, message_id DESC LIMIT ? OFFSET ?",
+            params + [limit, offset],
+        ).fetchall()
+        return total, rows
+
+
+def month_bounds(month: str) -> Tuple[int, int]:
+    """
+    Returns the UTC timestamps a "YYYY-MM" month starts at and ends before; raises ValueError for anything else.
+    """
+    start = datetime.strptime(month, "%Y-%m").replace(tzinfo=timezone.utc)
+    end = start.replace(year=start.year + 1, month=1) if start.month == 12 else start.replace(month=start.month + 1)
+    return int(start.timestamp()), int(end.timestamp())
+
+
+bin_index = BinIndex(os.path.join(Var.DATA_DIR, "bin_index.db"))
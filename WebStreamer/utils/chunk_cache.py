@@ -0,0 +1,93 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import logging
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+from WebStreamer.vars import Var
+from .popularity import popularity
+
+logger = logging.getLogger("chunk_cache")
+
+# (media_id, offset, chunk_size)
+ChunkKey = Tuple[int, int, int]
+
+
+class ChunkCache:
+    def __init__(self, max_bytes: int):
+        """An in-memory LRU cache of file chunks fetched from Telegram, with TinyLFU admission.
+        attributes:
+            max_bytes: the total size of chunks kept; 0 disables the cache.
+
+        functions:
+            get: returns a cached chunk and marks it as recently used.
+            put: stores a chunk if it's more popular than what it would evict.
+
+        Chunks are keyed by the file's media_id rather than by message or client,
+        so a chunk fetched by any client serves every later request for the file.
+        Once the cache is full, a new chunk only gets in by beating the least recently
+        used chunks on request frequency, so one pass over a huge file can't flush
+        the popular ones. Chunks of pinned files are always admitted and never evicted.
+        """
+        self.max_bytes = max_bytes
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.rejected = 0
+        self.chunks: "OrderedDict[ChunkKey, bytes]" = OrderedDict()
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def get(self, key: ChunkKey) -> Optional[bytes]:
+        chunk = self.chunks.get(key)
+        if chunk is None:
+            self.misses += 1
+            return None
+        self.chunks.move_to_end(key)
+        self.hits += 1
+        return chunk
+
+    def put(self, key: ChunkKey, chunk: bytes) -> None:
+        if not self.enabled or not chunk or len(chunk) > self.max_bytes:
+            return
+        old = self.chunks.pop(key, None)
+        if old is not None:
+            self.size -= len(old)
+        if self.size + len(chunk) > self.max_bytes and not self._make_room(key, len(chunk)):
+            self.rejected += 1
+            return
+        self.chunks[key] = chunk
+        self.size += len(chunk)
+
+    def _make_room(self, candidate: ChunkKey, needed: int) -> bool:
+        victims = []
+        freed = 0
+        for key in self.chunks:
+            if self.size - freed + needed <= self.max_bytes:
+                break
+            if popularity.is_pinned(key[0]):
+                continue
+            if not popularity.admit(candidate, key):
+                return False
+            victims.append(key)
+            freed += len(self.chunks[key])
+        if self.size - freed + needed > self.max_bytes:
+            return False
+        for key in victims:
+            self.size -= len(self.chunks.pop(key))
+        return True
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "chunks": len(self.chunks),
+            "bytes": self.size,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "rejected": self.rejected,
+        }
+
+
+chunk_cache = ChunkCache(Var.CHUNK_CACHE_SIZE * 1024 * 1024)
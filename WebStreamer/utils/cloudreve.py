@@ -7,18 +7,16 @@ Description: Cloudreve helper functions (async only)
 # Cloudreve helper functions - async only
 
 import array
+import asyncio
 import json
 from math import log
 import time
 import aiohttp
 import logging
 from typing import Any as _AnyType
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, Tuple
 from datetime import datetime
 
-# Module-level cache for token object
-TOKEN_OBJ: Optional[Dict[str, Any]] = None
-
 # Internal helper utilities (DRY): HTTP, parsing, validation
 
 
@@ -46,12 +44,25 @@ def _to_epoch_sec(v: _AnyType) -> Optional[int]:
     return t
 
 
+class CloudreveAPIError(RuntimeError):
+    """Cloudreve answered and refused the request with an API error code."""
+
+    def __init__(self, message: str, code: Any = None):
+        super().__init__(message)
+        self.code = code
+
+
+class CloudreveUnavailable(RuntimeError):
+    """Cloudreve (or a proxy in front of it) didn't give a usable answer: a 5xx status or a body that isn't JSON.
+    Worth retrying, unlike CloudreveAPIError."""
+
+
 def _ensure_api_success(result: Dict[str, Any], action: str) -> None:
     code = result.get("code")
     if code != 0:
         msg = result.get("msg") or f"{action} failed"
         logging.error(f"Cloudreve {action} error: code={code}, msg={msg}")
-        raise RuntimeError(f"Cloudreve {action} error: code={code}, msg={msg}")
+        raise CloudreveAPIError(f"Cloudreve {action} error: code={code}, msg={msg}", code)
     return code
 
 
@@ -65,113 +76,210 @@ def _extract_token_obj(result: Dict[str, Any]) -> Dict[str, Any]:
     return token_obj
 
 
-async def _http_post_json(url: str, payload: Dict[str, Any], headers: Optional[Dict[str, str]] = None, timeout: int = 15) -> Dict[str, Any]:
-    timeout_obj = aiohttp.ClientTimeout(total=timeout)
-    async with aiohttp.ClientSession(timeout=timeout_obj) as session:
-        async with session.post(url, json=payload, headers=headers) as resp:
-            text = await resp.text()
-            try:
-                return json.loads(text)
-            except Exception:
-                raise RuntimeError(f"Cloudreve invalid response: {text[:200]}")
-
-
-async def _http_get_json(url: str, headers: Optional[Dict[str, str]] = None, timeout: int = 15, params: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
-    timeout_obj = aiohttp.ClientTimeout(total=timeout)
-    async with aiohttp.ClientSession(timeout=timeout_obj) as session:
-        async with session.get(url, params=params, headers=headers) as resp:
+# connections kept to the Cloudreve API (and to the storage URLs it hands out)
+POOL_SIZE = 20
+KEEPALIVE_TIMEOUT = 60
+
+
+class CloudreveClient:
+    def __init__(self, timeout: int = 15, skew_seconds: int = 60):
+        """A long-lived Cloudreve API client.
+        attributes:
+            timeout: default total timeout of a request, in seconds.
+            skew_seconds: how long before access_expires the access token is refreshed.
+
+        functions:
+            request: calls an API endpoint with a valid access token; replayed once after a 401.
+            login / refresh: get a new token; concurrent callers share one request.
+            ensure_token: returns a token that isn't about to expire.
+            close: stops the background refresh and closes the pooled session.
+
+        One keep-alive session is shared by every call, and a background task refreshes the
+        token shortly before it expires, so a request rarely waits for a login.
+        """
+        self.timeout = timeout
+        self.skew_seconds = skew_seconds
+        self.token: Optional[Dict[str, Any]] = None
+        self._session: Optional[aiohttp.ClientSession] = None
+        self._token_task: Optional[asyncio.Future] = None
+        self._refresh_timer: Optional[asyncio.Task] = None
+
+    @staticmethod
+    def api_base() -> str:
+        from WebStreamer.vars import Var
+        api_url = getattr(Var, "CLOUDEREVE_API_URL", None)
+        if not api_url:
+            raise ValueError("CLOUDEREVE_API_URL is empty")
+        return api_url.rstrip("/")
+
+    def session(self) -> aiohttp.ClientSession:
+        if self._session is None or self._session.closed:
+            self._session = aiohttp.ClientSession(
+                timeout=aiohttp.ClientTimeout(total=self.timeout),
+                connector=aiohttp.TCPConnector(limit=POOL_SIZE, keepalive_timeout=KEEPALIVE_TIMEOUT),
+            )
+        return self._session
+
+    async def _send(self, method: str, path: str, payload: Optional[Dict[str, Any]] = None,
+                    params: Optional[Dict[str, Any]] = None, access_token: Optional[str] = None,
+                    timeout: Optional[int] = None, data: Any = None,
+                    extra_headers: Optional[Dict[str, str]] = None) -> Tuple[int, Dict[str, Any]]:
+        headers = dict(extra_headers or {})
+        if access_token:
+            headers["Authorization"] = f"Bearer {access_token}"
+        kwargs = {"timeout": aiohttp.ClientTimeout(total=timeout)} if timeout else {}
+        if data is not None:
+            kwargs["data"] = data
+        else:
+            kwargs["json"] = payload
+        async with self.session().request(
+            method, f"{self.api_base()}{path}", params=params, headers=headers or None, **kwargs
+        ) as resp:
             text = await resp.text()
             try:
-                return json.loads(text)
+                return resp.status, json.loads(text)
             except Exception:
-                raise RuntimeError(f"Cloudreve invalid response: {text[:200]}")
+                raise CloudreveUnavailable(f"Cloudreve invalid response (HTTP {resp.status}): {text[:200]}")
+
+    async def _single_flight(self, fetch) -> Dict[str, Any]:
+        # 同一时间只发出一个登录/刷新请求，其余调用者等待同一个结果
+        if self._token_task is None or self._token_task.done():
+            self._token_task = asyncio.ensure_future(fetch())
+        return await asyncio.shield(self._token_task)
+
+    async def login(self) -> Dict[str, Any]:
+        return await self._single_flight(self._login)
+
+    async def refresh(self) -> Dict[str, Any]:
+        return await self._single_flight(self._refresh)
+
+    async def _login(self) -> Dict[str, Any]:
+        from WebStreamer.vars import Var
+        email = getattr(Var, "CLOUDEREVE_USERNAME", None) or getattr(Var, "CLOUDEREVE_EMAIL", None)
+        password = getattr(Var, "CLOUDEREVE_PASSWORD", None)
+        if not email or not password:
+            raise ValueError("CLOUDEREVE_USERNAME/EMAIL or CLOUDEREVE_PASSWORD is empty")
+        _, result = await self._send("POST", "/api/v4/session/token", {"email": email, "password": password})
+        _ensure_api_success(result, "login")
+        return self._set_token(_extract_token_obj(result))
+
+    async def _refresh(self) -> Dict[str, Any]:
+        refresh_token = self.token.get("refresh_token") if self.token else None
+        refresh_expires = _to_epoch_sec(self.token.get("refresh_expires")) if self.token else None
+        if not refresh_token or (refresh_expires is not None and time.time() >= refresh_expires):
+            # No usable refresh token; fallback to login
+            return await self._login()
+        try:
+            _, result = await self._send("POST", "/api/v4/session/token/refresh", {"refresh_token": refresh_token})
+            _ensure_api_success(result, "refresh")
+            token_obj = _extract_token_obj(result)
+        except (RuntimeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            # 刷新失败（失效/作废/网络错误），立刻作废缓存并回退登录
+            logging.warning("Cloudreve token refresh failed; clearing cache and re-login: %s", e)
+            self.token = None
+            return await self._login()
+        # 如果返回缺少 refresh_token（被作废/黑名单），直接清空缓存并回退登录
+        if not token_obj.get("refresh_token"):
+            logging.warning("Cloudreve refresh response missing refresh_token; clearing cache and re-login")
+            self.token = None
+            return await self._login()
+        return self._set_token(token_obj)
+
+    def _set_token(self, token_obj: Dict[str, Any]) -> Dict[str, Any]:
+        self.token = token_obj
+        self._schedule_refresh()
+        return token_obj
+
+    def _schedule_refresh(self) -> None:
+        if self._refresh_timer is not None and self._refresh_timer is not asyncio.current_task():
+            self._refresh_timer.cancel()
+        access_expires = _to_epoch_sec(self.token.get("access_expires"))
+        if access_expires is None:
+            return
+        delay = max(0, access_expires - self.skew_seconds - time.time())
+        self._refresh_timer = asyncio.get_running_loop().create_task(self._refresh_later(delay))
+
+    async def _refresh_later(self, delay: float) -> None:
+        await asyncio.sleep(delay)
+        try:
+            await self.refresh()
+            logging.debug("Cloudreve token refreshed in the background")
+        except Exception as e:
+            # the next request refreshes or logs in again by itself
+            logging.warning(f"Cloudreve background token refresh failed: {e}")
+
+    def needs_refresh(self, skew_seconds: Optional[int] = None) -> bool:
+        access_expires = _to_epoch_sec(self.token.get("access_expires")) if self.token else None
+        skew = self.skew_seconds if skew_seconds is None else max(0, int(skew_seconds))
+        return access_expires is not None and time.time() >= access_expires - skew
+
+    async def ensure_token(self, skew_seconds: Optional[int] = None) -> Dict[str, Any]:
+        if self.token is None:
+            return await self.login()
+        if self.needs_refresh(skew_seconds):
+            return await self.refresh()
+        return self.token
+
+    async def request(self, method: str, path: str, action: str, payload: Optional[Dict[str, Any]] = None,
+                      params: Optional[Dict[str, Any]] = None, timeout: Optional[int] = None,
+                      skew_seconds: Optional[int] = None, data: Any = None,
+                      headers: Optional[Dict[str, str]] = None) -> Dict[str, Any]:
+        """
+        Calls an authenticated endpoint and returns its JSON after checking the API code.
+        A 401 (HTTP status or API code) refreshes the token and replays the request once;
+        a streamed `data` body can't be sent twice, so such a request fails after the refresh instead.
+        """
+        token = await self.ensure_token(skew_seconds)
+        status, result = await self._send(method, path, payload, params, token["access_token"], timeout, data, headers)
+        if status == 401 or result.get("code") == 401:
+            # the token was revoked or expired early; another caller may already have replaced it
+            if self.token is token or self.token is None:
+                token = await self.refresh()
+            else:
+                token = self.token
+            if data is not None and not isinstance(data, (bytes, bytearray)):
+                raise RuntimeError(f"Cloudreve {action} error: unauthorized, token refreshed")
+            status, result = await self._send(method, path, payload, params, token["access_token"], timeout, data, headers)
+        if status >= 500:
+            raise CloudreveUnavailable(f"Cloudreve {action} error: HTTP {status}")
+        _ensure_api_success(result, action)
+        return result
+
+    async def close(self) -> None:
+        if self._refresh_timer is not None:
+            self._refresh_timer.cancel()
+        if self._session is not None and not self._session.closed:
+            await self._session.close()
+
+
+client = CloudreveClient()
+
+
+def _check_enabled() -> None:
+    from WebStreamer.vars import Var
+    if not Var.USE_CLOUDEREVE:
+        raise ValueError("Cloudreve is disabled (USE_CLOUDEREVE is false)")
 
 
 async def login_and_cache_cloudreve_token(timeout: int = 15) -> Dict[str, Any]:
     """
-    Login to Cloudreve, cache the token object globally, and return it.
+    Login to Cloudreve, cache the token object, and return it.
     """
-    from WebStreamer.vars import Var
-    email = getattr(Var, "CLOUDEREVE_USERNAME", None) or getattr(
-        Var, "CLOUDEREVE_EMAIL", None)
-    api_url = getattr(Var, "CLOUDEREVE_API_URL", None)
-    password = getattr(Var, "CLOUDEREVE_PASSWORD", None)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    if not email or not password:
-        raise ValueError(
-            "CLOUDEREVE_USERNAME/EMAIL or CLOUDEREVE_PASSWORD is empty")
-
-    api_base = api_url.rstrip("/")
-    token_url = f"{api_base}/api/v4/session/token"
-    result = await _http_post_json(
-        token_url,
-        {"email": email, "password": password},
-        None,
-        timeout,
-    )
-    _ensure_api_success(result, "login")
-    token_obj = _extract_token_obj(result)
-
-    global TOKEN_OBJ
-    TOKEN_OBJ = token_obj
-    return token_obj
+    return await client.login()
 
 
 async def refresh_cloudreve_token(timeout: int = 15) -> Dict[str, Any]:
     """
-    Refresh Cloudreve session token and update global cache.
+    Refresh Cloudreve session token and update the cache; falls back to login.
     """
-    from WebStreamer.vars import Var
-    api_url = getattr(Var, "CLOUDEREVE_API_URL", None)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    api_base = api_url.rstrip("/")
-    refresh_url = f"{api_base}/api/v4/session/token/refresh"
-
-    global TOKEN_OBJ
-    refresh_token = TOKEN_OBJ.get("refresh_token") if TOKEN_OBJ else None
-    if not refresh_token:
-        # No refresh token available; fallback to login
-        return await login_and_cache_cloudreve_token(timeout)
-
-    result = await _http_post_json(
-        refresh_url,
-        {"refresh_token": refresh_token},
-        None,
-        timeout,
-    )
-    # 若刷新接口返回非0 code（失效/作废），立刻作废缓存并回退登录
-    try:
-        _ensure_api_success(result, "refresh")
-    except RuntimeError as e:
-        logging.warning(
-            "Cloudreve refresh token invalid; clearing cache and re-login: %s",
-            e,
-        )
-        TOKEN_OBJ = None
-        return await login_and_cache_cloudreve_token(timeout)
-
-    token_obj = _extract_token_obj(result)
-
-    old_refresh = TOKEN_OBJ.get("refresh_token") if TOKEN_OBJ else None
-    # 如果返回缺少 refresh_token（被作废/黑名单），直接清空缓存并回退登录
-    if not token_obj.get("refresh_token") and old_refresh:
-        logging.warning(
-            "Cloudreve refresh response missing refresh_token; clearing cache and re-login",
-        )
-        TOKEN_OBJ = None
-        return await login_and_cache_cloudreve_token(timeout)
-
-    TOKEN_OBJ = token_obj
-    return token_obj
+    return await client.refresh()
 
 
 async def get_cloudreve_access_token(timeout: int = 15) -> str:
     """
-    Convenience function: ensure login & cache, then return access_token.
+    Convenience function: return a valid access_token, logging in only when needed.
     """
-    token_obj = await login_and_cache_cloudreve_token(timeout)
+    token_obj = await client.ensure_token()
     return token_obj["access_token"]
 
 
@@ -179,38 +287,14 @@ def get_cloudreve_token_obj() -> Optional[Dict[str, Any]]:
     """
     Return the cached token object if available.
     """
-    return TOKEN_OBJ
+    return client.token
 
 
 async def ensure_valid_cloudreve_token(skew_seconds: int = 60, timeout: int = 15) -> Dict[str, Any]:
     """
     Ensure a valid token is cached; refresh or re-login if near/after expiry.
     """
-    global TOKEN_OBJ
-
-    if TOKEN_OBJ is None:
-        TOKEN_OBJ = await login_and_cache_cloudreve_token(timeout)
-        return TOKEN_OBJ
-
-    now = int(time.time())
-    access_expires = _to_epoch_sec(TOKEN_OBJ.get("access_expires"))
-    refresh_expires = _to_epoch_sec(TOKEN_OBJ.get("refresh_expires"))
-    refresh_token = TOKEN_OBJ.get("refresh_token")
-
-    need_refresh = False
-    if access_expires is not None:
-        need_refresh = now >= (access_expires - max(0, int(skew_seconds)))
-
-    if need_refresh:
-        if refresh_token and (refresh_expires is None or now < refresh_expires):
-            try:
-                TOKEN_OBJ = await refresh_cloudreve_token(timeout)
-                return TOKEN_OBJ
-            except Exception:
-                pass
-        TOKEN_OBJ = await login_and_cache_cloudreve_token(timeout)
-
-    return TOKEN_OBJ
+    return await client.ensure_token(skew_seconds)
 
 
 async def get_valid_cloudreve_access_token(skew_seconds: int = 60, timeout: int = 15) -> str:
@@ -220,37 +304,33 @@ async def get_valid_cloudreve_access_token(skew_seconds: int = 60, timeout: int
     token_obj = await ensure_valid_cloudreve_token(skew_seconds, timeout)
     return token_obj["access_token"]
 
+
+async def close_cloudreve_client() -> None:
+    await client.close()
+
 # 获取文件列表
 
 
-async def file_list(page_size: int = 20, uri: str = "cloudreve://my/", page: int = 0, timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
+async def file_list(page_size: int = 20, uri: str = "cloudreve://my/", page: int = 0, timeout: int = 15, skew_seconds: int = 60,
+                    page_token: Optional[str] = None) -> Dict[str, Any]:
     """
     List files in Cloudreve.
     URL: /api/v4/file
     Headers: Authorization: Bearer <access_token>
-    Query: {"page_size": 20, "uri": "cloudreve://my/", "page": 0}
+    Query: {"page_size": 20, "uri": "cloudreve://my/", "page": 0, "next_page_token": "..."}
+    Folders listed with cursor pagination return the next page's token in data.pagination.next_token.
     """
-    from WebStreamer.vars import Var
-    if not Var.USE_CLOUDEREVE:
-        raise ValueError("Cloudreve is disabled (USE_CLOUDEREVE is false)")
-    api_url = Var.CLOUDEREVE_API_URL
-    access_token = await get_valid_cloudreve_access_token(skew_seconds=skew_seconds, timeout=timeout)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    if not access_token:
-        raise ValueError("Cloudreve access_token is empty")
-
-    api_base = api_url.rstrip("/")
-    url = f"{api_base}/api/v4/file"
-    result = await _http_get_json(
-        url,
-        {"Authorization": f"Bearer {access_token}"},
-        timeout,
-        {"page_size": int(page_size), "uri": str(uri), "page": int(page)}
+    _check_enabled()
+    params = {"page_size": int(page_size), "uri": str(uri), "page": int(page)}
+    if page_token:
+        params["next_page_token"] = page_token
+    result = await client.request(
+        "GET", "/api/v4/file", "file_list",
+        params=params,
+        timeout=timeout, skew_seconds=skew_seconds,
     )
     logging.info(
         f"Cloudreve file list: uri={uri}, page={page}, page_size={page_size}")
-    _ensure_api_success(result, "file_list")
     return result
 
 # 分享文件
@@ -263,63 +343,172 @@ async def share_file(uri: str = "", timeout: int = 15, skew_seconds: int = 60) -
     Headers: Authorization: Bearer <access_token>
     Body: {"uri": "cloudreve://my/file.txt"}
     """
-    from WebStreamer.vars import Var
-    if not Var.USE_CLOUDEREVE:
-        raise ValueError("Cloudreve is disabled (USE_CLOUDEREVE is false)")
-    api_url = Var.CLOUDEREVE_API_URL
-    access_token = await get_valid_cloudreve_access_token(skew_seconds=skew_seconds, timeout=timeout)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    if not access_token:
-        raise ValueError("Cloudreve access_token is empty")
+    _check_enabled()
     if not uri:
         raise ValueError("Share file uri is empty")
-
-    api_base = api_url.rstrip("/")
-    url = f"{api_base}/api/v4/share"
-    result = await _http_post_json(
-        url,
-        {"uri": str(uri)},
-        {"Authorization": f"Bearer {access_token}"},
-        timeout,
+    result = await client.request(
+        "POST", "/api/v4/share", "share_file", {"uri": str(uri)},
+        timeout=timeout, skew_seconds=skew_seconds,
     )
     logging.info(f"Cloudreve share file: uri={uri}")
-    _ensure_api_success(result, "share_file")
     return result
 
+# 获取文件直链
+
+
+async def file_url(uris: Any, timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
+    """
+    Create direct download URLs for files in Cloudreve.
+    URL: /api/v4/file/url
+    Headers: Authorization: Bearer <access_token>
+    Body: {"uris": ["cloudreve://my/file.txt"], "download": false}
+    """
+    _check_enabled()
+    uri_list = [str(u) for u in uris] if isinstance(uris, (list, tuple)) else [str(uris)]
+    if not uri_list:
+        raise ValueError("File url uris is empty")
+    result = await client.request(
+        "POST", "/api/v4/file/url", "file_url", {"uris": uri_list, "download": False},
+        timeout=timeout, skew_seconds=skew_seconds,
+    )
+    logging.info(f"Cloudreve file url: uris={uri_list}")
+    return result
+
+
+async def probe_url(url: str, timeout: int = 10) -> bool:
+    """
+    Checks that a URL serves content by reading its first byte.
+    """
+    try:
+        async with client.session().get(
+            url, headers={"Range": "bytes=0-0"}, timeout=aiohttp.ClientTimeout(total=timeout)
+        ) as resp:
+            return resp.status in (200, 206)
+    except (aiohttp.ClientError, asyncio.TimeoutError):
+        return False
+
+# 上传会话（直接推送文件到云盘）
+
+
+async def create_upload_session(uri: str, size: int, policy_id: str, mime_type: Optional[str] = None,
+                                timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
+    """
+    Create an upload session.
+    URL: PUT /api/v4/file/upload
+    Headers: Authorization: Bearer <access_token>
+    Body: {"uri": "cloudreve://my/file.txt", "size": 1024, "policy_id": "xxx", "last_modified": ms, "mime_type": "..."}
+    Returns data with session_id, chunk_size, expires and, for storage that takes uploads directly, upload_urls.
+    """
+    _check_enabled()
+    payload = {"uri": str(uri), "size": int(size), "policy_id": policy_id, "last_modified": int(time.time() * 1000)}
+    if mime_type:
+        payload["mime_type"] = mime_type
+    result = await client.request(
+        "PUT", "/api/v4/file/upload", "create_upload_session", payload,
+        timeout=timeout, skew_seconds=skew_seconds,
+    )
+    logging.info(f"Cloudreve upload session: uri={uri}, size={size}")
+    return result
+
+
+async def upload_chunk(session_id: str, index: int, body: Any, length: int,
+                       timeout: int = 600, skew_seconds: int = 60) -> Dict[str, Any]:
+    """
+    Upload one chunk of an upload session; the body may be an async iterator of bytes.
+    URL: POST /api/v4/file/upload/{session_id}/{index}
+    Headers: Authorization: Bearer <access_token>, Content-Length
+    """
+    _check_enabled()
+    return await client.request(
+        "POST", f"/api/v4/file/upload/{session_id}/{int(index)}", "upload_chunk",
+        timeout=timeout, skew_seconds=skew_seconds, data=body,
+        headers={"Content-Type": "application/octet-stream", "Content-Length": str(int(length))},
+    )
+
+
+async def delete_upload_session(session_id: str, uri: str, timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
+    """
+    Cancel an upload session.
+    URL: DELETE /api/v4/file/upload
+    Body: {"id": session_id, "uri": "cloudreve://my/file.txt"}
+    """
+    _check_enabled()
+    return await client.request(
+        "DELETE", "/api/v4/file/upload", "delete_upload_session", {"id": session_id, "uri": str(uri)},
+        timeout=timeout, skew_seconds=skew_seconds,
+    )
+
 # 获取远程下载任务列表
 
 
-async def remote_list(category: str = "general", page_size: int = 20, timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
+async def remote_list(category: str = "general", page_size: int = 20, timeout: int = 15, skew_seconds: int = 60,
+                      page_token: Optional[str] = None) -> Dict[str, Any]:
     """
     List remote download tasks.
     URL: /api/v4/workflow
     Headers: Authorization: Bearer <access_token>
-    Body: {"uri": 20, "category": "general|downloading|downloaded"}
+    Query: {"page_size": 20, "category": "general|downloading|downloaded", "next_page_token": "..."}
+    The next page's token is in data.pagination.next_token (see next_page_token).
     """
-    from WebStreamer.vars import Var
-    if not Var.USE_CLOUDEREVE:
-        raise ValueError("Cloudreve is disabled (USE_CLOUDEREVE is false)")
-    api_url = Var.CLOUDEREVE_API_URL
-    access_token = await get_valid_cloudreve_access_token(skew_seconds=skew_seconds, timeout=timeout)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    if not access_token:
-        raise ValueError("Cloudreve access_token is empty")
-
-    api_base = api_url.rstrip("/")
-    url = f"{api_base}/api/v4/workflow"
-    result = await _http_get_json(
-        url,
-        {"Authorization": f"Bearer {access_token}"},
-        timeout,
-        {"page_size": int(page_size), "category": str(category)}
+    _check_enabled()
+    params = {"page_size": int(page_size), "category": str(category)}
+    if page_token:
+        params["next_page_token"] = page_token
+    result = await client.request(
+        "GET", "/api/v4/workflow", "remote_list",
+        params=params,
+        timeout=timeout, skew_seconds=skew_seconds,
     )
     logging.info(
         f"Cloudreve remote list: category={category}, page_size={page_size}")
-    _ensure_api_success(result, "remote_list")
     return result
 
+# 解析下载任务
+
+
+def task_list(result: Dict[str, Any]) -> list:
+    """
+    从任务列表结果中取出任务；兼容完整响应（含 `data.tasks`）或仅 `data`（含 `tasks`）。
+    """
+    if not result:
+        return []
+    if 'tasks' in result:
+        return result.get('tasks') or []
+    return (result.get('data') or {}).get('tasks') or []
+
+
+def next_page_token(result: Dict[str, Any]) -> Optional[str]:
+    data = result if ('tasks' in result or 'files' in result) else (result.get('data') or {})
+    return (data.get('pagination') or {}).get('next_token') or None
+
+
+def parse_download_task(item: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    把一个下载任务整理为 `{"src", "dst", "name", "status", "progress", "task_status"}`。
+    `status` 为下载器状态，`task_status` 为 Cloudreve 任务本身的状态（如 error、canceled）。
+    """
+    props = (item.get('summary') or {}).get('props') or {}
+    download_props = props.get('download') or {}
+    if not isinstance(download_props, dict):
+        download_props = {}
+
+    files = download_props.get('files') or []
+    progress = None
+    if isinstance(files, list):
+        if files:
+            progress = files[0].get('progress', 0)
+    elif isinstance(files, dict):
+        progress = files.get('progress', 0)
+
+    return {
+        'src': props.get('src_str'),
+        'dst': props.get('dst'),
+        'name': download_props.get('name', '未知'),
+        'status': download_props.get('state', 'downloading'),
+        'progress': progress,
+        'task_status': item.get('status'),
+    }
+
 # 搜索下载任务（纯本地搜索，不触发额外网络请求）
 
 
@@ -328,103 +517,51 @@ async def search_download_by_url(result: Dict[str, Any] = {}, url: str = "") ->
     在给定的 Cloudreve 任务列表结果中，按源 URL 搜索对应任务。
     - 兼容两种数据形态：传入完整响应（含 `data.tasks`）或仅传入 `data`（含 `tasks`）。
     - 不进行额外的网络请求；若未找到，返回 None。
-    - 保持原返回结构：`{"name", "status", "progress"}`。
+    - 返回结构见 `parse_download_task`。
     """
-    try:
-        if not result or not url:
-            logging.warning(
-                "search_download_by_url: empty input (result or url)")
-            return None
-        # 兼容完整响应或仅 data 字段
-        if 'tasks' in result:
-            tasks = result.get('tasks') or []
-        else:
-            tasks = (result.get('data', {}).get('tasks') or [])
-        if len(tasks) == 0:
-            return None
-        for item in tasks:
-            try:
-                src_str = (
-                    item.get('summary', {})
-                    .get('props', {})
-                    .get('src_str')
-                )
-                if src_str == url:
-                    logging.info(f"Cloudreve task: src_str={src_str} matches")
-                    download_props = (
-                        item.get('summary', {})
-                        .get('props', {})
-                        .get('download') or {}
-                    )
-                    if not isinstance(download_props, dict):
-                        download_props = {}
-
-                    files = download_props.get('files') or []
-                    progress = None
-
-                    if isinstance(files, list):
-                        if files:
-                            progress = files[0].get('progress', 0)
-                    elif isinstance(files, dict):
-                        progress = files.get('progress', 0)
-
-                    return {
-                        'name': download_props.get('name', '未知'),
-                        'status': download_props.get('state', 'downloading'),
-                        'progress': progress,
-                    }
-            except Exception as e:
-                logging.exception(
-                    f"Cloudreve task: src_str={src_str} search failed: {e}")
-                continue
-        # 未找到即返回 None，由调用方决定是否在其他 category 继续搜索
-        return None
-    except Exception as e:
-        logging.exception("search_download_by_url failed: %s", e)
+    if not result or not url:
+        logging.warning(
+            "search_download_by_url: empty input (result or url)")
         return None
+    for item in task_list(result):
+        try:
+            task = parse_download_task(item)
+        except Exception as e:
+            logging.exception(f"Cloudreve task parse failed: {e}")
+            continue
+        if task['src'] == url:
+            logging.info(f"Cloudreve task: src_str={url} matches")
+            return task
+    # 未找到即返回 None，由调用方决定是否在其他 category 继续搜索
+    return None
 
 # 创建远程下载任务
 
 
 async def remote_download(src: Any, timeout: int = 15, skew_seconds: int = 60) -> Dict[str, Any]:
     """
-    Create a remote download task.
+    Create remote download tasks, one per source URL, in a single request.
 
     Headers: Authorization: Bearer <access_token>
-    Body: {"dst": dst, "src": [string(url)]}
+    Body: {"dst": dst, "src": [string(url), ...]}
     """
     from WebStreamer.vars import Var
-    if not Var.USE_CLOUDEREVE:
-        raise ValueError("Cloudreve is disabled (USE_CLOUDEREVE is false)")
+    _check_enabled()
     dst = Var.CLOUDEREVE_DOWNLOAD_PATH
-    api_url = Var.CLOUDEREVE_API_URL
-    access_token = await get_valid_cloudreve_access_token(skew_seconds=skew_seconds, timeout=timeout)
-    if not api_url:
-        raise ValueError("CLOUDEREVE_API_URL is empty")
-    if not access_token:
-        raise ValueError("Cloudreve access_token is empty")
     if not dst:
         raise ValueError("Remote download dst is empty")
 
-    # Normalize src to a list of one string as required
+    # Normalize src to a list of strings
     if isinstance(src, (list, tuple)):
         if len(src) == 0:
             raise ValueError("Remote download src list is empty")
-        url_list = [str(src[0])]
+        url_list = [str(u) for u in src]
     else:
         url_list = [str(src)]
 
-    api_base = api_url.rstrip("/")
-    url = f"{api_base}/api/v4/workflow/download"
-    result = await _http_post_json(
-        url,
-        {"dst": dst, "src": url_list},
-        {"Authorization": f"Bearer {access_token}"},
-        timeout,
+    result = await client.request(
+        "POST", "/api/v4/workflow/download", "remote_download", {"dst": dst, "src": url_list},
+        timeout=timeout, skew_seconds=skew_seconds,
     )
-    logging.info(f"Cloudreve remote download response: {url_list}")
-    code = _ensure_api_success(result, "remote_download")
-    if code != 0:
-        await refresh_cloudreve_token(timeout)
-        result = await remote_download(src, timeout, skew_seconds)
+    logging.info(f"Cloudreve remote download response: {len(url_list)} urls")
     return result
@@ -0,0 +1,141 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import time
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Dict, List, Optional, Tuple
+from .cloudreve import file_list, next_page_token
+
+logger = logging.getLogger("cloudreve_files")
+
+# entries requested from Cloudreve per page while listing a folder
+LIST_PAGE_SIZE = 100
+# a folder listing is reused for this many seconds, unless a download into it completes first
+LISTING_TTL = 60
+LISTING_CACHE_SIZE = 16
+
+
+def folder_key(uri: str) -> str:
+    return uri.rstrip("/")
+
+
+def _follow_up(result: Dict, page: int, page_size: int) -> Optional[Tuple[int, Optional[str]]]:
+    """
+    Returns the (page, token) that lists the rest of the folder, or None at the end.
+    Cloudreve pages some folders by cursor and others by page number.
+    """
+    data = result.get("data") or {}
+    token = next_page_token(result)
+    if token:
+        return page + 1, token
+    pagination = data.get("pagination") or {}
+    if pagination.get("is_cursor"):
+        return None
+    total = pagination.get("total_items")
+    if total is not None:
+        return (page + 1, None) if (page + 1) * page_size < int(total) else None
+    return (page + 1, None) if len(data.get("files") or []) >= page_size else None
+
+
+async def iter_file_pages(uri: str, page_size: int = LIST_PAGE_SIZE) -> AsyncIterator[List[Dict]]:
+    """
+    Yields a Cloudreve folder one page of entries at a time.
+    The next page is already being requested while the caller handles the current one.
+    """
+    request = asyncio.ensure_future(file_list(page_size=page_size, uri=uri, page=0))
+    try:
+        page = 0
+        while request is not None:
+            result = await request
+            request = None
+            follow_up = _follow_up(result, page, page_size)
+            if follow_up is not None:
+                page, token = follow_up
+                request = asyncio.ensure_future(file_list(page_size=page_size, uri=uri, page=page, page_token=token))
+            yield (result.get("data") or {}).get("files") or []
+    finally:
+        if request is not None:
+            request.cancel()
+
+
+class Listing:
+    def __init__(self, uri: str):
+        """The entries of one folder read so far, and the iterator that reads the rest."""
+        self.uri = uri
+        self.entries: List[Dict] = []
+        self.complete = False
+        self.expires = time.monotonic() + LISTING_TTL
+        self.lock = asyncio.Lock()
+        self._pages = iter_file_pages(uri)
+
+    async def fill(self, count: int) -> None:
+        async with self.lock:
+            while len(self.entries) < count and not self.complete:
+                try:
+                    self.entries.extend(await self._pages.__anext__())
+                except StopAsyncIteration:
+                    self.complete = True
+
+    async def close(self) -> None:
+        try:
+            await self._pages.aclose()
+        except Exception:
+            pass
+
+
+class FileBrowser:
+    def __init__(self, size: int):
+        """Cached Cloudreve folder listings for browsing from the bot.
+        functions:
+            page: one page of a folder's entries, and whether there are more.
+            invalidate: drops a folder's listing, e.g. once a download into it completes.
+
+        A listing is read lazily, a Cloudreve page ahead of what has been shown, and
+        reused for LISTING_TTL seconds, so paging back and forth doesn't call Cloudreve.
+        """
+        self.size = size
+        self.listings: "OrderedDict[str, Listing]" = OrderedDict()
+
+    async def page(self, uri: str, page: int, per_page: int) -> Tuple[List[Dict], bool]:
+        listing = self._listing(uri)
+        start = page * per_page
+        try:
+            # one entry past the page tells whether there is a next one
+            await listing.fill(start + per_page + 1)
+        except Exception:
+            # a listing cut short by an error isn't kept as if the folder ended there
+            if self.listings.get(folder_key(uri)) is listing:
+                self.invalidate(uri)
+            raise
+        entries = listing.entries[start:start + per_page]
+        return entries, len(listing.entries) > start + per_page
+
+    def invalidate(self, uri: Optional[str] = None) -> None:
+        """
+        Drops the listing of one folder, or of every folder when uri is None.
+        """
+        keys = list(self.listings) if uri is None else [folder_key(uri)]
+        for key in keys:
+            listing = self.listings.pop(key, None)
+            if listing is not None:
+                asyncio.ensure_future(listing.close())
+                logger.debug(f"Dropped Cloudreve listing of {key}")
+
+    def _listing(self, uri: str) -> Listing:
+        key = folder_key(uri)
+        listing = self.listings.get(key)
+        if listing is not None and listing.expires <= time.monotonic():
+            self.invalidate(key)
+            listing = None
+        if listing is None:
+            listing = self.listings[key] = Listing(uri)
+        self.listings.move_to_end(key)
+        while len(self.listings) > self.size:
+            _, dropped = self.listings.popitem(last=False)
+            asyncio.ensure_future(dropped.close())
+        return listing
+
+
+file_browser = FileBrowser(LISTING_CACHE_SIZE)
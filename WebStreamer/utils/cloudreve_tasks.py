@@ -0,0 +1,301 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import asyncio
+import logging
+import aiohttp
+from typing import AsyncIterator, Dict, List, Optional, Set, Tuple
+from .cloudreve import (
+    remote_download, remote_list, task_list, next_page_token, parse_download_task,
+    CloudreveAPIError, CloudreveUnavailable,
+)
+from .cloudreve_files import file_browser
+
+logger = logging.getLogger("cloudreve_tasks")
+
+# seconds between polls while tasks are moving; doubles up to the maximum while nothing changes
+MIN_POLL_INTERVAL = 2
+MAX_POLL_INTERVAL = 30
+LIST_PAGE_SIZE = 100
+# pages of finished tasks read per poll while looking for watched downloads
+MAX_FINISHED_PAGES = 5
+# a watcher gives up after this long without any news about its download
+WATCH_IDLE_TIMEOUT = 30 * 60
+
+FAILED_TASK_STATUSES = ("error", "canceled")
+
+# URLs submitted within this many seconds of each other go out in one request
+SUBMIT_WINDOW = 0.5
+SUBMIT_BATCH_SIZE = 50
+SUBMIT_CONCURRENCY = 2
+# network failures, 5xx and non-JSON answers are retried with exponential backoff: 1s, 2s, 4s...
+SUBMIT_RETRIES = 4
+SUBMIT_BACKOFF = 1
+
+
+def task_state(task: Dict, finished: bool) -> str:
+    if task.get("task_status") in FAILED_TASK_STATUSES:
+        return "failed"
+    if finished or task.get("status") == "completed" or task.get("task_status") == "completed":
+        return "completed"
+    return "downloading"
+
+
+def is_done(task: Dict) -> bool:
+    return task["state"] in ("completed", "failed")
+
+
+class TaskPoller:
+    def __init__(self):
+        """One poller for every Cloudreve remote download being watched.
+        functions:
+            watch: yields a download's state each time it changes, until it completes or fails.
+            poll: pages through the task lists once and notifies the watchers.
+
+        All watchers share one listing per poll and look their task up by source URL
+        in a dict, instead of each listing the tasks on its own; the poller runs only
+        while something is watched and slows down while nothing changes.
+        """
+        self.tasks: Dict[str, Dict] = {}
+        self.watchers: Dict[str, Set[asyncio.Queue]] = {}
+        self.interval = MIN_POLL_INTERVAL
+        self._runner: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+
+    async def watch(self, src: str) -> AsyncIterator[Dict]:
+        queue: asyncio.Queue = asyncio.Queue()
+        self.watchers.setdefault(src, set()).add(queue)
+        if src in self.tasks:
+            # the last poll already saw it; later polls only report changes
+            queue.put_nowait(self.tasks[src])
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self.interval = MIN_POLL_INTERVAL
+        self._wake.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+        try:
+            while True:
+                try:
+                    task = await asyncio.wait_for(queue.get(), WATCH_IDLE_TIMEOUT)
+                except asyncio.TimeoutError:
+                    return
+                yield task
+                if is_done(task):
+                    return
+        finally:
+            queues = self.watchers.get(src)
+            if queues is not None:
+                queues.discard(queue)
+                if not queues:
+                    del self.watchers[src]
+
+    async def _run(self) -> None:
+        while self.watchers:
+            try:
+                changed = await self.poll()
+            except Exception as e:
+                logger.warning(f"Polling Cloudreve tasks failed: {e}")
+                changed = False
+            self.interval = MIN_POLL_INTERVAL if changed else min(self.interval * 2, MAX_POLL_INTERVAL)
+            self._wake.clear()
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.interval)
+            except asyncio.TimeoutError:
+                pass
+        logger.debug("No Cloudreve downloads watched, poller stopped")
+
+    async def _list(self, category: str, found: Dict[str, Dict], wanted: Optional[Set[str]] = None,
+                    max_pages: Optional[int] = None) -> None:
+        page_token = None
+        pages = 0
+        while True:
+            result = await remote_list(category=category, page_size=LIST_PAGE_SIZE, page_token=page_token)
+            pages += 1
+            for item in task_list(result):
+                task = parse_download_task(item)
+                src = task["src"]
+                if src and src not in found:
+                    task["state"] = task_state(task, category == "downloaded")
+                    found[src] = task
+                    if wanted is not None:
+                        wanted.discard(src)
+            page_token = next_page_token(result)
+            if not page_token or (wanted is not None and not wanted) or (max_pages and pages >= max_pages):
+                return
+
+    async def poll(self) -> bool:
+        """
+        Lists every running download, then as many finished ones as it takes to find the
+        watched downloads that aren't running anymore. Returns whether a watched download changed.
+        """
+        found: Dict[str, Dict] = {}
+        await self._list("downloading", found)
+        missing = {src for src in self.watchers if src not in found}
+        if missing:
+            # finished tasks are listed newest first, so a download that just ended is on the first page
+            await self._list("downloaded", found, missing, MAX_FINISHED_PAGES)
+        previous, self.tasks = self.tasks, found
+        changed = False
+        for src, queues in list(self.watchers.items()):
+            task = found.get(src)
+            if task is None or self._signature(previous.get(src)) == self._signature(task):
+                continue
+            changed = True
+            if task["state"] == "completed" and task.get("dst"):
+                # the folder it landed in has a new file
+                file_browser.invalidate(task["dst"])
+            for queue in queues:
+                queue.put_nowait(task)
+        return changed
+
+    @staticmethod
+    def _signature(task: Optional[Dict]):
+        if task is None:
+            return None
+        try:
+            progress = round(float(task.get("progress") or 0), 3)
+        except (TypeError, ValueError):
+            progress = 0
+        return task["state"], progress, task.get("name")
+
+
+class SubmitQueue:
+    def __init__(self):
+        """Gathers remote download submissions into multi-src workflow requests.
+        functions:
+            submit: queues one URL and waits for its own result.
+            submit_many: queues many URLs at once, e.g. from a bulk command.
+
+        Each URL's future resolves with the task Cloudreve created for it, or fails with the
+        error that rejected it. A batch the API refuses with an error code is split in halves and
+        resubmitted, so one bad link doesn't fail the others; when both halves are refused with
+        the same code the whole request is at fault, and every URL fails with it.
+        """
+        self.pending: Dict[str, asyncio.Future] = {}
+        self._flusher: Optional[asyncio.Task] = None
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._full: Optional[asyncio.Event] = None
+        # batches being sent; asyncio only keeps weak references to tasks
+        self._sending: Set[asyncio.Task] = set()
+
+    async def submit(self, url: str) -> Dict:
+        return await asyncio.shield(self._enqueue(url))
+
+    async def submit_many(self, urls: List[str]) -> List[Tuple[str, Optional[Dict], Optional[Exception]]]:
+        """
+        Returns (url, task, error) for every URL, in order.
+        """
+        futures = [self._enqueue(url) for url in urls]
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        return [
+            (url, None, result) if isinstance(result, Exception) else (url, result, None)
+            for url, result in zip(urls, results)
+        ]
+
+    def _enqueue(self, url: str) -> asyncio.Future:
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(SUBMIT_CONCURRENCY)
+            self._full = asyncio.Event()
+        future = self.pending.get(url)
+        if future is None:
+            # the same link saved twice in a window becomes one task
+            future = self.pending[url] = asyncio.get_running_loop().create_future()
+        if len(self.pending) >= SUBMIT_BATCH_SIZE:
+            self._full.set()
+        if self._flusher is None or self._flusher.done():
+            self._flusher = asyncio.create_task(self._flush_later())
+        return future
+
+    async def _flush_later(self) -> None:
+        while self.pending:
+            try:
+                await asyncio.wait_for(self._full.wait(), SUBMIT_WINDOW)
+            except asyncio.TimeoutError:
+                pass
+            self._full.clear()
+            batch = dict(list(self.pending.items())[:SUBMIT_BATCH_SIZE])
+            for url in batch:
+                del self.pending[url]
+            if len(self.pending) >= SUBMIT_BATCH_SIZE:
+                self._full.set()
+            task = asyncio.create_task(self._send(batch))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+
+    async def _send(self, batch: Dict[str, asyncio.Future]) -> None:
+        async with self._semaphore:
+            await self._submit_batch(batch)
+
+    async def _submit_batch(self, batch: Dict[str, asyncio.Future]) -> None:
+        error = await self._attempt(batch)
+        if error is not None:
+            await self._split(batch, error)
+
+    async def _attempt(self, batch: Dict[str, asyncio.Future]) -> Optional[CloudreveAPIError]:
+        """
+        Submits a batch once; returns the API error that refused it, with its futures still pending.
+        """
+        try:
+            self._resolve(batch, await self._submit_with_retry(list(batch)))
+        except CloudreveAPIError as e:
+            return e
+        except Exception as e:
+            self._fail(batch, e)
+        return None
+
+    async def _split(self, batch: Dict[str, asyncio.Future], error: CloudreveAPIError) -> None:
+        # split the batch until the rejected links are isolated
+        urls = list(batch)
+        if len(urls) == 1:
+            self._fail(batch, error)
+            return
+        logger.warning(f"Cloudreve rejected a batch of {len(urls)} downloads, splitting it: {error}")
+        half = len(urls) // 2
+        halves = [{url: batch[url] for url in urls[:half]}, {url: batch[url] for url in urls[half:]}]
+        errors = [await self._attempt(part) for part in halves]
+        if all(e is not None and e.code == error.code for e in errors):
+            # both halves refused alike: the request itself is rejected (destination, quota,
+            # permission), not one of its links, and splitting further only repeats the call
+            self._fail(batch, error)
+            return
+        for part, part_error in zip(halves, errors):
+            if part_error is not None:
+                await self._split(part, part_error)
+
+    @staticmethod
+    async def _submit_with_retry(urls: List[str]) -> List[Dict]:
+        for attempt in range(SUBMIT_RETRIES + 1):
+            try:
+                result = await remote_download(urls)
+                data = result.get("data")
+                return data if isinstance(data, list) else [data] * len(urls)
+            except (aiohttp.ClientError, asyncio.TimeoutError, CloudreveUnavailable) as e:
+                if attempt == SUBMIT_RETRIES:
+                    raise
+                delay = SUBMIT_BACKOFF * 2 ** attempt
+                logger.warning(f"Submitting {len(urls)} downloads failed ({e}), retrying in {delay}s")
+                await asyncio.sleep(delay)
+
+    @staticmethod
+    def _resolve(batch: Dict[str, asyncio.Future], tasks: List[Dict]) -> None:
+        by_src = {}
+        for task in tasks:
+            if isinstance(task, dict):
+                src = parse_download_task(task)["src"]
+                if src:
+                    by_src[src] = task
+        for i, (url, future) in enumerate(batch.items()):
+            task = by_src.get(url) or (tasks[i] if len(tasks) == len(batch) else None) or {}
+            if not future.done():
+                future.set_result(task)
+
+    @staticmethod
+    def _fail(batch: Dict[str, asyncio.Future], error: Exception) -> None:
+        for future in batch.values():
+            if not future.done():
+                future.set_exception(error)
+
+
+task_poller = TaskPoller()
+submit_queue = SubmitQueue()
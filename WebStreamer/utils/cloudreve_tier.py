@@ -0,0 +1,146 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import re
+import json
+import time
+import asyncio
+import logging
+import aiohttp
+from typing import Dict, Optional, Tuple
+from urllib.parse import quote, urlsplit, parse_qs
+from WebStreamer.vars import Var
+from .cloudreve import file_url, probe_url, _to_epoch_sec
+
+logger = logging.getLogger("cloudreve_tier")
+
+# direct URLs are dropped this long before Cloudreve says they expire
+URL_EXPIRY_SKEW = 60
+# lifetime assumed for a direct URL when Cloudreve doesn't report one
+DEFAULT_URL_LIFETIME = 600
+# after a failed URL request or probe, the file is served from Telegram for this long
+FAILURE_BACKOFF = 300
+
+
+def parse_stream_link(stream_link: str) -> Optional[Tuple[int, str]]:
+    """
+    Returns (message_id, hash) of a link made by build_links, or None for anything else.
+    """
+    parts = urlsplit(stream_link)
+    match = re.search(r"(?:^|/)(\d+)/[^/]+$", parts.path)
+    secure_hash = parse_qs(parts.query).get("hash", [None])[0]
+    if not match or not secure_hash:
+        return None
+    return int(match.group(1)), secure_hash
+
+
+class CloudreveTier:
+    def __init__(self, path: str):
+        """Remembers which BIN_CHANNEL files have a finished copy in Cloudreve.
+        attributes:
+            path: the JSON file the saved copies are persisted to.
+
+        functions:
+            record_saved: records a finished remote download of a stream link.
+            record_uri: records a copy pushed to a known Cloudreve uri.
+            redirect_url: a probed direct Cloudreve URL for a saved file, or None to serve it from Telegram;
+                concurrent calls for one file share a single lookup.
+            forget: drops a saved copy.
+
+        Direct URLs are cached until shortly before they expire; a URL that can't be
+        created or doesn't answer puts the file back on Telegram for a while.
+        """
+        self.path = path
+        self.saved: Dict[int, Dict] = self._load()
+        self.urls: Dict[int, Tuple[str, float]] = {}
+        self.failed_until: Dict[int, float] = {}
+        # URL lookups in flight, so concurrent requests for a hot file share one
+        self._lookups: Dict[int, asyncio.Future] = {}
+
+    def is_saved(self, message_id: int, secure_hash: Optional[str]) -> bool:
+        entry = self.saved.get(message_id)
+        return entry is not None and entry["hash"] == secure_hash
+
+    def record_saved(self, stream_link: str, name: str, dst: Optional[str] = None) -> bool:
+        parsed = parse_stream_link(stream_link)
+        if parsed is None or not name:
+            return False
+        message_id, secure_hash = parsed
+        folder = (dst or Var.CLOUDEREVE_DOWNLOAD_PATH).rstrip("/")
+        self.record_uri(message_id, secure_hash, f"{folder}/{quote(name)}", name)
+        return True
+
+    def record_uri(self, message_id: int, secure_hash: str, uri: str, name: str) -> None:
+        if self.saved.get(message_id, {}).get("uri") == uri:
+            return
+        self.saved[message_id] = {"hash": secure_hash, "uri": uri, "name": name}
+        self.urls.pop(message_id, None)
+        self._save()
+        logger.info(f"Message {message_id} has a Cloudreve copy at {uri}")
+
+    def forget(self, message_id: int) -> None:
+        self.urls.pop(message_id, None)
+        self.failed_until.pop(message_id, None)
+        if self.saved.pop(message_id, None) is not None:
+            self._save()
+
+    async def redirect_url(self, message_id: int) -> Optional[str]:
+        entry = self.saved.get(message_id)
+        if entry is None:
+            return None
+        now = time.time()
+        if self.failed_until.get(message_id, 0) > now:
+            return None
+        cached = self.urls.get(message_id)
+        if cached and cached[1] > now:
+            return cached[0]
+        lookup = self._lookups.get(message_id)
+        if lookup is None or lookup.done():
+            lookup = self._lookups[message_id] = asyncio.ensure_future(self._lookup(message_id, entry))
+            lookup.add_done_callback(
+                lambda done: self._lookups.pop(message_id) if self._lookups.get(message_id) is done else None
+            )
+        return await asyncio.shield(lookup)
+
+    async def _lookup(self, message_id: int, entry: Dict) -> Optional[str]:
+        now = time.time()
+        try:
+            result = await file_url(entry["uri"])
+            data = result.get("data") or {}
+            url = ((data.get("urls") or [{}])[0]).get("url")
+            expires = _to_epoch_sec(data.get("expires")) or now + DEFAULT_URL_LIFETIME
+        except (ValueError, RuntimeError, aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.warning(f"Couldn't get a Cloudreve URL for message {message_id}: {e}")
+            url = None
+        if not url or not await probe_url(url):
+            self.urls.pop(message_id, None)
+            self.failed_until[message_id] = now + FAILURE_BACKOFF
+            logger.warning(f"Cloudreve copy of message {message_id} unavailable, serving it from Telegram")
+            return None
+        self.failed_until.pop(message_id, None)
+        self.urls[message_id] = (url, expires - URL_EXPIRY_SKEW)
+        return url
+
+    def _load(self) -> Dict[int, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {int(message_id): entry for message_id, entry in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError):
+            logger.warning(f"Ignoring unreadable Cloudreve tier file {self.path}", exc_info=True)
+            return {}
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(message_id): entry for message_id, entry in self.saved.items()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning(f"Couldn't store Cloudreve tier file {self.path}", exc_info=True)
+
+
+cloudreve_tier = CloudreveTier(os.path.join(Var.DATA_DIR, "cloudreve_tier.json"))
@@ -0,0 +1,277 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import json
+import time
+import asyncio
+import logging
+from collections import deque
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Optional
+from urllib.parse import quote
+from pyrogram.file_id import FileId
+from WebStreamer.vars import Var
+from WebStreamer.bot import multi_clients, work_loads, draining
+from . import health
+from .custom_dl import get_streamer, STREAM_CHUNK_SIZE
+from .file_properties import get_hash, get_name
+from .cloudreve import file_list, create_upload_session, upload_chunk, delete_upload_session, _to_epoch_sec
+from .cloudreve_tier import cloudreve_tier
+from .cloudreve_files import file_browser
+
+logger = logging.getLogger("cloudreve_upload")
+
+# Telegram parts fetched ahead of the part being sent, per slice
+PREFETCH_PARTS = 2
+CHUNK_RETRIES = 3
+# sessions that expire sooner than this are recreated rather than resumed
+SESSION_EXPIRY_SKEW = 300
+
+# progress(uploaded bytes, total bytes)
+ProgressCallback = Callable[[int, int], Awaitable[None]]
+
+
+class PushError(Exception):
+    pass
+
+
+class UploadSessions:
+    def __init__(self, path: str):
+        """Cloudreve upload sessions in progress, kept on disk so an interrupted push can resume.
+        attributes:
+            path: the JSON file the sessions are persisted to.
+
+        Each entry is keyed by the BIN_CHANNEL message id and holds the session id, its
+        chunk size, expiry and the indexes of the chunks Cloudreve already has.
+        """
+        self.path = path
+        self.sessions: Dict[int, Dict] = self._load()
+
+    def get(self, message_id: int) -> Optional[Dict]:
+        return self.sessions.get(message_id)
+
+    def put(self, message_id: int, session: Dict) -> None:
+        self.sessions[message_id] = session
+        self._save()
+
+    def chunk_done(self, message_id: int, index: int) -> None:
+        session = self.sessions.get(message_id)
+        if session is not None and index not in session["done"]:
+            session["done"].append(index)
+            self._save()
+
+    def drop(self, message_id: int) -> None:
+        if self.sessions.pop(message_id, None) is not None:
+            self._save()
+
+    def _load(self) -> Dict[int, Dict]:
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return {int(message_id): session for message_id, session in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError):
+            logger.warning(f"Ignoring unreadable upload sessions file {self.path}", exc_info=True)
+            return {}
+
+    def _save(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            tmp_path = self.path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(message_id): session for message_id, session in self.sessions.items()}, f)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            logger.warning(f"Couldn't store upload sessions file {self.path}", exc_info=True)
+
+
+upload_sessions = UploadSessions(os.path.join(Var.DATA_DIR, "cloudreve_uploads.json"))
+_policy_ids: Dict[str, str] = {}
+# pushes in progress, so a second save of the same file joins the first
+_pushes: Dict[int, asyncio.Task] = {}
+# progress callbacks of every caller waiting on a push
+_watchers: Dict[int, List[ProgressCallback]] = {}
+
+
+async def iter_range(index: int, file_id: FileId, start: int, end: int) -> AsyncIterator[bytes]:
+    """
+    Yields bytes start..end-1 of a file through one client, a few Telegram parts ahead.
+    Memory stays at PREFETCH_PARTS parts whatever the size of the range.
+    """
+    tg_connect = get_streamer(index)
+    offset = start - start % STREAM_CHUNK_SIZE
+    pending = deque()
+    next_offset = offset
+
+    def top_up():
+        nonlocal next_offset
+        while len(pending) < PREFETCH_PARTS and next_offset < end:
+            # a one-off read: it shouldn't push chunks viewers need out of the cache
+            pending.append(asyncio.ensure_future(
+                tg_connect.fetch_chunk(file_id, next_offset, STREAM_CHUNK_SIZE, cache=False)
+            ))
+            next_offset += STREAM_CHUNK_SIZE
+
+    position = offset
+    try:
+        top_up()
+        while pending:
+            chunk = await pending.popleft()
+            top_up()
+            if not chunk:
+                raise PushError(f"Telegram returned no data at offset {position}")
+            piece = chunk[max(0, start - position):end - position]
+            position += len(chunk)
+            if piece:
+                yield piece
+    finally:
+        for future in pending:
+            future.cancel()
+
+
+async def folder_policy(folder: str) -> str:
+    """
+    Returns the id of the storage policy of a Cloudreve folder, which upload sessions need.
+    """
+    if folder not in _policy_ids:
+        result = await file_list(page_size=1, uri=folder)
+        policy = (result.get("data") or {}).get("storage_policy") or {}
+        if not policy.get("id"):
+            raise PushError(f"Cloudreve folder {folder} has no storage policy")
+        _policy_ids[folder] = policy["id"]
+    return _policy_ids[folder]
+
+
+async def open_session(message_id: int, secure_hash: str, uri: str, file_id: FileId) -> Dict:
+    session = upload_sessions.get(message_id)
+    if session is not None:
+        if (session["hash"] == secure_hash and session["uri"] == uri and session["size"] == file_id.file_size
+                and session["expires"] > time.time() + SESSION_EXPIRY_SKEW):
+            logger.info(f"Resuming Cloudreve upload of message {message_id}: {len(session['done'])} chunks done")
+            return session
+        try:
+            await delete_upload_session(session["session_id"], session["uri"])
+        except Exception as e:
+            logger.debug(f"Couldn't delete stale upload session {session['session_id']}: {e}")
+        upload_sessions.drop(message_id)
+
+    folder = uri.rsplit("/", 1)[0]
+    result = await create_upload_session(uri, file_id.file_size, await folder_policy(folder), file_id.mime_type)
+    data = result.get("data") or {}
+    if data.get("upload_urls"):
+        # storage that takes the chunks directly (S3, OSS...) isn't pushed to through Cloudreve
+        await delete_upload_session(data["session_id"], uri)
+        raise PushError("this storage policy uploads to external storage, which push mode doesn't support")
+    chunk_size = int(data.get("chunk_size") or 0) or file_id.file_size
+    session = {
+        "hash": secure_hash,
+        "uri": uri,
+        "size": file_id.file_size,
+        "session_id": data["session_id"],
+        "chunk_size": chunk_size,
+        "expires": _to_epoch_sec(data.get("expires")) or int(time.time()) + 3600,
+        "done": [],
+    }
+    upload_sessions.put(message_id, session)
+    return session
+
+
+def pick_clients(count: int) -> List[int]:
+    """
+    Returns up to count distinct clients, least loaded first, so the slices are read in parallel.
+    """
+    serving = [i for i in work_loads if i in multi_clients and i not in draining] or list(multi_clients)
+    serving.sort(key=lambda i: (not health.is_available(i), work_loads.get(i, 0)))
+    return serving[:max(1, count)]
+
+
+async def push_file(message_id: int, secure_hash: str, progress: Optional[ProgressCallback] = None) -> str:
+    """
+    Uploads a BIN_CHANNEL file straight into CLOUDEREVE_DOWNLOAD_PATH and returns its Cloudreve uri.
+    Concurrent pushes of the same message share one upload, and each caller's progress is reported.
+    """
+    push = _pushes.get(message_id)
+    if push is None or push.done():
+        watchers = _watchers[message_id] = []
+        push = _pushes[message_id] = asyncio.ensure_future(_push(message_id, secure_hash, watchers))
+
+        def done(task: asyncio.Task) -> None:
+            # a newer push of the same message may have replaced this one already
+            if _pushes.get(message_id) is task:
+                del _pushes[message_id]
+                _watchers.pop(message_id, None)
+
+        push.add_done_callback(done)
+    if progress is not None:
+        _watchers[message_id].append(progress)
+    return await asyncio.shield(push)
+
+
+async def _report(watchers: List[ProgressCallback], uploaded: int, size: int) -> None:
+    for progress in list(watchers):
+        try:
+            await progress(uploaded, size)
+        except Exception as e:
+            # one caller's status message failing doesn't stop the push for the others
+            logger.debug(f"Progress callback failed: {e}")
+
+
+async def _push(message_id: int, secure_hash: str, watchers: List[ProgressCallback]) -> str:
+    clients = pick_clients(Var.CLOUDREVE_PUSH_WORKERS)
+    file_ids = {}
+    for index in clients:
+        # every client holds its own file reference for the message
+        file_ids[index] = await get_streamer(index).get_file_properties(message_id)
+    file_id = file_ids[clients[0]]
+    if get_hash(file_id.unique_id, Var.HASH_LENGTH) != secure_hash:
+        raise PushError("the link doesn't match the file")
+    name = get_name(file_id)
+    uri = f"{Var.CLOUDEREVE_DOWNLOAD_PATH.rstrip('/')}/{quote(name)}"
+    session = await open_session(message_id, secure_hash, uri, file_id)
+
+    size = session["size"]
+    chunk_size = session["chunk_size"]
+    chunk_count = max(1, -(-size // chunk_size))
+    todo = deque(i for i in range(chunk_count) if i not in session["done"])
+    uploaded = (chunk_count - len(todo)) * chunk_size
+    logger.info(f"Pushing message {message_id} to {uri}: {len(todo)}/{chunk_count} chunks over clients {clients}")
+
+    async def worker(index: int):
+        nonlocal uploaded
+        while todo:
+            chunk_index = todo.popleft()
+            start = chunk_index * chunk_size
+            end = min(start + chunk_size, size)
+            for attempt in range(CHUNK_RETRIES + 1):
+                work_loads[index] += 1
+                try:
+                    await upload_chunk(
+                        session["session_id"], chunk_index,
+                        iter_range(index, file_ids[index], start, end), end - start,
+                    )
+                    break
+                except Exception as e:
+                    if attempt == CHUNK_RETRIES:
+                        raise PushError(f"chunk {chunk_index} failed: {e}")
+                    logger.warning(f"Chunk {chunk_index} of message {message_id} failed on client {index}, retrying: {e}")
+                    await asyncio.sleep(2 ** attempt)
+                finally:
+                    if index in work_loads:
+                        work_loads[index] -= 1
+            upload_sessions.chunk_done(message_id, chunk_index)
+            uploaded = min(size, uploaded + end - start)
+            await _report(watchers, uploaded, size)
+
+    workers = [asyncio.ensure_future(worker(index)) for index in clients]
+    try:
+        await asyncio.gather(*workers)
+    except BaseException:
+        for task in workers:
+            task.cancel()
+        # the session and its finished chunks stay recorded, so the next push resumes
+        raise
+    upload_sessions.drop(message_id)
+    file_browser.invalidate(uri.rsplit("/", 1)[0])
+    cloudreve_tier.record_uri(message_id, secure_hash, uri, name)
+    logger.info(f"Pushed message {message_id} to {uri}")
+    return uri
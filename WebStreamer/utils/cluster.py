@@ -0,0 +1,155 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import bisect
+import hashlib
+import logging
+import aiohttp
+from aiohttp import web
+from typing import Dict, List, Optional, Tuple
+from WebStreamer.vars import Var
+
+logger = logging.getLogger("cluster")
+
+# Header set on requests that were already routed by a peer, so the owner
+# always serves them locally instead of bouncing them around the ring.
+HOP_HEADER = "X-FSB-Cluster-Hop"
+
+# Request headers that matter for streaming and are passed through to the owner.
+FORWARDED_HEADERS = ("Range", "If-Range", "If-Modified-Since", "If-None-Match", "User-Agent")
+
+# Response headers copied back from the owner to the viewer.
+RETURNED_HEADERS = ("Content-Type", "Content-Range", "Content-Length",
+                    "Content-Disposition", "Accept-Ranges", "Retry-After", "Location")
+
+PROXY_CHUNK_SIZE = 1024 * 1024
+CONNECT_TIMEOUT = 5
+
+
+class HashRing:
+    def __init__(self, nodes: List[str], vnodes: int = 100):
+        """A consistent-hash ring mapping keys onto cluster nodes.
+        attributes:
+            nodes: the base URLs of every node in the cluster.
+            vnodes: the number of virtual points each node gets on the ring.
+
+        Each node is placed on the ring `vnodes` times so that keys spread
+        evenly and adding or removing a node only moves ~1/N of the keys.
+        """
+        self.nodes = list(dict.fromkeys(nodes))
+        self.vnodes = vnodes
+        self._points: List[int] = []
+        self._owners: List[str] = []
+        ring: List[Tuple[int, str]] = []
+        for node in self.nodes:
+            for replica in range(vnodes):
+                ring.append((self._hash(f"{node}#{replica}"), node))
+        ring.sort()
+        for point, node in ring:
+            self._points.append(point)
+            self._owners.append(node)
+
+    @staticmethod
+    def _hash(key: str) -> int:
+        return int.from_bytes(hashlib.md5(key.encode("UTF-8")).digest()[:8], "big")
+
+    def get_node(self, key: str) -> Optional[str]:
+        """
+        Returns the node owning the given key, or None if the ring is empty.
+        """
+        if not self._points:
+            return None
+        idx = bisect.bisect(self._points, self._hash(key)) % len(self._points)
+        return self._owners[idx]
+
+
+def _normalize(url: str) -> str:
+    url = url.strip()
+    if url and "://" not in url:
+        url = "http://" + url
+    return url.rstrip("/")
+
+
+self_node = _normalize(Var.CLUSTER_SELF or Var.URL)
+peers = [_normalize(p) for p in Var.CLUSTER_PEERS if p.strip()]
+if peers and self_node not in peers:
+    peers.append(self_node)
+ring = HashRing(peers, Var.CLUSTER_VNODES) if peers else None
+
+_session: Optional[aiohttp.ClientSession] = None
+
+
+def is_enabled() -> bool:
+    return ring is not None and len(ring.nodes) > 1
+
+
+def owner_of(secure_hash: str) -> Optional[str]:
+    """
+    Returns the base URL of the node responsible for a file, or None if this node owns it.
+    The secure hash is already derived from the file's unique_id, so it is used as the ring key;
+    that way the owner is known before any Telegram request is made.
+    """
+    if not is_enabled():
+        return None
+    node = ring.get_node(secure_hash)
+    if node == self_node:
+        return None
+    return node
+
+
+def is_forwarded(request: web.Request) -> bool:
+    return HOP_HEADER in request.headers
+
+
+async def get_session() -> aiohttp.ClientSession:
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            timeout=aiohttp.ClientTimeout(total=None, sock_connect=CONNECT_TIMEOUT),
+            auto_decompress=False,
+        )
+    return _session
+
+
+async def route_to_owner(request: web.Request, node: str) -> web.StreamResponse:
+    """
+    Sends the request to the owning node, either with a redirect or by proxying the bytes.
+    Raises aiohttp.ClientError if the owner can't be reached, so the caller can serve locally.
+    """
+    target = node + request.rel_url.path_qs
+    if Var.CLUSTER_MODE == "redirect":
+        logger.debug(f"Redirecting {request.rel_url} to {node}")
+        raise web.HTTPFound(target)
+
+    headers = {h: request.headers[h] for h in FORWARDED_HEADERS if h in request.headers}
+    headers[HOP_HEADER] = self_node
+    session = await get_session()
+    logger.debug(f"Proxying {request.rel_url} to {node}")
+    async with session.request(request.method, target, headers=headers, allow_redirects=False) as upstream:
+        response = web.StreamResponse(
+            status=upstream.status,
+            headers={h: upstream.headers[h] for h in RETURNED_HEADERS if h in upstream.headers},
+        )
+        await response.prepare(request)
+        try:
+            if request.method != "HEAD":
+                async for chunk in upstream.content.iter_chunked(PROXY_CHUNK_SIZE):
+                    await response.write(chunk)
+            await response.write_eof()
+        except (aiohttp.ClientError, ConnectionResetError) as e:
+            # Headers are already out, so there's no falling back anymore
+            logger.debug(f"Proxied stream from {node} interrupted: {e}")
+        return response
+
+
+def cluster_status() -> Dict[str, object]:
+    return {
+        "self": self_node,
+        "mode": Var.CLUSTER_MODE,
+        "nodes": ring.nodes if ring else [],
+    }
+
+
+async def close_session() -> None:
+    if _session is not None and not _session.closed:
+        await _session.close()
@@ -1,18 +1,67 @@
 import math
+import time
 import asyncio
 import logging
+from collections import deque
 from WebStreamer.vars import Var
-from typing import Dict, Union
-from WebStreamer.bot import work_loads
+from typing import Dict, List, Union
+from WebStreamer.bot import multi_clients, work_loads
 from pyrogram import Client, utils, raw
-from .file_properties import get_file_ids
+from . import cluster, health
+from .bin_index import bin_index
+from .chunk_cache import chunk_cache
+from .popularity import popularity
+from .media_index import media_index, container_of
+from .file_properties import get_file_ids, file_id_from_message
 from pyrogram.session import Session, Auth
-from pyrogram.errors import AuthBytesInvalid
+from pyrogram.errors import AuthBytesInvalid, Unauthorized
+from .media_auth import load_media_auth, save_media_auth, drop_media_auth
 from WebStreamer.server.exceptions import FIleNotFound
 from pyrogram.file_id import FileId, FileType, ThumbnailSource
 
 logger = logging.getLogger("streamer")
 
+# Chunk size media_streamer serves files with, and the one warm-up fetches for it
+STREAM_CHUNK_SIZE = 1024 * 1024
+
+class ReadAheadPacer:
+    def __init__(self, file_id: FileId, chunk_size: int):
+        """Decides how many chunks yield_file keeps in flight ahead of the viewer.
+        attributes:
+            file_id: the file being streamed; its size, duration and mime type give the bitrate.
+            chunk_size: the size of each prefetched chunk.
+
+        Video and audio are read READAHEAD_SECONDS of playback ahead, using the larger of the
+        bitrate estimated from file_size / duration and the rate the viewer actually consumes
+        at, so a player gets a steady buffer and a download of a video still runs at full speed.
+        Everything else, and media without a known duration, is prefetched READAHEAD_MAX_PARTS deep.
+        The window only stays below that cap while rate * READAHEAD_SECONDS is less than
+        READAHEAD_MAX_PARTS chunks: with the defaults, video up to about 8 Mbit/s.
+        """
+        self.chunk_size = chunk_size
+        self.max_parts = max(1, Var.READAHEAD_MAX_PARTS)
+        mime_type = getattr(file_id, "mime_type", "") or ""
+        duration = getattr(file_id, "duration", 0) or 0
+        file_size = getattr(file_id, "file_size", 0) or 0
+        self.bitrate = 0.0
+        if duration > 0 and file_size and mime_type.startswith(("video/", "audio/")):
+            self.bitrate = file_size / duration
+        self.started = time.monotonic()
+        self.bytes_consumed = 0
+
+    def consumed(self, size: int) -> None:
+        self.bytes_consumed += size
+
+    def window(self) -> int:
+        if not self.bitrate:
+            return self.max_parts
+        elapsed = time.monotonic() - self.started
+        observed = self.bytes_consumed / elapsed if elapsed > 1 else 0
+        rate = max(self.bitrate, observed)
+        parts = math.ceil(rate * Var.READAHEAD_SECONDS / self.chunk_size)
+        return min(max(parts, 1), self.max_parts)
+
+
 class ByteStreamer:
     def __init__(self, client: Client):
         """A custom class that holds the cache of a specific client and class functions.
@@ -30,9 +79,10 @@ class ByteStreamer:
         Thanks to Eyaadh <https://github.com/eyaadh>
         """
         self.clean_timer = 30 * 60
+        self.restore_timeout = 10
         self.client: Client = client
         self.cached_file_ids: Dict[int, FileId] = {}
-        asyncio.create_task(self.clean_cache())
+        self.clean_task = asyncio.create_task(self.clean_cache())
 
     async def get_file_properties(self, message_id: int) -> FileId:
         """
@@ -45,12 +95,31 @@ class ByteStreamer:
             logger.debug(f"Cached file properties for message with ID {message_id}")
         return self.cached_file_ids[message_id]
     
+    async def get_file_properties_batch(self, message_ids: List[int]) -> Dict[int, FileId]:
+        """
+        Returns the FileIds of many messages at once; the ones that aren't cached yet
+        are fetched with one get_messages call per 200 messages.
+        Messages that don't exist or hold no media are left out of the result.
+        """
+        missing = list(dict.fromkeys(i for i in message_ids if i not in self.cached_file_ids))
+        for i in range(0, len(missing), 200):
+            for message in await self.client.get_messages(Var.BIN_CHANNEL, missing[i:i + 200]):
+                file_id = None if message.empty else await file_id_from_message(message)
+                if file_id:
+                    self.cached_file_ids[message.id] = file_id
+        return {i: self.cached_file_ids[i] for i in message_ids if i in self.cached_file_ids}
+
     async def generate_file_properties(self, message_id: int) -> FileId:
         """
         Generates the properties of a media file on a specific message.
         returns ths properties in a FIleId class.
         """
-        file_id = await get_file_ids(self.client, Var.BIN_CHANNEL, message_id)
+        try:
+            file_id = await get_file_ids(self.client, Var.BIN_CHANNEL, message_id)
+        except FIleNotFound:
+            # The message was deleted from the channel, links to it must not be handed out again
+            bin_index.forget_message(message_id)
+            raise
         logger.debug(f"Generated file ID and Unique ID for message with ID {message_id}")
         if not file_id:
             logger.debug(f"Message with ID {message_id} not found")
@@ -69,37 +138,40 @@ class ByteStreamer:
 
         if media_session is None:
             if file_id.dc_id != await client.storage.dc_id():
-                media_session = Session(
-                    client,
-                    file_id.dc_id,
-                    await Auth(
-                        client, file_id.dc_id, await client.storage.test_mode()
-                    ).create(),
-                    await client.storage.test_mode(),
-                    is_media=True,
-                )
-                await media_session.start()
-
-                for _ in range(6):
-                    exported_auth = await client.invoke(
-                        raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
+                media_session = await self.restore_media_session(client, file_id.dc_id)
+                if media_session is None:
+                    media_session = Session(
+                        client,
+                        file_id.dc_id,
+                        await Auth(
+                            client, file_id.dc_id, await client.storage.test_mode()
+                        ).create(),
+                        await client.storage.test_mode(),
+                        is_media=True,
                     )
+                    await media_session.start()
 
-                    try:
-                        await media_session.invoke(
-                            raw.functions.auth.ImportAuthorization(
-                                id=exported_auth.id, bytes=exported_auth.bytes
-                            )
+                    for _ in range(6):
+                        exported_auth = await client.invoke(
+                            raw.functions.auth.ExportAuthorization(dc_id=file_id.dc_id)
                         )
-                        break
-                    except AuthBytesInvalid:
-                        logger.debug(
-                            f"Invalid authorization bytes for DC {file_id.dc_id}"
-                        )
-                        continue
-                else:
-                    await media_session.stop()
-                    raise AuthBytesInvalid
+
+                        try:
+                            await media_session.invoke(
+                                raw.functions.auth.ImportAuthorization(
+                                    id=exported_auth.id, bytes=exported_auth.bytes
+                                )
+                            )
+                            break
+                        except AuthBytesInvalid:
+                            logger.debug(
+                                f"Invalid authorization bytes for DC {file_id.dc_id}"
+                            )
+                            continue
+                    else:
+                        await media_session.stop()
+                        raise AuthBytesInvalid
+                    await save_media_auth(client, file_id.dc_id, media_session.auth_key)
             else:
                 media_session = Session(
                     client,
@@ -115,6 +187,38 @@ class ByteStreamer:
             logger.debug(f"Using cached media session for DC {file_id.dc_id}")
         return media_session
 
+    async def restore_media_session(self, client: Client, dc_id: int) -> Union[Session, None]:
+        """
+        Starts a media session with the auth key stored by a previous run, if there is one.
+        The key is validated with a cheap authorized call; if Telegram rejects it,
+        it's dropped and None is returned so a new one gets generated.
+        """
+        auth_key = await load_media_auth(client, dc_id)
+        if auth_key is None:
+            return None
+        media_session = Session(
+            client,
+            dc_id,
+            auth_key,
+            await client.storage.test_mode(),
+            is_media=True,
+        )
+        try:
+            await asyncio.wait_for(media_session.start(), self.restore_timeout)
+            await media_session.invoke(
+                raw.functions.users.GetUsers(id=[raw.types.InputUserSelf()]),
+                timeout=self.restore_timeout,
+            )
+        except (Unauthorized, asyncio.TimeoutError, OSError) as e:
+            logger.info(f"Stored media auth for DC {dc_id} was rejected, regenerating: {e}")
+            drop_media_auth(client, dc_id)
+            try:
+                await media_session.stop()
+            except Exception:
+                pass
+            return None
+        logger.debug(f"Restored media session for DC {dc_id} from stored auth key")
+        return media_session
 
     @staticmethod
     async def get_location(file_id: FileId) -> Union[raw.types.InputPhotoFileLocation,
@@ -161,6 +265,79 @@ class ByteStreamer:
             )
         return location
 
+    async def fetch_chunk(self, file_id: FileId, offset: int, chunk_size: int, cache: bool = True,
+                          record: bool = True) -> bytes:
+        """
+        Fetches a single chunk of a media file, from the chunk cache if it's there or else from Telegram.
+        offset must be a multiple of chunk_size, and chunk_size a divisor of 1 MiB.
+        One-off reads such as re-uploads pass cache=False so they don't evict chunks viewers need;
+        background reads pass record=False so they use the cache without counting as requests.
+        """
+        key = (file_id.media_id, offset, chunk_size)
+        if cache:
+            if record:
+                popularity.record_request(*key)
+            chunk = chunk_cache.get(key)
+            if chunk is None and chunk_size == STREAM_CHUNK_SIZE:
+                chunk = await media_index.get(getattr(file_id, "unique_id", None), offset)
+            if chunk is not None:
+                return chunk
+        media_session = await self.generate_media_session(self.client, file_id)
+        location = await self.get_location(file_id)
+        r = await media_session.invoke(
+            raw.functions.upload.GetFile(
+                location=location, offset=offset, limit=chunk_size
+            ),
+        )
+        if not isinstance(r, raw.types.upload.File):
+            return b""
+        if cache:
+            chunk_cache.put(key, r.bytes)
+        return r.bytes
+
+    async def warm_up(self, message_id: int) -> None:
+        """
+        Prepares a freshly linked file for its first request: resolves and caches its FileId,
+        sets up the media session to its DC and fetches the head chunk into the chunk cache.
+        For videos the tail chunk is fetched too, since players read it early to find the index
+        of containers that keep it at the end of the file.
+        """
+        file_id = await self.get_file_properties(message_id)
+        if await self.index_media(file_id):
+            # the index scan already read the head and wherever the index lives
+            logger.debug(f"Warmed up message {message_id} through its container index")
+            return
+        offsets = [0]
+        file_size = getattr(file_id, "file_size", 0) or 0
+        if file_size > STREAM_CHUNK_SIZE and (getattr(file_id, "mime_type", "") or "").startswith("video/"):
+            offsets.append((file_size - 1) // STREAM_CHUNK_SIZE * STREAM_CHUNK_SIZE)
+        await asyncio.gather(*(self.fetch_chunk(file_id, offset, STREAM_CHUNK_SIZE, record=False) for offset in offsets))
+        logger.debug(f"Warmed up message {message_id} ({len(offsets)} chunks)")
+
+    async def index_media(self, file_id: FileId) -> bool:
+        """
+        Locates and stores the index region (MP4 moov / MKV Cues) of an MP4 or MKV file
+        in the media index, once per file. Returns whether the file was scanned now.
+        """
+        unique_id = getattr(file_id, "unique_id", None)
+        container = container_of(getattr(file_id, "mime_type", ""), getattr(file_id, "file_name", ""))
+        if not unique_id or not container or not media_index.enabled or media_index.is_scanned(unique_id):
+            return False
+        if unique_id in indexing:
+            return False
+        indexing.add(unique_id)
+        try:
+            await media_index.build(
+                unique_id,
+                container,
+                getattr(file_id, "file_size", 0) or 0,
+                lambda offset: self.fetch_chunk(file_id, offset, STREAM_CHUNK_SIZE, record=False),
+                STREAM_CHUNK_SIZE,
+            )
+        finally:
+            indexing.discard(unique_id)
+        return True
+
     async def yield_file(
         self,
         file_id: FileId,
@@ -179,47 +356,66 @@ class ByteStreamer:
         client = self.client
         work_loads[index] += 1
         logger.debug(f"Starting to yielding file with client {index}.")
-        media_session = await self.generate_media_session(client, file_id)
 
         current_part = 1
-        location = await self.get_location(file_id)
+        message_id = getattr(file_id, "message_id", None)
+        file_name = getattr(file_id, "file_name", None)
+        pacer = ReadAheadPacer(file_id, chunk_size)
+        pending = deque()
+        next_offset = offset
+        next_part = 1
+
+        def top_up():
+            nonlocal next_offset, next_part
+            window = pacer.window()
+            while len(pending) < window and next_part <= part_count:
+                pending.append(asyncio.ensure_future(self.fetch_chunk(file_id, next_offset, chunk_size)))
+                next_offset += chunk_size
+                next_part += 1
 
         try:
-            r = await media_session.invoke(
-                raw.functions.upload.GetFile(
-                    location=location, offset=offset, limit=chunk_size
-                ),
-            )
-            if isinstance(r, raw.types.upload.File):
-                while True:
-                    chunk = r.bytes
-                    if not chunk:
-                        break
-                    elif part_count == 1:
-                        yield chunk[first_part_cut:last_part_cut]
-                    elif current_part == 1:
-                        yield chunk[first_part_cut:]
-                    elif current_part == part_count:
-                        yield chunk[:last_part_cut]
-                    else:
-                        yield chunk
+            top_up()
+            chunk = await pending.popleft()
+            while True:
+                if not chunk:
+                    break
+                elif part_count == 1:
+                    chunk = chunk[first_part_cut:last_part_cut]
+                elif current_part == 1:
+                    chunk = chunk[first_part_cut:]
+                elif current_part == part_count:
+                    chunk = chunk[:last_part_cut]
+                popularity.record_bytes(file_id.media_id, len(chunk), message_id, file_name)
+                yield chunk
+                pacer.consumed(len(chunk))
 
-                    current_part += 1
-                    offset += chunk_size
+                current_part += 1
+                offset += chunk_size
 
-                    if current_part > part_count:
-                        break
+                if current_part > part_count:
+                    break
 
-                    r = await media_session.invoke(
-                        raw.functions.upload.GetFile(
-                            location=location, offset=offset, limit=chunk_size
-                        ),
-                    )
-        except (TimeoutError, AttributeError):
-            pass
+                top_up()
+                chunk = await pending.popleft()
+            health.report_success(index, file_id.dc_id)
+        except (TimeoutError, AttributeError) as e:
+            health.report_failure(index, file_id.dc_id, e)
+        except Unauthorized:
+            # The media authorization was revoked under us; make the next request build a fresh one
+            logger.warning(f"Media session for DC {file_id.dc_id} is no longer authorized")
+            media_session = client.media_sessions.pop(file_id.dc_id, None)
+            drop_media_auth(client, file_id.dc_id)
+            if media_session is not None:
+                await media_session.stop()
+            raise
         finally:
+            for task in pending:
+                if task.done() and not task.cancelled():
+                    task.exception()  # consume it, the viewer is gone anyway
+                task.cancel()
             logger.debug(f"Finished yielding file with {current_part} parts.")
-            work_loads[index] -= 1
+            if index in work_loads:
+                work_loads[index] -= 1
 
     
     async def clean_cache(self) -> None:
@@ -230,3 +426,75 @@ class ByteStreamer:
             await asyncio.sleep(self.clean_timer)
             self.cached_file_ids.clear()
             logger.debug("Cleaned the cache")
+
+
+class_cache: Dict[Client, ByteStreamer] = {}
+
+def get_streamer(index: int) -> ByteStreamer:
+    """
+    Returns the ByteStreamer of a client in multi_clients, creating it on first use.
+    """
+    faster_client = multi_clients[index]
+    if faster_client in class_cache:
+        logger.debug(f"Using cached ByteStreamer object for client {index}")
+        return class_cache[faster_client]
+    logger.debug(f"Creating new ByteStreamer object for client {index}")
+    tg_connect = ByteStreamer(faster_client)
+    class_cache[faster_client] = tg_connect
+    return tg_connect
+
+def forget_streamer(client: Client) -> None:
+    """
+    Drops the cached ByteStreamer of a client that is being removed.
+    """
+    tg_connect = class_cache.pop(client, None)
+    if tg_connect is not None:
+        tg_connect.clean_task.cancel()
+
+
+# Keeps references to running warm-ups so they aren't garbage collected mid-flight
+warm_up_tasks = set()
+# unique_ids whose container index is being located right now
+indexing = set()
+
+def schedule_warm_up(message_id: int, secure_hash: str) -> None:
+    """
+    Starts warming up a newly linked file in the background when PREFETCH_ON_LINK is on.
+    In cluster mode only the node that owns the file warms it up, since it's the one that will serve it.
+    """
+    if not Var.PREFETCH_ON_LINK or not multi_clients or cluster.owner_of(secure_hash):
+        return
+
+    async def run():
+        try:
+            await get_streamer(health.pick_client()).warm_up(message_id)
+        except Exception as e:
+            logger.debug(f"Warm-up of message {message_id} failed: {e}")
+
+    task = asyncio.create_task(run())
+    warm_up_tasks.add(task)
+    task.add_done_callback(warm_up_tasks.discard)
+
+
+def schedule_index(tg_connect: ByteStreamer, file_id: FileId) -> None:
+    """
+    Locates a streamed file's container index in the background if that hasn't been done yet.
+    """
+    unique_id = getattr(file_id, "unique_id", None)
+    if not unique_id or not media_index.enabled or unique_id in indexing:
+        return
+    # only MP4 and MKV have an index to find; don't spawn a task for every other file
+    if not container_of(getattr(file_id, "mime_type", ""), getattr(file_id, "file_name", "")):
+        return
+    if media_index.is_scanned(unique_id):
+        return
+
+    async def run():
+        try:
+            await tg_connect.index_media(file_id)
+        except Exception as e:
+            logger.debug(f"Indexing {unique_id} failed: {e}")
+
+    task = asyncio.create_task(run())
+    warm_up_tasks.add(task)
+    task.add_done_callback(warm_up_tasks.discard)
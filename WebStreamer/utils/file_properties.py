@@ -1,9 +1,11 @@
 import hashlib
+from urllib.parse import quote_plus
 from pyrogram import Client
 from pyrogram.types import Message
 from pyrogram.file_id import FileId
 from typing import Any, Optional, Union
 from pyrogram.raw.types.messages import Messages
+from WebStreamer.vars import Var
 from WebStreamer.server.exceptions import FIleNotFound
 from datetime import datetime
 
@@ -22,13 +24,28 @@ async def get_file_ids(client: Client, chat_id: int, message_id: int) -> Optiona
     message = await client.get_messages(chat_id, message_id)
     if message.empty:
         raise FIleNotFound
+    return await file_id_from_message(message)
+
+async def file_id_from_message(message: "Message") -> Optional[FileId]:
+    """
+    Decodes the FileId of a message's media and attaches the media's properties to it.
+    """
     media = get_media_from_message(message)
+    if not media:
+        return None
     file_unique_id = await parse_file_unique_id(message)
     file_id = await parse_file_id(message)
     setattr(file_id, "file_size", getattr(media, "file_size", 0))
     setattr(file_id, "mime_type", getattr(media, "mime_type", ""))
     setattr(file_id, "file_name", getattr(media, "file_name", ""))
     setattr(file_id, "unique_id", file_unique_id)
+    setattr(file_id, "duration", getattr(media, "duration", 0) or 0)
+    setattr(file_id, "message_id", message.id)
+    # (file_id, width, height) of every size Telegram renders for it; a photo is its own largest size
+    thumbs = [(thumb.file_id, thumb.width, thumb.height) for thumb in (getattr(media, "thumbs", None) or [])]
+    if message.photo:
+        thumbs.append((media.file_id, media.width, media.height))
+    setattr(file_id, "thumbs", thumbs)
     return file_id
 
 def get_media_from_message(message: "Message") -> Any:
@@ -58,6 +75,12 @@ def get_hash(media_msg: Union[str, Message], length: int) -> str:
     return long_hash[:length]
 
 
+def build_links(file_hash: str, msg_id: int, display_name: str):
+    short_link = f"{Var.URL}{file_hash}{msg_id}"
+    stream_link = f"{Var.URL}{msg_id}/{quote_plus(display_name)}?hash={file_hash}"
+    return short_link, stream_link
+
+
 def get_name(media_msg: Union[Message, FileId]) -> str:
 
     if isinstance(media_msg, Message):
@@ -88,3 +111,12 @@ def get_name(media_msg: Union[Message, FileId]) -> str:
         file_name = f"{media_type}-{date}{ext}"
 
     return file_name
+
+
+def readable_size(size: int) -> str:
+    size = float(size or 0)
+    for unit in ("B", "KB", "MB", "GB"):
+        if size < 1024:
+            return f"{size:.1f}{unit}" if unit != "B" else f"{int(size)}B"
+        size /= 1024
+    return f"{size:.1f}TB"
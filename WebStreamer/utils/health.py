@@ -0,0 +1,253 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import time
+import random
+import asyncio
+import logging
+from pyrogram import Client, raw
+from typing import Dict, Optional, Tuple
+from WebStreamer.vars import Var
+from WebStreamer.bot import multi_clients, work_loads, draining
+
+logger = logging.getLogger("health")
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Upper bound for the exponential back-off between half-open retries
+MAX_RESET_TIMEOUT = 30 * 60
+# A half-open trial that hasn't reported back after this many seconds (a long stream, or a
+# client that was picked and then not used) lets the next request through as a new trial
+TRIAL_TIMEOUT = 60
+
+
+class CircuitBreaker:
+    def __init__(self, name: str, failure_threshold: int, reset_timeout: float):
+        """A circuit breaker guarding a client or a client's media session for one DC.
+        attributes:
+            name: a label used in logs.
+            failure_threshold: consecutive failures after which the breaker opens.
+            reset_timeout: seconds an open breaker waits before letting a trial through.
+
+        closed: traffic flows normally.
+        open: no traffic; after reset_timeout it becomes half-open.
+        half_open: a single trial request flows, the rest are refused until it reports back;
+            its success closes the breaker, its failure opens it again with a doubled reset_timeout.
+        """
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.base_reset_timeout = reset_timeout
+        self.reset_timeout = reset_timeout
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.last_error: Optional[str] = None
+        self.trial_started: Optional[float] = None
+
+    def available(self) -> bool:
+        """
+        Returns whether a request would be let through, without taking the half-open trial.
+        An expired open breaker moves to half-open.
+        """
+        now = time.monotonic()
+        if self.state == OPEN and now - self.opened_at >= self.reset_timeout:
+            self.state = HALF_OPEN
+            self.trial_started = None
+            logger.info(f"Circuit {self.name} is half-open, allowing a trial request")
+        if self.state == HALF_OPEN:
+            return self.trial_started is None or now - self.trial_started >= TRIAL_TIMEOUT
+        return self.state == CLOSED
+
+    def allow(self) -> bool:
+        """
+        Returns whether a request may go through; while half-open, the request that gets True is the trial.
+        """
+        if not self.available():
+            return False
+        if self.state == HALF_OPEN:
+            self.trial_started = time.monotonic()
+        return True
+
+    def record_success(self) -> None:
+        if self.state != CLOSED:
+            logger.info(f"Circuit {self.name} closed")
+        self.trial_started = None
+        self.state = CLOSED
+        self.failures = 0
+        self.reset_timeout = self.base_reset_timeout
+
+    def record_failure(self, error: Exception) -> None:
+        self.failures += 1
+        self.last_error = f"{type(error).__name__}: {error}"
+        self.trial_started = None
+        if self.state == HALF_OPEN:
+            self.reset_timeout = min(self.reset_timeout * 2, MAX_RESET_TIMEOUT)
+            self._open()
+        elif self.state == CLOSED and self.failures >= self.failure_threshold:
+            self._open()
+
+    def _open(self) -> None:
+        self.state = OPEN
+        self.opened_at = time.monotonic()
+        logger.warning(f"Circuit {self.name} opened after {self.failures} failures ({self.last_error}), "
+                       f"retrying in {self.reset_timeout:.0f}s")
+
+    def status(self) -> Dict[str, object]:
+        return {"state": self.state, "failures": self.failures, "last_error": self.last_error}
+
+
+client_breakers: Dict[int, CircuitBreaker] = {}
+dc_breakers: Dict[Tuple[int, int], CircuitBreaker] = {}
+_restarting: Dict[int, asyncio.Task] = {}
+
+
+def client_breaker(index: int) -> CircuitBreaker:
+    if index not in client_breakers:
+        client_breakers[index] = CircuitBreaker(
+            f"client {index}", Var.BREAKER_FAILURE_THRESHOLD, Var.BREAKER_RESET_TIMEOUT
+        )
+    return client_breakers[index]
+
+
+def dc_breaker(index: int, dc_id: int) -> CircuitBreaker:
+    key = (index, dc_id)
+    if key not in dc_breakers:
+        dc_breakers[key] = CircuitBreaker(
+            f"client {index} DC {dc_id}", Var.BREAKER_FAILURE_THRESHOLD, Var.BREAKER_RESET_TIMEOUT
+        )
+    return dc_breakers[key]
+
+
+def is_available(index: int, dc_id: Optional[int] = None) -> bool:
+    """
+    Whether a client (and its media session for dc_id) would take a request; doesn't use up a half-open trial.
+    """
+    if not client_breaker(index).available():
+        return False
+    return dc_id is None or dc_breaker(index, dc_id).available()
+
+
+def admit_dc(index: int, dc_id: int) -> bool:
+    """
+    Whether a request may use the client's media session for dc_id; it becomes the trial of a half-open breaker.
+    """
+    return dc_breaker(index, dc_id).allow()
+
+
+def pick_client(dc_id: Optional[int] = None) -> int:
+    """
+    Returns the index of the least loaded client whose circuits are not open.
+    Draining clients are skipped. If every client is unhealthy, the least loaded one is still returned, since
+    trying is better than refusing the request outright. A half-open client is picked as its single trial.
+    """
+    serving = [i for i in work_loads if i in multi_clients and i not in draining] or \
+        [i for i in work_loads if i in multi_clients]
+    candidates = [i for i in serving if is_available(i, dc_id)]
+    if not candidates:
+        return min(serving, key=work_loads.get)
+    index = min(candidates, key=work_loads.get)
+    client_breaker(index).allow()
+    if dc_id is not None:
+        dc_breaker(index, dc_id).allow()
+    return index
+
+
+def report_success(index: int, dc_id: Optional[int] = None) -> None:
+    client_breaker(index).record_success()
+    if dc_id is not None:
+        dc_breaker(index, dc_id).record_success()
+
+
+def report_failure(index: int, dc_id: Optional[int], error: Exception) -> None:
+    if dc_id is not None:
+        dc_breaker(index, dc_id).record_failure(error)
+    else:
+        client_breaker(index).record_failure(error)
+
+
+async def drop_media_session(client: Client, dc_id: int) -> None:
+    session = client.media_sessions.pop(dc_id, None)
+    if session is not None:
+        try:
+            await session.stop()
+        except Exception:
+            logger.debug(f"Error while stopping media session for DC {dc_id}", exc_info=True)
+
+
+async def restart_client(index: int, client: Client) -> None:
+    logger.warning(f"Restarting client {index}")
+    try:
+        if client.is_connected:
+            await asyncio.wait_for(client.restart(), Var.HEALTH_CHECK_TIMEOUT * 3)
+        else:
+            await asyncio.wait_for(client.start(), Var.HEALTH_CHECK_TIMEOUT * 3)
+        logger.info(f"Restarted client {index}")
+    except Exception as e:
+        logger.error(f"Failed restarting client {index}: {e}")
+    finally:
+        _restarting.pop(index, None)
+
+
+async def probe_client(index: int, client: Client) -> None:
+    breaker = client_breaker(index)
+    if breaker.state == OPEN and not breaker.allow():
+        return
+    try:
+        await asyncio.wait_for(
+            client.invoke(raw.functions.users.GetUsers(id=[raw.types.InputUserSelf()])),
+            Var.HEALTH_CHECK_TIMEOUT,
+        )
+        breaker.record_success()
+    except Exception as e:
+        breaker.record_failure(e)
+        if breaker.state == OPEN and index not in _restarting:
+            _restarting[index] = asyncio.create_task(restart_client(index, client))
+        return
+
+    for dc_id, session in list(client.media_sessions.items()):
+        dc = dc_breaker(index, dc_id)
+        try:
+            await asyncio.wait_for(
+                session.invoke(raw.functions.Ping(ping_id=random.getrandbits(63))),
+                Var.HEALTH_CHECK_TIMEOUT,
+            )
+            dc.record_success()
+        except Exception as e:
+            dc.record_failure(e)
+            if dc.state == OPEN:
+                # Let the next request on this DC build a fresh session
+                await drop_media_session(client, dc_id)
+
+
+async def health_monitor() -> None:
+    """
+    Periodically probes every client and its media sessions, feeding the circuit breakers.
+    """
+    logger.info(f"Started with {Var.HEALTH_CHECK_INTERVAL}s interval between probes")
+    while True:
+        await asyncio.sleep(Var.HEALTH_CHECK_INTERVAL)
+        await asyncio.gather(
+            *[probe_client(index, client) for index, client in list(multi_clients.items())],
+            return_exceptions=True,
+        )
+
+
+def forget_client(index: int) -> None:
+    client_breakers.pop(index, None)
+    for key in [key for key in dc_breakers if key[0] == index]:
+        dc_breakers.pop(key, None)
+
+
+def health_status() -> Dict[str, Dict[str, object]]:
+    status = {}
+    for index in sorted(multi_clients):
+        entry = client_breaker(index).status()
+        entry["dcs"] = dict(
+            (str(dc_id), breaker.status())
+            for (i, dc_id), breaker in sorted(dc_breakers.items())
+            if i == index
+        )
+        status[str(index)] = entry
+    return status
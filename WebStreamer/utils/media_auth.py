@@ -0,0 +1,79 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import json
+import logging
+from typing import Optional
+from pyrogram import Client
+from WebStreamer.vars import Var
+from WebStreamer.bot import sessions_dir
+
+logger = logging.getLogger("media_auth")
+
+media_auth_dir = os.path.join(sessions_dir, "media_auth")
+
+
+def _auth_path(client: Client, dc_id: int) -> str:
+    return os.path.join(media_auth_dir, f"{client.name}.dc{dc_id}.json")
+
+
+async def load_media_auth(client: Client, dc_id: int) -> Optional[bytes]:
+    """
+    Returns the stored, already authorized auth key of a client for a DC.
+    Returns None when session files are disabled, nothing was stored,
+    or the key belongs to a different bot than the one now using this session name.
+    """
+    if not Var.USE_SESSION_FILE:
+        return None
+    path = _auth_path(client, dc_id)
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        if data.get("user_id") != await client.storage.user_id():
+            logger.debug(f"Stored media auth for client {client.name} DC {dc_id} is for another bot")
+            return None
+        if data.get("test_mode") != await client.storage.test_mode():
+            return None
+        return bytes.fromhex(data["auth_key"])
+    except FileNotFoundError:
+        return None
+    except (OSError, ValueError, KeyError, TypeError):
+        logger.warning(f"Ignoring unreadable media auth file {path}", exc_info=True)
+        return None
+
+
+async def save_media_auth(client: Client, dc_id: int, auth_key: bytes) -> None:
+    """
+    Stores an authorized media auth key next to the session files so the next boot can reuse it.
+    """
+    if not Var.USE_SESSION_FILE:
+        return
+    path = _auth_path(client, dc_id)
+    data = {
+        "user_id": await client.storage.user_id(),
+        "test_mode": await client.storage.test_mode(),
+        "auth_key": auth_key.hex(),
+    }
+    try:
+        os.makedirs(media_auth_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(data, f)
+        os.replace(tmp_path, path)
+        logger.debug(f"Stored media auth for client {client.name} DC {dc_id}")
+    except OSError:
+        logger.warning(f"Couldn't store media auth file {path}", exc_info=True)
+
+
+def drop_media_auth(client: Client, dc_id: int) -> None:
+    """
+    Removes a stored media auth key, e.g. after Telegram rejected it.
+    """
+    try:
+        os.remove(_auth_path(client, dc_id))
+        logger.debug(f"Dropped media auth for client {client.name} DC {dc_id}")
+    except FileNotFoundError:
+        pass
+    except OSError:
+        logger.warning(f"Couldn't remove media auth for client {client.name} DC {dc_id}", exc_info=True)
@@ -0,0 +1,398 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import time
+import asyncio
+import struct
+import logging
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+from WebStreamer.vars import Var
+
+logger = logging.getLogger("media_index")
+
+MP4_MIME_TYPES = ("video/mp4", "video/quicktime", "video/x-m4v", "audio/mp4", "audio/x-m4a")
+MKV_MIME_TYPES = ("video/x-matroska", "video/webm", "audio/x-matroska", "audio/webm")
+MP4_EXTENSIONS = (".mp4", ".m4v", ".mov", ".m4a")
+MKV_EXTENSIONS = (".mkv", ".webm", ".mka")
+
+# top-level MP4 boxes walked before giving up on finding moov
+MP4_MAX_BOXES = 64
+# last-use times of served files are written at most this often (seconds), and before evicting
+LAST_USED_FLUSH_INTERVAL = 60
+
+EBML_HEADER_ID = 0x1A45DFA3
+MKV_SEGMENT_ID = 0x18538067
+MKV_SEEK_HEAD_ID = 0x114D9B74
+MKV_SEEK_ID = 0x4DBB
+MKV_SEEK_ID_ID = 0x53AB
+MKV_SEEK_POSITION_ID = 0x53AC
+MKV_CUES_ID = 0x1C53BB6B
+MKV_CLUSTER_ID = 0x1F43B675
+
+# fetch(offset) returns the chunk of the file starting at a chunk-aligned offset
+ChunkFetcher = Callable[[int], Awaitable[bytes]]
+
+
+def container_of(mime_type: str, file_name: str) -> Optional[str]:
+    mime_type = (mime_type or "").lower()
+    file_name = (file_name or "").lower()
+    if mime_type in MP4_MIME_TYPES or file_name.endswith(MP4_EXTENSIONS):
+        return "mp4"
+    if mime_type in MKV_MIME_TYPES or file_name.endswith(MKV_EXTENSIONS):
+        return "mkv"
+    return None
+
+
+class RangeReader:
+    def __init__(self, fetch: ChunkFetcher, chunk_size: int, file_size: int):
+        """Reads arbitrary byte ranges of a file through chunk-aligned fetches."""
+        self.fetch = fetch
+        self.chunk_size = chunk_size
+        self.file_size = file_size
+        self.fetched = 0
+
+    async def read(self, offset: int, length: int) -> bytes:
+        end = min(offset + length, self.file_size)
+        data = bytearray()
+        chunk_offset = offset - offset % self.chunk_size
+        while chunk_offset < end:
+            chunk = await self.fetch(chunk_offset)
+            self.fetched += 1
+            if not chunk:
+                break
+            data.extend(chunk)
+            chunk_offset += self.chunk_size
+        start = offset % self.chunk_size
+        return bytes(data[start:start + end - offset])
+
+
+def read_vint(data: bytes, pos: int, keep_marker: bool = False) -> Tuple[Optional[int], int]:
+    """
+    Decodes an EBML variable-length integer; returns (value, length).
+    Sizes with every value bit set mean "unknown" and come back as None.
+    """
+    first = data[pos]
+    length = 1
+    mask = 0x80
+    while length <= 8 and not first & mask:
+        mask >>= 1
+        length += 1
+    if length > 8:
+        raise ValueError("Invalid EBML variable-length integer")
+    value = first if keep_marker else first & (mask - 1)
+    for byte in data[pos + 1:pos + length]:
+        value = (value << 8) | byte
+    if not keep_marker and value == (1 << (7 * length)) - 1:
+        return None, length
+    return value, length
+
+
+def read_element(data: bytes, pos: int) -> Tuple[int, Optional[int], int]:
+    """
+    Reads an EBML element header; returns (id, data size, header length).
+    """
+    element_id, id_length = read_vint(data, pos, keep_marker=True)
+    size, size_length = read_vint(data, pos + id_length)
+    return element_id, size, id_length + size_length
+
+
+async def find_mp4_index(reader: RangeReader) -> Optional[Tuple[int, int]]:
+    """
+    Walks the top-level MP4 boxes by their headers and returns the (offset, size) of moov.
+    """
+    offset = 0
+    for _ in range(MP4_MAX_BOXES):
+        if offset + 8 > reader.file_size:
+            return None
+        header = await reader.read(offset, 16)
+        if len(header) < 8:
+            return None
+        size, box_type = struct.unpack(">I4s", header[:8])
+        if size == 1 and len(header) >= 16:
+            size = struct.unpack(">Q", header[8:16])[0]
+        elif size == 0:
+            size = reader.file_size - offset
+        if size < 8:
+            return None
+        if box_type == b"moov":
+            return offset, size
+        offset += size
+    return None
+
+
+async def find_mkv_index(reader: RangeReader) -> Optional[Tuple[int, int]]:
+    """
+    Follows the SeekHead at the start of the Segment to the Cues element and returns its (offset, size).
+    """
+    head = await reader.read(0, reader.chunk_size)
+    element_id, size, header_length = read_element(head, 0)
+    if element_id != EBML_HEADER_ID or size is None:
+        return None
+    pos = header_length + size
+    element_id, _, header_length = read_element(head, pos)
+    if element_id != MKV_SEGMENT_ID:
+        return None
+    segment_start = pos + header_length
+    pos = segment_start
+    cues_position = None
+    while pos + 12 <= len(head) and cues_position is None:
+        element_id, size, header_length = read_element(head, pos)
+        if element_id == MKV_CUES_ID:
+            cues_position = pos - segment_start
+        elif element_id == MKV_SEEK_HEAD_ID and size is not None:
+            cues_position = parse_seek_head(head[pos + header_length:pos + header_length + size])
+        elif element_id == MKV_CLUSTER_ID or size is None:
+            break
+        pos += header_length + (size or 0)
+    if cues_position is None:
+        return None
+    offset = segment_start + cues_position
+    header = await reader.read(offset, 16)
+    element_id, size, header_length = read_element(header, 0)
+    if element_id != MKV_CUES_ID or size is None:
+        return None
+    return offset, header_length + size
+
+
+def parse_seek_head(data: bytes) -> Optional[int]:
+    pos = 0
+    while pos < len(data):
+        element_id, size, header_length = read_element(data, pos)
+        if size is None:
+            return None
+        if element_id == MKV_SEEK_ID:
+            seek = data[pos + header_length:pos + header_length + size]
+            seek_id = seek_position = None
+            inner = 0
+            while inner < len(seek):
+                inner_id, inner_size, inner_header = read_element(seek, inner)
+                value = seek[inner + inner_header:inner + inner_header + (inner_size or 0)]
+                if inner_id == MKV_SEEK_ID_ID:
+                    seek_id = int.from_bytes(value, "big")
+                elif inner_id == MKV_SEEK_POSITION_ID:
+                    seek_position = int.from_bytes(value, "big")
+                inner += inner_header + (inner_size or 0)
+            if seek_id == MKV_CUES_ID and seek_position is not None:
+                return seek_position
+        pos += header_length + size
+    return None
+
+
+class MediaIndex:
+    def __init__(self, path: str, max_bytes: int, max_region: int):
+        """A persistent store of the chunks holding a container's index (MP4 moov, MKV Cues).
+        attributes:
+            path: the SQLite database file.
+            max_bytes: the total size of stored chunks; least recently used files go first.
+            max_region: the largest index region stored for a single file.
+
+        functions:
+            get: returns a stored chunk of a file.
+            build: locates a file's index with a few range reads and stores the chunks covering it.
+
+        SQLite reads and writes run on a single worker thread, never on the event loop.
+
+        Players fetch these regions before they can start or seek, and for files without
+        faststart they sit at the very end; keeping them by unique_id across restarts means
+        only the first viewer of a file ever waits for them.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.max_region = max_region
+        self._db: Optional[sqlite3.Connection] = None
+        self._scanned: Optional[Set[str]] = None
+        self._stored: Set[str] = set()
+        # unique_id -> last use not yet written to the files table
+        self._last_used: Dict[str, int] = {}
+        self._flushed_at = time.monotonic()
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="media_index")
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        return self._ensure_open()
+
+    def _ensure_open(self) -> sqlite3.Connection:
+        """
+        Connects on first use, creating the tables and loading which files were scanned.
+        """
+        if self._db is None:
+            os.makedirs(os.path.dirname(os.path.abspath(self.path)), exist_ok=True)
+            self._db = sqlite3.connect(self.path, check_same_thread=False)
+            self._db.executescript(
+                """
+                CREATE TABLE IF NOT EXISTS files (
+                    unique_id TEXT PRIMARY KEY,
+                    container TEXT,
+                    region_offset INTEGER,
+                    region_size INTEGER,
+                    stored_bytes INTEGER NOT NULL DEFAULT 0,
+                    last_used INTEGER
+                );
+                CREATE TABLE IF NOT EXISTS chunks (
+                    unique_id TEXT NOT NULL,
+                    offset INTEGER NOT NULL,
+                    data BLOB NOT NULL,
+                    PRIMARY KEY (unique_id, offset)
+                );
+                """
+            )
+            self._db.commit()
+            self._scanned = set()
+            for unique_id, stored_bytes in self._db.execute("SELECT unique_id, stored_bytes FROM files"):
+                self._scanned.add(unique_id)
+                if stored_bytes:
+                    self._stored.add(unique_id)
+        return self._db
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_bytes > 0
+
+    def is_scanned(self, unique_id: str) -> bool:
+        self._ensure_open()
+        return unique_id in self._scanned
+
+    async def get(self, unique_id: str, offset: int) -> Optional[bytes]:
+        if not unique_id or not self.is_scanned(unique_id) or unique_id not in self._stored:
+            return None
+        chunk = await self._run(self._read_chunk, unique_id, offset)
+        if chunk is None:
+            return None
+        self._last_used[unique_id] = int(time.time())
+        if time.monotonic() - self._flushed_at >= LAST_USED_FLUSH_INTERVAL:
+            self._flushed_at = time.monotonic()
+            await self._run(self._write_last_used, self._take_last_used())
+        return chunk
+
+    async def _run(self, func: Callable, *args):
+        # BLOB reads and writes of whole regions would stall every stream on the event loop;
+        # one worker thread keeps them off it and in order
+        return await asyncio.get_running_loop().run_in_executor(self._executor, func, *args)
+
+    def _read_chunk(self, unique_id: str, offset: int) -> Optional[bytes]:
+        row = self.db.execute(
+            "SELECT data FROM chunks WHERE unique_id = ? AND offset = ?", (unique_id, offset)
+        ).fetchone()
+        return row[0] if row else None
+
+    def _take_last_used(self) -> Dict[str, int]:
+        last_used, self._last_used = self._last_used, {}
+        return last_used
+
+    def _write_last_used(self, last_used: Dict[str, int]) -> None:
+        if not last_used:
+            return
+        with self.db:
+            self.db.executemany(
+                "UPDATE files SET last_used = ? WHERE unique_id = ?",
+                [(used, unique_id) for unique_id, used in last_used.items()],
+            )
+
+    def flush_last_used(self) -> None:
+        """
+        Writes the last-use times collected by get right away, e.g. on shutdown.
+        """
+        self._write_last_used(self._take_last_used())
+
+    async def build(self, unique_id: str, container: str, file_size: int,
+                    fetch: ChunkFetcher, chunk_size: int) -> Optional[Tuple[int, int]]:
+        """
+        Finds the index region of a file and stores the chunk-aligned chunks that cover it.
+        The outcome is remembered even when nothing is found, so a file is only ever scanned once.
+        """
+        if not self.enabled or self.is_scanned(unique_id):
+            return None
+        reader = RangeReader(fetch, chunk_size, file_size)
+        try:
+            if container == "mp4":
+                region = await find_mp4_index(reader)
+            else:
+                region = await find_mkv_index(reader)
+        except (ValueError, IndexError, struct.error) as e:
+            logger.debug(f"Couldn't parse {container} container of {unique_id}: {e}")
+            region = None
+        chunks: List[Tuple[int, bytes]] = []
+        stored_bytes = 0
+        if region and region[1] <= self.max_region:
+            offset, size = region
+            end = min(offset + size, file_size)
+            chunk_offset = offset - offset % chunk_size
+            while chunk_offset < end:
+                chunk = await fetch(chunk_offset)
+                if not chunk:
+                    break
+                chunks.append((chunk_offset, chunk))
+                stored_bytes += len(chunk)
+                chunk_offset += chunk_size
+        row = (unique_id, container, region[0] if region else None, region[1] if region else None,
+               stored_bytes, int(time.time()))
+        evicted = await self._run(self._store, row, chunks, self._take_last_used())
+        self._scanned.add(unique_id)
+        if stored_bytes:
+            self._stored.add(unique_id)
+        for evicted_id in evicted:
+            self._dropped(evicted_id)
+        logger.info(f"Indexed {container} file {unique_id}: region {region}, {reader.fetched} reads, {stored_bytes} bytes stored")
+        return region
+
+    def _store(self, row: Tuple, chunks: List[Tuple[int, bytes]], last_used: Dict[str, int]) -> List[str]:
+        """
+        Writes a file's row and region chunks in one transaction and evicts what no longer fits.
+        Returns the unique_ids of the evicted files.
+        """
+        unique_id, stored_bytes = row[0], row[4]
+        with self.db:
+            self.db.executemany(
+                "UPDATE files SET last_used = ? WHERE unique_id = ?",
+                [(used, used_id) for used_id, used in last_used.items()],
+            )
+            self.db.executemany(
+                "INSERT OR REPLACE INTO chunks VALUES (?, ?, ?)",
+                [(unique_id, chunk_offset, chunk) for chunk_offset, chunk in chunks],
+            )
+            self.db.execute("INSERT OR REPLACE INTO files VALUES (?, ?, ?, ?, ?, ?)", row)
+            return self._evict() if stored_bytes else []
+
+    def _evict(self) -> List[str]:
+        total = self.db.execute("SELECT COALESCE(SUM(stored_bytes), 0) FROM files").fetchone()[0]
+        evicted = []
+        if total <= self.max_bytes:
+            return evicted
+        for unique_id, stored_bytes in self.db.execute(
+            "SELECT unique_id, stored_bytes FROM files WHERE stored_bytes > 0 ORDER BY last_used"
+        ).fetchall():
+            if total <= self.max_bytes:
+                break
+            self._delete(unique_id)
+            evicted.append(unique_id)
+            total -= stored_bytes
+        return evicted
+
+    def _delete(self, unique_id: str) -> None:
+        self.db.execute("DELETE FROM chunks WHERE unique_id = ?", (unique_id,))
+        self.db.execute("DELETE FROM files WHERE unique_id = ?", (unique_id,))
+
+    def _dropped(self, unique_id: str) -> None:
+        self._stored.discard(unique_id)
+        self._last_used.pop(unique_id, None)
+        if self._scanned is not None:
+            self._scanned.discard(unique_id)
+
+    async def forget(self, unique_id: str) -> None:
+        """
+        Drops a file's stored chunks; it's scanned again next time it's streamed.
+        """
+        def delete():
+            with self.db:
+                self._delete(unique_id)
+        await self._run(delete)
+        self._dropped(unique_id)
+
+media_index = MediaIndex(
+    os.path.join(Var.DATA_DIR, "media_index.db"),
+    Var.MEDIA_INDEX_SIZE * 1024 * 1024,
+    Var.MEDIA_INDEX_MAX_REGION * 1024 * 1024,
+)
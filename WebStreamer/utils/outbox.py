@@ -0,0 +1,280 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import time
+import asyncio
+import logging
+import itertools
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Set, Tuple
+from pyrogram import errors
+from pyrogram.types import Message
+from WebStreamer.vars import Var
+
+logger = logging.getLogger("outbox")
+
+# lower goes first: replies the user waits for, then copies into BIN_CHANNEL, then progress edits
+REPLY = 0
+BIN = 1
+PROGRESS = 2
+
+# messages a private chat / a group or channel may take at once before the rate applies
+CHAT_BURST = 3
+GROUP_BURST = 5
+# BIN_CHANNEL takes every user's files: it has no rate of its own and only backs off on FloodWait,
+# and its order doesn't matter, so this many sends to it may be in flight at once
+BIN_CONCURRENCY = 4
+# a call that keeps hitting flood waits fails after this many retries
+FLOOD_RETRIES = 5
+# last text sent per edited message, to skip edits that change nothing
+SENT_TEXT_CACHE_SIZE = 1024
+
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: float):
+        """Allows rate calls per second on average and up to burst at once."""
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.stamp = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def ready_in(self, now: float) -> float:
+        self._refill(now)
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self, now: float) -> None:
+        self._refill(now)
+        self.tokens -= 1
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class Chat:
+    def __init__(self, chat_id: int):
+        """Send state of one chat: its rate limit, flood wait and the calls in flight."""
+        self.bucket: Optional[TokenBucket] = None
+        self.concurrency = 1
+        if chat_id == Var.BIN_CHANNEL:
+            self.concurrency = BIN_CONCURRENCY
+        elif chat_id > 0:
+            self.bucket = TokenBucket(Var.OUTBOX_CHAT_RATE, CHAT_BURST)
+        else:
+            self.bucket = TokenBucket(Var.OUTBOX_GROUP_RATE / 60, GROUP_BURST)
+        self.blocked_until = 0.0
+        self.in_flight = 0
+
+    @property
+    def busy(self) -> bool:
+        return self.in_flight >= self.concurrency
+
+    def ready_in(self, now: float) -> float:
+        return max(self.blocked_until - now, self.bucket.ready_in(now) if self.bucket else 0.0)
+
+    def idle(self, now: float) -> bool:
+        return not self.in_flight and self.blocked_until <= now and (self.bucket is None or self.bucket.full(now))
+
+
+class Job:
+    def __init__(self, priority: int, seq: int, chat_id: int, func: Callable, args: Tuple, kwargs: Dict,
+                 future: asyncio.Future, key: Optional[Tuple[int, int]] = None):
+        self.priority = priority
+        self.seq = seq
+        self.chat_id = chat_id
+        self.func = func
+        self.args = args
+        self.kwargs = kwargs
+        self.future = future
+        # (chat id, message id) of an edit, which later edits of the same message replace
+        self.key = key
+        self.attempts = 0
+
+    def order(self) -> Tuple[int, int]:
+        return self.priority, self.seq
+
+
+class Outbox:
+    def __init__(self):
+        """Sends every outgoing bot message from one queue.
+        functions:
+            call: queues any send call for a chat and returns a future with its result.
+            reply: queues a reply to a message.
+            edit_text: queues an edit; pending edits of the same message are merged.
+
+        Calls go out by priority within a global rate and a per-chat rate (BIN_CHANNEL has
+        none of its own, so link generation isn't capped by a group's rate). A FloodWait
+        pauses only the chat it came from, and the call is retried once the wait is over;
+        handlers await their future, or don't, instead of sleeping in a pyrogram worker.
+        An edit that is still queued takes the text of newer edits, and an edit to the
+        text already shown isn't sent.
+        """
+        self.jobs: List[Job] = []
+        self.chats: Dict[int, Chat] = {}
+        self.edits: Dict[Tuple[int, int], Job] = {}
+        self.sent_text: "OrderedDict[Tuple[int, int], str]" = OrderedDict()
+        self.bucket = TokenBucket(Var.OUTBOX_GLOBAL_RATE, Var.OUTBOX_GLOBAL_RATE)
+        self._seq = itertools.count()
+        self._runner: Optional[asyncio.Task] = None
+        self._wake: Optional[asyncio.Event] = None
+        # asyncio keeps only weak references to tasks; a send dropped mid-flight would never
+        # release its chat
+        self._sending: Set[asyncio.Task] = set()
+
+    def call(self, chat_id: int, func: Callable, *args, priority: int = REPLY, **kwargs) -> asyncio.Future:
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_error)
+        self._push(Job(priority, next(self._seq), chat_id, func, args, kwargs, future))
+        return future
+
+    def reply(self, m: Message, text: str, priority: int = REPLY, **kwargs) -> asyncio.Future:
+        return self.call(m.chat.id, m.reply, text, priority=priority, **kwargs)
+
+    def edit_text(self, msg: Message, text: str, priority: int = PROGRESS, **kwargs) -> asyncio.Future:
+        """
+        Resolves to the edited message, or None when the edit was skipped or replaced by a newer one.
+        """
+        key = (msg.chat.id, msg.id)
+        job = self.edits.get(key)
+        if job is not None:
+            # still queued: the newest text wins and keeps the earlier place in the queue
+            job.args = (text,)
+            job.kwargs = kwargs
+            if priority < job.priority:
+                job.priority = priority
+            return job.future
+        future = asyncio.get_running_loop().create_future()
+        future.add_done_callback(_consume_error)
+        if self._unchanged(key, text, kwargs, msg.text):
+            future.set_result(None)
+            return future
+        job = Job(priority, next(self._seq), msg.chat.id, msg.edit_text, (text,), kwargs, future, key)
+        self.edits[key] = job
+        self._push(job)
+        return future
+
+    def _unchanged(self, key: Tuple[int, int], text: str, kwargs: Dict, shown: Optional[str] = None) -> bool:
+        # a new keyboard is a change even with the same text
+        return "reply_markup" not in kwargs and self.sent_text.get(key, shown) == text
+
+    def _push(self, job: Job) -> None:
+        self.jobs.append(job)
+        if self._wake is None:
+            self._wake = asyncio.Event()
+        self._wake.set()
+        if self._runner is None or self._runner.done():
+            self._runner = asyncio.create_task(self._run())
+
+    def _chat(self, chat_id: int) -> Chat:
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            chat = self.chats[chat_id] = Chat(chat_id)
+        return chat
+
+    def _next_job(self, now: float) -> Tuple[Optional[Job], Optional[float]]:
+        """
+        Returns the first job that may go out now, or None and how long until one might.
+        """
+        wait = self.bucket.ready_in(now)
+        if wait > 0:
+            return None, wait
+        wait = None
+        for job in sorted(self.jobs, key=Job.order):
+            chat = self._chat(job.chat_id)
+            if chat.busy:
+                # one call per chat at a time keeps its messages in order (BIN_CHANNEL takes a few,
+                # its order doesn't matter); the end of a call wakes the loop
+                continue
+            delay = chat.ready_in(now)
+            if delay <= 0:
+                return job, None
+            wait = delay if wait is None else min(wait, delay)
+        return None, wait
+
+    async def _run(self) -> None:
+        while self.jobs:
+            now = time.monotonic()
+            job, wait = self._next_job(now)
+            if job is None:
+                self._wake.clear()
+                try:
+                    await asyncio.wait_for(self._wake.wait(), wait)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            self.jobs.remove(job)
+            if job.key is not None and self.edits.get(job.key) is job:
+                del self.edits[job.key]
+            chat = self._chat(job.chat_id)
+            chat.in_flight += 1
+            self.bucket.take(now)
+            if chat.bucket is not None:
+                chat.bucket.take(now)
+            task = asyncio.create_task(self._execute(chat, job))
+            self._sending.add(task)
+            task.add_done_callback(self._sending.discard)
+        self._prune()
+
+    async def _execute(self, chat: Chat, job: Job) -> None:
+        try:
+            if job.key is not None and self._unchanged(job.key, job.args[0], job.kwargs):
+                job.future.set_result(None)
+                return
+            result = await job.func(*job.args, **job.kwargs)
+        except errors.FloodWait as e:
+            chat.blocked_until = time.monotonic() + e.value
+            logger.warning(f"Flood wait of {e.value}s for chat {job.chat_id}")
+            self._retry(job, e)
+        except errors.MessageNotModified:
+            if job.key is not None:
+                self._remember(job.key, job.args[0])
+            job.future.set_result(None)
+        except Exception as e:
+            if not job.future.done():
+                job.future.set_exception(e)
+        else:
+            if job.key is not None:
+                self._remember(job.key, job.args[0])
+            if not job.future.done():
+                job.future.set_result(result)
+        finally:
+            chat.in_flight -= 1
+            self._wake.set()
+
+    def _remember(self, key: Tuple[int, int], text: str) -> None:
+        self.sent_text[key] = text
+        self.sent_text.move_to_end(key)
+        while len(self.sent_text) > SENT_TEXT_CACHE_SIZE:
+            self.sent_text.popitem(last=False)
+
+    def _retry(self, job: Job, error: Exception) -> None:
+        if job.key is not None and job.key in self.edits:
+            # a newer edit of the same message is already queued and goes out instead
+            job.future.set_result(None)
+            return
+        job.attempts += 1
+        if job.attempts > FLOOD_RETRIES:
+            job.future.set_exception(error)
+            return
+        if job.key is not None:
+            self.edits[job.key] = job
+        self._push(job)
+
+    def _prune(self) -> None:
+        # chats back to a full bucket and not waiting out a flood hold no state worth keeping
+        now = time.monotonic()
+        for chat_id in [chat_id for chat_id, chat in self.chats.items() if chat.idle(now)]:
+            del self.chats[chat_id]
+
+
+def _consume_error(future: asyncio.Future) -> None:
+    # callers that don't wait for a send still get its failure logged
+    if not future.cancelled() and future.exception() is not None:
+        logger.warning(f"Outgoing call failed: {future.exception()!r}")
+
+
+outbox = Outbox()
@@ -0,0 +1,189 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import os
+import json
+import logging
+from typing import Dict, Hashable, List, Optional
+from WebStreamer.vars import Var
+
+logger = logging.getLogger("popularity")
+
+SKETCH_DEPTH = 4
+# Files tracked for the bytes-served report; the least served ones are dropped beyond this
+TOP_TRACK_LIMIT = 1000
+
+
+class CountMinSketch:
+    def __init__(self, width: int, depth: int = SKETCH_DEPTH):
+        """A fixed-size frequency estimator that never under-counts.
+        attributes:
+            width: counters per row; more counters mean fewer collisions.
+            depth: independent rows; the estimate is the minimum over them.
+        """
+        self.width = width
+        self.depth = depth
+        self.rows = [[0] * width for _ in range(depth)]
+
+    def _indexes(self, key: Hashable):
+        for seed in range(self.depth):
+            yield hash((seed, key)) % self.width
+
+    def add(self, key: Hashable) -> None:
+        for row, i in zip(self.rows, self._indexes(key)):
+            row[i] += 1
+
+    def estimate(self, key: Hashable) -> int:
+        return min(row[i] for row, i in zip(self.rows, self._indexes(key)))
+
+    def halve(self) -> None:
+        for row in self.rows:
+            for i, value in enumerate(row):
+                if value:
+                    row[i] = value >> 1
+
+
+class Popularity:
+    def __init__(self, sample_size: int, pins_path: str):
+        """Tracks how often files and chunks are requested and how many bytes each file served.
+        attributes:
+            sample_size: requests after which every count is halved, so old popularity fades.
+            pins_path: the JSON file manual pins are persisted to.
+
+        functions:
+            record_request: counts a request for a chunk.
+            record_playback: counts a viewer's request for a file.
+            record_bytes: adds bytes served for a file.
+            admit: the TinyLFU admission test for the chunk cache.
+            pin / unpin / is_pinned: manual pins that are always admitted and never evicted.
+            top_files: the files that served the most bytes recently.
+        """
+        self.sample_size = sample_size
+        self.pins_path = pins_path
+        self.files = CountMinSketch(self._width(sample_size))
+        self.chunks = CountMinSketch(self._width(sample_size))
+        self.additions = 0
+        self.served: Dict[int, Dict] = {}
+        self.pins: Dict[int, Dict] = self._load_pins()
+
+    @staticmethod
+    def _width(sample_size: int) -> int:
+        width = 1024
+        while width < sample_size:
+            width <<= 1
+        return width
+
+    def record_request(self, media_id: int, offset: int, chunk_size: int) -> None:
+        self.chunks.add((media_id, offset, chunk_size))
+        self._added()
+
+    def record_playback(self, media_id: int) -> None:
+        """
+        Counted once per HTTP request that starts a file from its beginning; background reads
+        (warm-up, index scans, ZIP directories) and the chunks of a stream don't count.
+        """
+        self.files.add(media_id)
+        self._added()
+
+    def _added(self) -> None:
+        self.additions += 1
+        if self.additions >= self.sample_size:
+            self.decay()
+
+    def record_bytes(self, media_id: int, size: int, message_id: Optional[int] = None,
+                     file_name: Optional[str] = None) -> None:
+        entry = self.served.get(media_id)
+        if entry is None:
+            if len(self.served) >= TOP_TRACK_LIMIT:
+                self._prune()
+            entry = self.served[media_id] = {"message_id": message_id, "name": file_name, "bytes": 0}
+        entry["bytes"] += size
+
+    def _prune(self) -> None:
+        keep = sorted(self.served.items(), key=lambda x: x[1]["bytes"], reverse=True)[:TOP_TRACK_LIMIT // 2]
+        self.served = dict(keep)
+
+    def decay(self) -> None:
+        """
+        Halves every count, the TinyLFU reset that lets new favourites overtake old ones.
+        """
+        self.files.halve()
+        self.chunks.halve()
+        self.additions = 0
+        for media_id in list(self.served):
+            self.served[media_id]["bytes"] >>= 1
+            if not self.served[media_id]["bytes"]:
+                del self.served[media_id]
+        logger.debug("Decayed popularity counts")
+
+    def frequency(self, media_id: int, offset: int, chunk_size: int) -> int:
+        """
+        A chunk is as popular as its own count, or its file's when the whole file is hot
+        but this particular chunk hasn't been asked for much yet.
+        """
+        return max(self.chunks.estimate((media_id, offset, chunk_size)), self.files.estimate(media_id))
+
+    def admit(self, candidate: tuple, victim: tuple) -> bool:
+        """
+        Admits a new chunk into a full cache only if it's requested at least as often as the chunk it would evict.
+        Ties go to the newcomer so a cold cache keeps turning over; a scan still can't push out anything hotter.
+        """
+        if self.is_pinned(candidate[0]):
+            return True
+        return self.frequency(*candidate) >= self.frequency(*victim)
+
+    def is_pinned(self, media_id: int) -> bool:
+        return media_id in self.pins
+
+    def pin(self, media_id: int, message_id: int, file_name: Optional[str] = None) -> None:
+        self.pins[media_id] = {"message_id": message_id, "name": file_name}
+        self._save_pins()
+
+    def unpin(self, media_id: int) -> bool:
+        if self.pins.pop(media_id, None) is None:
+            return False
+        self._save_pins()
+        return True
+
+    def find_pin(self, message_id: int) -> Optional[int]:
+        for media_id, pin in self.pins.items():
+            if pin["message_id"] == message_id:
+                return media_id
+        return None
+
+    def list_pins(self) -> List[Dict]:
+        return [{"media_id": media_id, **pin} for media_id, pin in self.pins.items()]
+
+    def top_files(self, limit: int = 20) -> List[Dict]:
+        top = sorted(self.served.items(), key=lambda x: x[1]["bytes"], reverse=True)[:limit]
+        return [
+            {"media_id": media_id, "requests": self.files.estimate(media_id), **entry}
+            for media_id, entry in top
+        ]
+
+    def _load_pins(self) -> Dict[int, Dict]:
+        try:
+            with open(self.pins_path, "r", encoding="utf-8") as f:
+                return {int(media_id): pin for media_id, pin in json.load(f).items()}
+        except FileNotFoundError:
+            return {}
+        except (OSError, ValueError, AttributeError):
+            logger.warning(f"Ignoring unreadable pins file {self.pins_path}", exc_info=True)
+            return {}
+
+    def _save_pins(self) -> None:
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(self.pins_path)), exist_ok=True)
+            tmp_path = self.pins_path + ".tmp"
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({str(media_id): pin for media_id, pin in self.pins.items()}, f, ensure_ascii=False)
+            os.replace(tmp_path, self.pins_path)
+        except OSError:
+            logger.warning(f"Couldn't store pins file {self.pins_path}", exc_info=True)
+
+
+# TinyLFU resets after roughly ten times as many requests as the cache holds chunks
+popularity = Popularity(
+    max(1024, 10 * Var.CHUNK_CACHE_SIZE),
+    os.path.join(Var.DATA_DIR, "pins.json"),
+)
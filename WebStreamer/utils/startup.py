@@ -0,0 +1,24 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import time
+import logging
+from typing import List, Tuple
+
+logger = logging.getLogger("startup")
+
+_started = time.monotonic()
+timeline: List[Tuple[float, str]] = []
+
+
+def mark(stage: str) -> None:
+    """
+    Records a startup milestone with the seconds elapsed since the process started.
+    """
+    elapsed = time.monotonic() - _started
+    timeline.append((elapsed, stage))
+    logger.info(f"[+{elapsed:.2f}s] {stage}")
+
+
+def summary() -> str:
+    return ", ".join(f"{stage} @ {elapsed:.2f}s" for elapsed, stage in timeline)
@@ -0,0 +1,188 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import io
+import os
+import asyncio
+import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Optional, Tuple
+from pyrogram.file_id import FileId
+from WebStreamer.vars import Var
+
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+logger = logging.getLogger("thumbnails")
+
+# GetFile limit used to read a whole thumbnail; thumbnails are far smaller than this
+THUMB_CHUNK_SIZE = 1024 * 1024
+MIN_WIDTH = 16
+MAX_WIDTH = 2048
+FORMATS = {"jpeg": "image/jpeg", "webp": "image/webp"}
+
+
+def image_type(data: bytes) -> str:
+    if data[:3] == b"\xff\xd8\xff":
+        return "image/jpeg"
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP":
+        return "image/webp"
+    if data[:8] == b"\x89PNG\r\n\x1a\n":
+        return "image/png"
+    return "application/octet-stream"
+
+
+def pick_thumbnail(file_id: FileId, width: Optional[int]) -> Optional[Tuple[str, int, int]]:
+    """
+    Chooses the Telegram thumbnail to serve for a requested width:
+    the smallest one at least that wide, or the largest one when none is.
+    Returns (thumbnail file_id, width, height) or None if the media has no thumbnails.
+    """
+    thumbs: List[Tuple[str, int, int]] = getattr(file_id, "thumbs", None) or []
+    if not thumbs:
+        return None
+    thumbs = sorted(thumbs, key=lambda thumb: thumb[1])
+    if width:
+        for thumb in thumbs:
+            if thumb[1] >= width:
+                return thumb
+    return thumbs[-1]
+
+
+def render(data: bytes, width: int, fmt: str, quality: int) -> bytes:
+    """
+    Resizes and re-encodes an image. Runs in a worker process, never on the event loop.
+    """
+    with Image.open(io.BytesIO(data)) as image:
+        image = image.convert("RGB")
+        if image.width > width:
+            height = max(1, round(image.height * width / image.width))
+            image = image.resize((width, height), Image.LANCZOS)
+        out = io.BytesIO()
+        image.save(out, format=fmt.upper(), quality=quality)
+        return out.getvalue()
+
+
+class ThumbnailCache:
+    def __init__(self, path: str, max_bytes: int):
+        """A bounded LRU cache of rendered thumbnails on disk.
+        attributes:
+            path: the directory the thumbnails are kept in.
+            max_bytes: the total size kept; the least recently used files are removed first.
+
+        A file's modification time doubles as its last use, so the LRU order survives restarts.
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        self.size: Optional[int] = None
+
+    def _file(self, key: str) -> str:
+        return os.path.join(self.path, key)
+
+    def get(self, key: str) -> Optional[bytes]:
+        if self.max_bytes <= 0:
+            return None
+        path = self._file(key)
+        try:
+            with open(path, "rb") as f:
+                data = f.read()
+            os.utime(path)
+            return data
+        except OSError:
+            return None
+
+    def put(self, key: str, data: bytes) -> None:
+        if self.max_bytes <= 0 or len(data) > self.max_bytes:
+            return
+        try:
+            os.makedirs(self.path, exist_ok=True)
+            if self.size is None:
+                self.size = sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+            tmp_path = self._file(key) + ".tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(data)
+            os.replace(tmp_path, self._file(key))
+            self.size += len(data)
+            if self.size > self.max_bytes:
+                self.evict()
+        except OSError:
+            logger.warning(f"Couldn't store thumbnail {key}", exc_info=True)
+
+    def evict(self) -> None:
+        entries = sorted(
+            (entry for entry in os.scandir(self.path) if entry.is_file()),
+            key=lambda entry: entry.stat().st_mtime,
+        )
+        self.size = sum(entry.stat().st_size for entry in entries)
+        # trim to 90% so a full cache doesn't rescan the directory on every put
+        target = self.max_bytes * 9 // 10
+        for entry in entries:
+            if self.size <= target:
+                break
+            try:
+                size = entry.stat().st_size
+                os.remove(entry.path)
+                self.size -= size
+            except OSError:
+                pass
+
+
+thumbnail_cache = ThumbnailCache(os.path.join(Var.DATA_DIR, "thumbs"), Var.THUMB_CACHE_SIZE * 1024 * 1024)
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def can_render() -> bool:
+    return Image is not None and Var.THUMB_WORKERS > 0
+
+
+async def resize(data: bytes, width: int, fmt: str, quality: int) -> bytes:
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=Var.THUMB_WORKERS)
+    return await asyncio.get_running_loop().run_in_executor(_pool, render, data, width, fmt, quality)
+
+
+async def get_thumbnail(tg_connect, file_id: FileId, width: Optional[int] = None,
+                        fmt: Optional[str] = None, quality: int = 80) -> Optional[Tuple[bytes, str]]:
+    """
+    Returns (image bytes, content type) of a preview of a media file, or None if it has no thumbnail.
+    Telegram's own thumbnail sizes are fetched directly; when Pillow is installed, a requested width
+    smaller than the closest Telegram size, or another format, is rendered in the worker pool.
+    Both the fetched and the rendered images are kept in the disk cache.
+    """
+    thumb = pick_thumbnail(file_id, width)
+    if thumb is None:
+        return None
+    thumb_file_id, thumb_width, _ = thumb
+    thumb_id = FileId.decode(thumb_file_id)
+    source_key = f"{file_id.unique_id}_{thumb_id.thumbnail_size or 'full'}"
+    data = thumbnail_cache.get(source_key)
+    if data is None:
+        data = bytearray()
+        offset = 0
+        while True:
+            # the thumbnail shares the media_id of its file, so it must stay out of the chunk cache
+            chunk = await tg_connect.fetch_chunk(thumb_id, offset, THUMB_CHUNK_SIZE, cache=False)
+            data.extend(chunk)
+            if len(chunk) < THUMB_CHUNK_SIZE:
+                break
+            offset += THUMB_CHUNK_SIZE
+        data = bytes(data)
+        if not data:
+            return None
+        thumbnail_cache.put(source_key, data)
+
+    wants_resize = width and width < thumb_width
+    wants_format = fmt and FORMATS.get(fmt) != image_type(data)
+    if not can_render() or not (wants_resize or wants_format):
+        return data, image_type(data)
+    fmt = fmt or "jpeg"
+    width = min(width or thumb_width, thumb_width)
+    key = f"{source_key}_{width}_{quality}.{fmt}"
+    rendered = thumbnail_cache.get(key)
+    if rendered is None:
+        rendered = await resize(data, width, fmt, quality)
+        thumbnail_cache.put(key, rendered)
+    return rendered, FORMATS[fmt]
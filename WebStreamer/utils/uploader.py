@@ -0,0 +1,257 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import math
+import asyncio
+import logging
+from typing import List, Optional, Union
+from pyrogram import Client, raw, types, utils
+from pyrogram.session import Session
+from pyrogram.file_id import FileId
+from WebStreamer.vars import Var
+from WebStreamer.bot import work_loads
+from .file_properties import get_media_from_message, get_name
+
+logger = logging.getLogger("uploader")
+
+# Telegram accepts upload parts of at most 512 KiB
+UPLOAD_PART_SIZE = 512 * 1024
+# Files above this size must be uploaded with SaveBigFilePart
+BIG_FILE_THRESHOLD = 10 * 1024 * 1024
+PART_RETRIES = 3
+# pyrogram's Session.start retries forever while the DC is unreachable
+SESSION_START_TIMEOUT = 30
+
+
+class PartUploader:
+    def __init__(self, client: Client, file_size: int, file_name: str):
+        """Uploads a file to Telegram part by part while its bytes are still arriving.
+        attributes:
+            client: the client the file is uploaded for; only it can send the result.
+            file_size: the exact size of the file, needed up front for the part count.
+            file_name: the name the uploaded file gets.
+
+        functions:
+            write: feeds bytes in order; blocks while the upload buffer is full.
+            finish: uploads what's left and returns the InputFile to send.
+            abort: stops the workers and drops the upload.
+
+        Parts go through a queue of UPLOAD_BUFFER_PARTS entries to UPLOAD_WORKERS workers sharing
+        one media session, so memory stays bounded by roughly
+        (UPLOAD_BUFFER_PARTS + UPLOAD_WORKERS + 1) * 512 KiB regardless of the file size.
+        """
+        self.client = client
+        self.file_size = file_size
+        self.file_name = file_name
+        self.is_big = file_size > BIG_FILE_THRESHOLD
+        self.total_parts = max(1, math.ceil(file_size / UPLOAD_PART_SIZE))
+        self.upload_id = client.rnd_id()
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=Var.UPLOAD_BUFFER_PARTS)
+        self.buffer = bytearray()
+        self.next_part = 0
+        self.session: Optional[Session] = None
+        self.workers: List[asyncio.Task] = []
+        self.error: Optional[BaseException] = None
+
+    async def start(self) -> "PartUploader":
+        self.session = Session(
+            self.client,
+            await self.client.storage.dc_id(),
+            await self.client.storage.auth_key(),
+            await self.client.storage.test_mode(),
+            is_media=True,
+        )
+        try:
+            await asyncio.wait_for(self.session.start(), SESSION_START_TIMEOUT)
+        except asyncio.TimeoutError:
+            logger.warning(f"Media session for upload {self.upload_id} didn't start in {SESSION_START_TIMEOUT}s")
+            try:
+                await self.close()
+            except Exception:
+                pass
+            raise
+        self.workers = [asyncio.create_task(self.worker()) for _ in range(Var.UPLOAD_WORKERS)]
+        return self
+
+    async def worker(self) -> None:
+        while True:
+            item = await self.queue.get()
+            try:
+                if item is None:
+                    return
+                if self.error is not None:
+                    # keep draining so writers never block on a queue nobody reads
+                    continue
+                part, data = item
+                await self.save_part(part, data)
+            except Exception as e:
+                self.error = e
+            finally:
+                self.queue.task_done()
+
+    async def save_part(self, part: int, data: bytes) -> None:
+        if self.is_big:
+            query = raw.functions.upload.SaveBigFilePart(
+                file_id=self.upload_id,
+                file_part=part,
+                file_total_parts=self.total_parts,
+                bytes=data,
+            )
+        else:
+            query = raw.functions.upload.SaveFilePart(file_id=self.upload_id, file_part=part, bytes=data)
+        for attempt in range(PART_RETRIES):
+            try:
+                if await self.session.invoke(query):
+                    return
+            except (OSError, asyncio.TimeoutError) as e:
+                if attempt == PART_RETRIES - 1:
+                    raise
+                logger.debug(f"Retrying part {part} of upload {self.upload_id}: {e}")
+        raise RuntimeError(f"Telegram refused part {part} of upload {self.upload_id}")
+
+    async def put_part(self, data: bytes) -> None:
+        if self.error is not None:
+            raise self.error
+        if self.next_part >= self.total_parts:
+            raise ValueError("Received more bytes than the declared file size")
+        await self.queue.put((self.next_part, data))
+        self.next_part += 1
+
+    async def write(self, data: bytes) -> None:
+        self.buffer.extend(data)
+        while len(self.buffer) >= UPLOAD_PART_SIZE:
+            part = bytes(self.buffer[:UPLOAD_PART_SIZE])
+            del self.buffer[:UPLOAD_PART_SIZE]
+            await self.put_part(part)
+
+    async def finish(self) -> Union[raw.types.InputFile, raw.types.InputFileBig]:
+        if self.buffer:
+            await self.put_part(bytes(self.buffer))
+            self.buffer.clear()
+        for _ in self.workers:
+            await self.queue.put(None)
+        await asyncio.gather(*self.workers)
+        await self.close()
+        if self.error is not None:
+            raise self.error
+        if self.next_part != self.total_parts:
+            raise ValueError(f"Upload ended after {self.next_part} of {self.total_parts} parts")
+        if self.is_big:
+            return raw.types.InputFileBig(id=self.upload_id, parts=self.total_parts, name=self.file_name)
+        return raw.types.InputFile(id=self.upload_id, parts=self.total_parts, name=self.file_name, md5_checksum="")
+
+    async def abort(self) -> None:
+        for task in self.workers:
+            task.cancel()
+        await self.close()
+
+    async def close(self) -> None:
+        if self.session is not None:
+            session, self.session = self.session, None
+            await session.stop()
+
+
+def build_input_media(message: types.Message, input_file, file_name: str, mime_type: str) -> raw.base.InputMedia:
+    """
+    Builds the InputMedia for an uploaded copy of a message's media, keeping its type attributes.
+    """
+    if message.photo:
+        return raw.types.InputMediaUploadedPhoto(file=input_file)
+    attributes = [raw.types.DocumentAttributeFilename(file_name=file_name)]
+    if message.video or message.animation:
+        video = message.video or message.animation
+        attributes.append(raw.types.DocumentAttributeVideo(
+            duration=video.duration or 0, w=video.width or 0, h=video.height or 0, supports_streaming=True,
+        ))
+        if message.animation:
+            attributes.append(raw.types.DocumentAttributeAnimated())
+    elif message.video_note:
+        attributes.append(raw.types.DocumentAttributeVideo(
+            duration=message.video_note.duration or 0, w=message.video_note.length or 0,
+            h=message.video_note.length or 0, round_message=True,
+        ))
+    elif message.audio:
+        attributes.append(raw.types.DocumentAttributeAudio(
+            duration=message.audio.duration or 0, performer=message.audio.performer, title=message.audio.title,
+        ))
+    elif message.voice:
+        attributes.append(raw.types.DocumentAttributeAudio(duration=message.voice.duration or 0, voice=True))
+    return raw.types.InputMediaUploadedDocument(
+        file=input_file,
+        mime_type=mime_type or "application/octet-stream",
+        attributes=attributes,
+        force_file=bool(message.document) or None,
+    )
+
+
+async def send_uploaded_media(client: Client, chat_id: int, media: raw.base.InputMedia,
+                              caption: str = "", caption_entities=None) -> types.Message:
+    """
+    Sends an already uploaded media to a chat and returns the parsed message.
+    """
+    text, entities = (await utils.parse_text_entities(client, caption or "", None, caption_entities)).values()
+    r = await client.invoke(
+        raw.functions.messages.SendMedia(
+            peer=await client.resolve_peer(chat_id),
+            media=media,
+            message=text or "",
+            random_id=client.rnd_id(),
+            entities=entities,
+        )
+    )
+    for i in r.updates:
+        if isinstance(i, (raw.types.UpdateNewMessage, raw.types.UpdateNewChannelMessage)):
+            return await types.Message._parse(
+                client, i.message,
+                {u.id: u for u in r.users},
+                {c.id: c for c in r.chats},
+            )
+    raise RuntimeError("Telegram didn't return the sent message")
+
+
+async def stream_reupload(message: types.Message, chat_id: int) -> types.Message:
+    """
+    Re-uploads a message's media to a chat without touching the disk.
+    Parts are read from the source with GetFile, REUPLOAD_FETCH_AHEAD requests at a time,
+    and handed straight to a PartUploader, so only a bounded window of parts is ever in memory.
+    """
+    from .custom_dl import get_streamer
+    client = message._client
+    streamer = get_streamer(0)
+    media = get_media_from_message(message)
+    file_id = FileId.decode(media.file_id)
+    file_size = getattr(media, "file_size", 0) or 0
+    file_name = get_name(message)
+    if not file_size:
+        raise ValueError("Can't stream a file of unknown size")
+
+    # counted only once the uploader runs, so a failed start can't leave the load behind
+    uploader = await PartUploader(client, file_size, file_name).start()
+    work_loads[0] += 1
+    pending: List[asyncio.Task] = []
+    try:
+        logger.info(f"Re-uploading {file_name} ({file_size} bytes) in {uploader.total_parts} parts")
+        offsets = iter(range(0, file_size, UPLOAD_PART_SIZE))
+        for offset in offsets:
+            pending.append(asyncio.create_task(streamer.fetch_chunk(file_id, offset, UPLOAD_PART_SIZE, cache=False)))
+            if len(pending) >= Var.REUPLOAD_FETCH_AHEAD:
+                break
+        while pending:
+            chunk = await pending.pop(0)
+            if not chunk:
+                raise ValueError("Source file ended early")
+            offset = next(offsets, None)
+            if offset is not None:
+                pending.append(asyncio.create_task(streamer.fetch_chunk(file_id, offset, UPLOAD_PART_SIZE, cache=False)))
+            await uploader.put_part(chunk)
+        input_file = await uploader.finish()
+    except BaseException:
+        for task in pending:
+            task.cancel()
+        await uploader.abort()
+        raise
+    finally:
+        work_loads[0] -= 1
+
+    input_media = build_input_media(message, input_file, file_name, getattr(media, "mime_type", None))
+    return await send_uploaded_media(client, chat_id, input_media, message.caption, message.caption_entities)
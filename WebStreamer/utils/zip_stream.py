@@ -0,0 +1,394 @@
+# This file is a part of TG-FileStreamBot
+# Coding : Jyothis Jayanth [@EverythingSuckz]
+
+import zlib
+import struct
+import asyncio
+import logging
+from collections import OrderedDict
+from typing import AsyncIterator, Callable, Dict, List, Optional
+from .media_index import RangeReader
+
+logger = logging.getLogger("zip_stream")
+
+EOCD_SIGNATURE = b"PK\x05\x06"
+ZIP64_EOCD_LOCATOR_SIGNATURE = b"PK\x06\x07"
+ZIP64_EOCD_SIGNATURE = b"PK\x06\x06"
+CENTRAL_HEADER_SIGNATURE = b"PK\x01\x02"
+LOCAL_HEADER_SIGNATURE = b"PK\x03\x04"
+EOCD_SIZE = 22
+# the EOCD is followed by a comment of at most 64 KiB
+EOCD_SEARCH_SIZE = EOCD_SIZE + 0xFFFF
+LOCAL_HEADER_SIZE = 30
+ZIP64_EXTRA_ID = 0x0001
+
+METHOD_STORED = 0
+METHOD_DEFLATED = 8
+FLAG_ENCRYPTED = 0x1
+FLAG_UTF8 = 0x800
+
+# parsed central directories kept in memory, by file unique_id
+DIRECTORY_CACHE_SIZE = 64
+
+ZIP64_VERSION = 45
+# a fixed timestamp (1980-01-01 00:00) keeps the archive byte-identical between requests, which Range needs
+DOS_TIME = 0
+DOS_DATE = (1 << 5) | 1
+FLAG_DATA_DESCRIPTOR = 0x8
+DATA_DESCRIPTOR_SIGNATURE = b"PK\x07\x08"
+DATA_DESCRIPTOR_SIZE = 24
+LOCAL_ZIP64_EXTRA_SIZE = 20
+CENTRAL_ZIP64_EXTRA_SIZE = 28
+END_RECORDS_SIZE = 56 + 20 + EOCD_SIZE
+
+# CRC-32s of bundled files kept by unique_id, so resumed bundle downloads don't re-read earlier members
+CRC_CACHE_SIZE = 10000
+
+
+class ZipError(Exception):
+    pass
+
+
+class ZipMember:
+    def __init__(self, name: str, method: int, flags: int, crc: int,
+                 compressed_size: int, file_size: int, header_offset: int):
+        """An entry of a ZIP central directory.
+        attributes:
+            data_offset: where the member's (compressed) bytes start in the archive;
+                only known once its local header was read, see ZipDirectory.data_offset.
+        """
+        self.name = name
+        self.method = method
+        self.flags = flags
+        self.crc = crc
+        self.compressed_size = compressed_size
+        self.file_size = file_size
+        self.header_offset = header_offset
+        self.data_offset: Optional[int] = None
+
+    @property
+    def is_dir(self) -> bool:
+        return self.name.endswith("/")
+
+    @property
+    def is_encrypted(self) -> bool:
+        return bool(self.flags & FLAG_ENCRYPTED)
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "size": self.file_size,
+            "compressed_size": self.compressed_size,
+            "method": {METHOD_STORED: "stored", METHOD_DEFLATED: "deflated"}.get(self.method, str(self.method)),
+            "crc32": f"{self.crc:08x}",
+            "is_dir": self.is_dir,
+        }
+
+
+class ZipDirectory:
+    def __init__(self, members: List[ZipMember]):
+        self.members = members
+        self.by_name = {member.name: member for member in members}
+
+    async def data_offset(self, reader: RangeReader, member: ZipMember) -> int:
+        """
+        Reads the member's local header once to find where its data starts;
+        its name and extra field lengths may differ from the central directory's.
+        """
+        if member.data_offset is None:
+            header = await reader.read(member.header_offset, LOCAL_HEADER_SIZE)
+            if len(header) < LOCAL_HEADER_SIZE or header[:4] != LOCAL_HEADER_SIGNATURE:
+                raise ZipError(f"Bad local header for {member.name}")
+            name_length, extra_length = struct.unpack("<HH", header[26:30])
+            member.data_offset = member.header_offset + LOCAL_HEADER_SIZE + name_length + extra_length
+        return member.data_offset
+
+
+def _parse_zip64_extra(extra: bytes, file_size: int, compressed_size: int, header_offset: int):
+    pos = 0
+    while pos + 4 <= len(extra):
+        header_id, size = struct.unpack("<HH", extra[pos:pos + 4])
+        data = extra[pos + 4:pos + 4 + size]
+        if header_id == ZIP64_EXTRA_ID:
+            values = iter(struct.unpack(f"<{len(data) // 8}Q", data[:len(data) // 8 * 8]))
+            if file_size == 0xFFFFFFFF:
+                file_size = next(values, file_size)
+            if compressed_size == 0xFFFFFFFF:
+                compressed_size = next(values, compressed_size)
+            if header_offset == 0xFFFFFFFF:
+                header_offset = next(values, header_offset)
+            break
+        pos += 4 + size
+    return file_size, compressed_size, header_offset
+
+
+def parse_central_directory(data: bytes) -> List[ZipMember]:
+    members = []
+    pos = 0
+    while pos + 46 <= len(data) and data[pos:pos + 4] == CENTRAL_HEADER_SIGNATURE:
+        (flags, method, crc, compressed_size, file_size, name_length, extra_length,
+         comment_length, header_offset) = struct.unpack("<8xHH4xIIIHHH8xI", data[pos:pos + 46])
+        name = data[pos + 46:pos + 46 + name_length]
+        extra = data[pos + 46 + name_length:pos + 46 + name_length + extra_length]
+        file_size, compressed_size, header_offset = _parse_zip64_extra(extra, file_size, compressed_size, header_offset)
+        members.append(ZipMember(
+            name.decode("utf-8" if flags & FLAG_UTF8 else "cp437", errors="replace"),
+            method, flags, crc, compressed_size, file_size, header_offset,
+        ))
+        pos += 46 + name_length + extra_length + comment_length
+    return members
+
+
+async def read_directory(reader: RangeReader) -> ZipDirectory:
+    """
+    Reads a ZIP's central directory with range reads from the end of the file:
+    the tail holding the end-of-central-directory record first, then the directory itself.
+    """
+    tail_offset = max(0, reader.file_size - EOCD_SEARCH_SIZE)
+    tail = await reader.read(tail_offset, reader.file_size - tail_offset)
+    eocd = tail.rfind(EOCD_SIGNATURE)
+    if eocd < 0 or len(tail) - eocd < EOCD_SIZE:
+        raise ZipError("Not a ZIP archive")
+    entries, cd_size, cd_offset = struct.unpack("<10xHII", tail[eocd:eocd + 20])
+    if entries == 0xFFFF or cd_size == 0xFFFFFFFF or cd_offset == 0xFFFFFFFF:
+        locator = eocd - 20
+        if locator < 0 or tail[locator:locator + 4] != ZIP64_EOCD_LOCATOR_SIGNATURE:
+            raise ZipError("Missing ZIP64 end of central directory locator")
+        zip64_offset = struct.unpack("<Q", tail[locator + 8:locator + 16])[0]
+        record = await reader.read(zip64_offset, 56)
+        if record[:4] != ZIP64_EOCD_SIGNATURE:
+            raise ZipError("Bad ZIP64 end of central directory record")
+        cd_size, cd_offset = struct.unpack("<QQ", record[40:56])
+    if cd_offset + cd_size > reader.file_size:
+        raise ZipError("Central directory lies outside the file")
+    if cd_offset >= tail_offset:
+        data = tail[cd_offset - tail_offset:cd_offset - tail_offset + cd_size]
+    else:
+        data = await reader.read(cd_offset, cd_size)
+    return ZipDirectory(parse_central_directory(data))
+
+
+async def inflate(stream: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """
+    Decompresses a raw deflate stream as its compressed bytes arrive.
+    """
+    decompressor = zlib.decompressobj(-zlib.MAX_WBITS)
+    async for chunk in stream:
+        data = decompressor.decompress(chunk)
+        if data:
+            yield data
+    data = decompressor.flush()
+    if data:
+        yield data
+
+
+class DirectoryCache:
+    def __init__(self, size: int):
+        """Keeps the parsed central directories of the most recently used archives."""
+        self.size = size
+        self.directories: "OrderedDict[str, ZipDirectory]" = OrderedDict()
+
+    def get(self, unique_id: str) -> Optional[ZipDirectory]:
+        directory = self.directories.get(unique_id)
+        if directory is not None:
+            self.directories.move_to_end(unique_id)
+        return directory
+
+    def put(self, unique_id: str, directory: ZipDirectory) -> None:
+        self.directories[unique_id] = directory
+        self.directories.move_to_end(unique_id)
+        while len(self.directories) > self.size:
+            self.directories.popitem(last=False)
+
+
+
+class BundleEntry:
+    def __init__(self, name: str, size: int, key: str,
+                 open_range: Callable[[int, int], AsyncIterator[bytes]]):
+        """A file going into a ZipBundle.
+        attributes:
+            key: identifies the file's content, for the CRC cache.
+            open_range: returns the file's bytes first..last (inclusive) as an async iterator.
+        """
+        self.name = name
+        self.encoded_name = name.encode("utf-8")
+        self.size = size
+        self.key = key
+        self.open_range = open_range
+        self.header_offset = 0
+        self.data_offset = 0
+
+    @property
+    def crc(self) -> Optional[int]:
+        if self.size == 0:
+            return 0
+        return crc_cache.get(self.key)
+
+    def remember_crc(self, crc: int) -> None:
+        crc_cache[self.key] = crc
+        crc_cache.move_to_end(self.key)
+        while len(crc_cache) > CRC_CACHE_SIZE:
+            crc_cache.popitem(last=False)
+
+
+class ZipBundle:
+    def __init__(self, entries: List[BundleEntry]):
+        """A store-mode ZIP64 archive of several files, streamed without staging them anywhere.
+        attributes:
+            entries: the files, in archive order.
+            size: the exact size of the archive, known before a single byte is read.
+
+        functions:
+            stream: produces bytes from_bytes..until_bytes of the archive.
+
+        Members are stored uncompressed with their sizes in ZIP64 extra fields, so every offset
+        follows from the file sizes alone. CRC-32s aren't known up front; they go in a data
+        descriptor after each member and in the central directory, computed while the member
+        streams past (or read from the CRC cache when a resumed download skips it). A range
+        that would need the CRC of a member it doesn't fully cover, and that isn't cached,
+        is served as the whole archive instead, see needs_skipped_crcs.
+        """
+        self.entries = entries
+        offset = 0
+        for entry in entries:
+            entry.header_offset = offset
+            entry.data_offset = offset + LOCAL_HEADER_SIZE + len(entry.encoded_name) + LOCAL_ZIP64_EXTRA_SIZE
+            offset = entry.data_offset + entry.size + DATA_DESCRIPTOR_SIZE
+        self.central_offset = offset
+        self.central_size = sum(46 + len(entry.encoded_name) + CENTRAL_ZIP64_EXTRA_SIZE for entry in entries)
+        self.size = self.central_offset + self.central_size + END_RECORDS_SIZE
+
+    @staticmethod
+    def local_header(entry: BundleEntry) -> bytes:
+        return struct.pack(
+            "<4sHHHHHIIIHH", LOCAL_HEADER_SIGNATURE, ZIP64_VERSION, FLAG_DATA_DESCRIPTOR | FLAG_UTF8,
+            METHOD_STORED, DOS_TIME, DOS_DATE, 0, 0xFFFFFFFF, 0xFFFFFFFF,
+            len(entry.encoded_name), LOCAL_ZIP64_EXTRA_SIZE,
+        ) + entry.encoded_name + struct.pack("<HHQQ", ZIP64_EXTRA_ID, 16, entry.size, entry.size)
+
+    @staticmethod
+    def data_descriptor(entry: BundleEntry, crc: int) -> bytes:
+        return struct.pack("<4sIQQ", DATA_DESCRIPTOR_SIGNATURE, crc, entry.size, entry.size)
+
+    def central_directory(self, crcs: List[int]) -> bytes:
+        records = []
+        for entry, crc in zip(self.entries, crcs):
+            records.append(struct.pack(
+                "<4sHHHHHHIIIHHHHHII", CENTRAL_HEADER_SIGNATURE, ZIP64_VERSION, ZIP64_VERSION,
+                FLAG_DATA_DESCRIPTOR | FLAG_UTF8, METHOD_STORED, DOS_TIME, DOS_DATE, crc,
+                0xFFFFFFFF, 0xFFFFFFFF, len(entry.encoded_name), CENTRAL_ZIP64_EXTRA_SIZE, 0, 0, 0, 0, 0xFFFFFFFF,
+            ))
+            records.append(entry.encoded_name)
+            records.append(struct.pack("<HHQQQ", ZIP64_EXTRA_ID, 24, entry.size, entry.size, entry.header_offset))
+        return b"".join(records)
+
+    def end_records(self) -> bytes:
+        count = len(self.entries)
+        zip64_end_offset = self.central_offset + self.central_size
+        return (
+            struct.pack("<4sQHHIIQQQQ", ZIP64_EOCD_SIGNATURE, 44, ZIP64_VERSION, ZIP64_VERSION, 0, 0,
+                        count, count, self.central_size, self.central_offset)
+            + struct.pack("<4sIQI", ZIP64_EOCD_LOCATOR_SIGNATURE, 0, zip64_end_offset, 1)
+            + struct.pack("<4sHHHHIIH", EOCD_SIGNATURE, 0, 0, 0xFFFF, 0xFFFF, 0xFFFFFFFF, 0xFFFFFFFF, 0)
+        )
+
+    async def crc_of(self, entry: BundleEntry) -> int:
+        """
+        Returns a member's CRC-32, reading the whole member if it isn't cached.
+        """
+        crc = entry.crc
+        if crc is None:
+            crc = 0
+            async for chunk in entry.open_range(0, entry.size - 1):
+                crc = zlib.crc32(chunk, crc)
+            entry.remember_crc(crc)
+        return crc
+
+    def needs_skipped_crcs(self, from_bytes: int, until_bytes: int) -> bool:
+        """
+        Whether sending from_bytes..until_bytes takes the CRC-32 of a member whose data starts
+        before the range, fully or partly skipped, and that isn't cached: its data descriptor
+        and the central directory carry the CRC, and computing it means downloading the whole
+        member again in the middle of the response.
+        """
+        reaches_central = until_bytes >= self.central_offset
+        for entry in self.entries:
+            if entry.crc is not None or entry.data_offset >= from_bytes:
+                continue
+            descriptor_offset = entry.data_offset + entry.size
+            if reaches_central or (descriptor_offset <= until_bytes
+                                   and descriptor_offset + DATA_DESCRIPTOR_SIZE > from_bytes):
+                return True
+        return False
+
+    async def stream(self, from_bytes: int, until_bytes: int) -> AsyncIterator[bytes]:
+        """
+        Yields bytes from_bytes..until_bytes (inclusive) of the archive.
+        While one member is being sent, the next one's first chunks are already being fetched.
+        """
+        segments = []
+        for entry in self.entries:
+            segments.append((entry.header_offset, entry.data_offset - entry.header_offset, "header", entry))
+            segments.append((entry.data_offset, entry.size, "data", entry))
+            segments.append((entry.data_offset + entry.size, DATA_DESCRIPTOR_SIZE, "descriptor", entry))
+        segments.append((self.central_offset, self.central_size + END_RECORDS_SIZE, "central", None))
+        # (first, last) byte of each member's data that falls inside the requested range
+        wanted = {}
+        for start, length, kind, entry in segments:
+            if kind == "data" and length and start + length - 1 >= from_bytes and start <= until_bytes:
+                wanted[id(entry)] = (max(from_bytes, start) - start, min(until_bytes, start + length - 1) - start)
+        data_entries = [entry for entry in self.entries if id(entry) in wanted]
+
+        prefetched: Dict[int, tuple] = {}
+
+        def prefetch(entry: BundleEntry) -> None:
+            iterator = entry.open_range(*wanted[id(entry)]).__aiter__()
+            prefetched[id(entry)] = (iterator, asyncio.ensure_future(iterator.__anext__()))
+
+        try:
+            for start, length, kind, entry in segments:
+                end = start + length - 1
+                if length == 0 or end < from_bytes:
+                    continue
+                if start > until_bytes:
+                    break
+                first, last = max(from_bytes, start) - start, min(until_bytes, end) - start
+                if kind == "header":
+                    yield self.local_header(entry)[first:last + 1]
+                elif kind == "descriptor":
+                    yield self.data_descriptor(entry, await self.crc_of(entry))[first:last + 1]
+                elif kind == "central":
+                    crcs = [await self.crc_of(e) for e in self.entries]
+                    yield (self.central_directory(crcs) + self.end_records())[first:last + 1]
+                else:
+                    if id(entry) not in prefetched:
+                        prefetch(entry)
+                    position = data_entries.index(entry)
+                    if position + 1 < len(data_entries):
+                        prefetch(data_entries[position + 1])
+                    iterator, head = prefetched.pop(id(entry))
+                    whole = (first, last) == (0, entry.size - 1)
+                    crc = 0
+                    try:
+                        chunk = await head
+                        while True:
+                            if whole:
+                                crc = zlib.crc32(chunk, crc)
+                            yield chunk
+                            chunk = await iterator.__anext__()
+                    except StopAsyncIteration:
+                        pass
+                    finally:
+                        await iterator.aclose()
+                    if whole:
+                        entry.remember_crc(crc)
+        finally:
+            for iterator, head in prefetched.values():
+                if not head.done():
+                    head.cancel()
+                elif not head.cancelled() and head.exception() is None:
+                    await iterator.aclose()
+
+
+directory_cache = DirectoryCache(DIRECTORY_CACHE_SIZE)
+crc_cache: "OrderedDict[str, int]" = OrderedDict()
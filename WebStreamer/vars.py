@@ -50,4 +50,76 @@ class Var(object):
     CLOUDEREVE_ACCESS_TOKEN = None
     CLOUDEREVE_DOWNLOAD_PATH = str(environ.get("CLOUDEREVE_DOWNLOAD_PATH", ""))
     if USE_CLOUDEREVE and not CLOUDEREVE_DOWNLOAD_PATH:
-        sys.exit("Cloudreve download path is not set")
\ No newline at end of file
+        sys.exit("Cloudreve download path is not set")
+
+    # 集群模式：按文件 unique_id 一致性哈希分片到各节点
+    CLUSTER_PEERS = [x for x in str(environ.get("CLUSTER_PEERS", "") or "").split(",") if x.strip()]
+    CLUSTER_SELF = str(environ.get("CLUSTER_SELF", "") or "")
+    CLUSTER_MODE = str(environ.get("CLUSTER_MODE", "proxy")).lower()
+    if CLUSTER_MODE not in ("proxy", "redirect"):
+        sys.exit("CLUSTER_MODE should be either proxy or redirect")
+    CLUSTER_VNODES = int(environ.get("CLUSTER_VNODES", "100"))
+
+    # 客户端健康检查与熔断
+    HEALTH_CHECK_INTERVAL = int(environ.get("HEALTH_CHECK_INTERVAL", "60"))
+    HEALTH_CHECK_TIMEOUT = int(environ.get("HEALTH_CHECK_TIMEOUT", "10"))
+    BREAKER_FAILURE_THRESHOLD = int(environ.get("BREAKER_FAILURE_THRESHOLD", "3"))
+    BREAKER_RESET_TIMEOUT = int(environ.get("BREAKER_RESET_TIMEOUT", "30"))
+
+    # 管理接口与机器人所有者
+    ADMIN_TOKEN = str(environ.get("ADMIN_TOKEN", "") or "")
+    OWNER_ID = [x.strip("@ ") for x in str(environ.get("OWNER_ID", "") or "").split(",") if x.strip("@ ")]
+
+    # 本地数据目录（索引、缓存等）
+    DATA_DIR = str(environ.get("DATA_DIR", "data"))
+    DEDUP_UPLOADS = str(environ.get("DEDUP_UPLOADS", "1").lower()) in ("1", "true", "t", "yes", "y")
+
+    # 批量生成直链
+    BATCH_MAX = int(environ.get("BATCH_MAX", "1000"))
+    BATCH_CONCURRENCY = int(environ.get("BATCH_CONCURRENCY", "4"))
+
+    # 流式上传：不落盘的边下边传
+    UPLOAD_WORKERS = int(environ.get("UPLOAD_WORKERS", "4"))
+    UPLOAD_BUFFER_PARTS = int(environ.get("UPLOAD_BUFFER_PARTS", "8"))
+    REUPLOAD_FETCH_AHEAD = int(environ.get("REUPLOAD_FETCH_AHEAD", "4"))
+
+    # HTTP 上传接口，未设置 UPLOAD_TOKEN 时沿用 ADMIN_TOKEN
+    UPLOAD_TOKEN = str(environ.get("UPLOAD_TOKEN", "") or ADMIN_TOKEN)
+    UPLOAD_MAX_SIZE = int(environ.get("UPLOAD_MAX_SIZE", str(2000 * 1024 * 1024)))
+
+    # 分片缓存与生成直链后的预热
+    CHUNK_CACHE_SIZE = int(environ.get("CHUNK_CACHE_SIZE", "256"))
+    PREFETCH_ON_LINK = str(environ.get("PREFETCH_ON_LINK", "1").lower()) in ("1", "true", "t", "yes", "y")
+
+    # 按码率控制预读：音视频预读若干秒的播放量，其它文件按上限全速预读
+    # 默认 8 秒 × 1MB 分片：码率低于约 8 Mbit/s 的视频预读少于 READAHEAD_MAX_PARTS 个分片
+    READAHEAD_SECONDS = int(environ.get("READAHEAD_SECONDS", "8"))
+    READAHEAD_MAX_PARTS = int(environ.get("READAHEAD_MAX_PARTS", "8"))
+
+    # MP4 moov / MKV Cues 索引区缓存（MB）
+    MEDIA_INDEX_SIZE = int(environ.get("MEDIA_INDEX_SIZE", "1024"))
+    MEDIA_INDEX_MAX_REGION = int(environ.get("MEDIA_INDEX_MAX_REGION", "64"))
+
+    # 缩略图：磁盘缓存大小（MB）与渲染进程数（需要安装 Pillow）
+    THUMB_CACHE_SIZE = int(environ.get("THUMB_CACHE_SIZE", "512"))
+    THUMB_WORKERS = int(environ.get("THUMB_WORKERS", "2"))
+
+    # 只读 WebDAV，两者都设置后开启
+    WEBDAV_USERNAME = str(environ.get("WEBDAV_USERNAME", ""))
+    WEBDAV_PASSWORD = str(environ.get("WEBDAV_PASSWORD", ""))
+
+    # 文件搜索接口，未设置 SEARCH_TOKEN 时沿用 ADMIN_TOKEN
+    SEARCH_TOKEN = str(environ.get("SEARCH_TOKEN", "") or ADMIN_TOKEN)
+
+    # 热门文件转由 Cloudreve 提供：已保存到云盘且播放次数达到阈值的文件直接 302 跳转
+    CLOUDREVE_TIERING = USE_CLOUDEREVE and str(environ.get("CLOUDREVE_TIERING", "0").lower()) in ("1", "true", "t", "yes", "y")
+    CLOUDREVE_TIER_MIN_REQUESTS = int(environ.get("CLOUDREVE_TIER_MIN_REQUESTS", "3"))
+
+    # 保存到云盘时由机器人直接上传文件，而不是让 Cloudreve 拉取直链
+    CLOUDREVE_PUSH = USE_CLOUDEREVE and str(environ.get("CLOUDREVE_PUSH", "0").lower()) in ("1", "true", "t", "yes", "y")
+    CLOUDREVE_PUSH_WORKERS = int(environ.get("CLOUDREVE_PUSH_WORKERS", "3"))
+
+    # 机器人发消息的限速：全局每秒、私聊每秒、群组与频道每分钟的条数（BIN_CHANNEL 只受全局限速，遇到洪水等待再退避）
+    OUTBOX_GLOBAL_RATE = max(1.0, float(environ.get("OUTBOX_GLOBAL_RATE", "25")))
+    OUTBOX_CHAT_RATE = max(0.1, float(environ.get("OUTBOX_CHAT_RATE", "1")))
+    OUTBOX_GROUP_RATE = max(1.0, float(environ.get("OUTBOX_GROUP_RATE", "20")))